@@ -0,0 +1,69 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Benchmarks converting large histograms into records.
+
+Usage::
+
+    python benchmarks/bench_histogram.py [--days DAYS] [--terms TERMS]
+
+This builds a synthetic ``_histogram.date`` payload with a bucket per day where
+each bucket has a random subset of terms from a high-cardinality field.
+
+"""
+
+import argparse
+import datetime
+import random
+import timeit
+
+from crashstats_tools.cmd_supersearchfacet import convert_histogram_data
+
+
+def build_histogram(days, terms, terms_per_day, seed=0):
+    rng = random.Random(seed)
+    all_terms = [f"signature {i}" for i in range(terms)]
+    start = datetime.date(2024, 1, 1)
+
+    facet_data = []
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        buckets = [
+            {"term": term, "count": rng.randint(1, 1000)}
+            for term in rng.sample(all_terms, terms_per_day)
+        ]
+        facet_data.append(
+            {
+                "term": f"{date.isoformat()}T00:00:00+00:00",
+                "count": sum(bucket["count"] for bucket in buckets),
+                "facets": {"signature": buckets},
+            }
+        )
+    return facet_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--terms", type=int, default=5000)
+    parser.add_argument("--terms-per-day", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    facet_data = build_histogram(args.days, args.terms, args.terms_per_day)
+    timings = timeit.repeat(
+        lambda: convert_histogram_data("histogram_date", facet_data),
+        number=1,
+        repeat=args.repeat,
+    )
+    print(
+        f"convert_histogram_data: {args.days} days, {args.terms} terms, "
+        + f"{args.terms_per_day} terms per day"
+    )
+    print(f"best: {min(timings):.3f}s  mean: {sum(timings) / len(timings):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
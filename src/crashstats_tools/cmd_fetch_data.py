@@ -2,33 +2,296 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import datetime
 from datetime import timedelta
 from functools import partial
+from itertools import chain
 import json
-from multiprocessing import Pool
 import os
-import sys
+import threading
 import time
+from urllib.parse import parse_qs, urlparse
 
 import click
 from dotenv import load_dotenv
+from more_itertools import chunked
 from rich.console import Console
 
 from crashstats_tools.libcrashstats import (
     get_crash_annotations,
     get_dump,
     get_processed_crash,
+    supersearch,
+    supersearch_crash_ids,
 )
 from crashstats_tools.utils import (
+    CrashIdSet,
     DEFAULT_HOST,
+    imap_bounded,
+    in_shard,
+    InvalidArg,
+    iter_lines,
+    Journal,
     JsonDTEncoder,
     parse_crash_id,
+    parse_shard,
+    parse_size,
+    parse_supersearch_options,
+    retried_statuses,
+    session_with_retries,
+    sort_in_windows,
+    TokenBucket,
+    write_atomically,
 )
+from crashstats_tools.workqueue import WorkQueue
 
 
-def create_dir_if_needed(d):
-    if not os.path.exists(d):
-        os.makedirs(d)
+# Number of crash ids to fetch processed crash fields for with a single Super
+# Search request; each crash id adds about 40 bytes to the url
+FIELDS_BATCH_SIZE = 100
+
+# Number of crash ids that can be waiting on dump downloads with
+# --max-dump-workers before fetch workers stop getting new crash ids
+MAX_WAITING_FOR_DUMPS = 1000
+
+
+class DirectorySyncer:
+    """Batches fsyncs of the directories files were renamed into
+
+    Renames aren't durable until the directory holding the new entry is
+    fsynced. Rather than fsync a directory for every file, this fsyncs all the
+    directories touched once every ``every`` files.
+
+    :arg every: number of files between directory fsyncs; 0 disables fsyncing
+
+    """
+
+    def __init__(self, every):
+        self.every = every
+        self.count = 0
+        self.dirty = set()
+
+    def add(self, paths):
+        if not self.every:
+            return
+
+        for fn in paths:
+            dirname = os.path.dirname(fn)
+            # Add the parent, too, in case the directory was just created
+            self.dirty.add(dirname)
+            self.dirty.add(os.path.dirname(dirname))
+            self.count += 1
+
+        if self.count >= self.every:
+            self.sync()
+
+    def sync(self):
+        for dirname in sorted(self.dirty):
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.dirty = set()
+        self.count = 0
+
+
+def endpoint_name(url):
+    """Returns a short name for the API endpoint a url is for
+
+    RawCrash is split into "RawCrash meta" and "RawCrash raw" because fetching
+    annotations and fetching dumps behave very differently.
+
+    """
+    parsed = urlparse(url)
+    name = parsed.path.strip("/").split("/")[-1]
+    if name == "RawCrash":
+        fmt = parse_qs(parsed.query).get("format", ["meta"])[0]
+        name = f"{name} {fmt}"
+    return name
+
+
+def percentile(sorted_values, pct):
+    """Returns the nearest-rank percentile of an already-sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    index = min(
+        len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1)))
+    )
+    return sorted_values[index]
+
+
+def format_bytes(num):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024 or unit == "GB":
+            return f"{num:,.1f} {unit}"
+        num /= 1024
+
+
+class FetchStats:
+    """Collects throughput and latency statistics for a fetch-data run
+
+    ``record_response`` is a requests response hook, so it sees every HTTP
+    request workers make no matter which API function made it. It gets called
+    from worker threads, so everything is guarded by a lock.
+
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+        # endpoint -> array of latencies in seconds
+        self.latencies = {}
+        self.crash_ids = 0
+        self.skipped_exists = 0
+        self.skipped_journal = 0
+        self.skipped_duplicates = 0
+
+    def record_response(self, resp, *args, **kwargs):
+        if kwargs.get("stream"):
+            # The caller reads the body in chunks and counts them with
+            # record_bytes, so latency is only the time to the headers
+            size = 0
+            latency = resp.elapsed.total_seconds()
+        else:
+            # Read the body here so latency includes downloading it; requests
+            # would read it right after this hook anyway
+            read_start = time.perf_counter()
+            size = len(resp.content)
+            latency = resp.elapsed.total_seconds() + (time.perf_counter() - read_start)
+
+        statuses = retried_statuses(resp) + [resp.status_code]
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+            self.retries += len(statuses) - 1
+            self.throttled += statuses.count(429)
+            if resp.status_code >= 400:
+                self.errors += 1
+            self.latencies.setdefault(endpoint_name(resp.url), array("d")).append(
+                latency
+            )
+        return resp
+
+    def record_bytes(self, size):
+        with self.lock:
+            self.bytes += size
+
+    def record_result(self, result):
+        with self.lock:
+            self.crash_ids += 1
+            self.skipped_exists += len(result.get("skipped", []))
+
+    def progress_line(self):
+        """Returns a single line of live statistics"""
+        with self.lock:
+            elapsed = max(time.time() - self.start_time, 0.001)
+            return (
+                f"{self.requests / elapsed:,.1f} req/s, "
+                + f"{format_bytes(self.bytes / elapsed)}/s, "
+                + f"retries: {self.retries:,}, 429s: {self.throttled:,}"
+            )
+
+    def summary(self):
+        """Returns statistics for the run as a dict"""
+        with self.lock:
+            elapsed = max(time.time() - self.start_time, 0.001)
+            endpoints = {}
+            for name, latencies in sorted(self.latencies.items()):
+                values = sorted(latencies)
+                endpoints[name] = {
+                    "count": len(values),
+                    **{
+                        f"p{pct}": round(percentile(values, pct), 4)
+                        for pct in self.PERCENTILES
+                    },
+                    "max": round(values[-1], 4),
+                }
+
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "crash_ids": self.crash_ids,
+                "requests": self.requests,
+                "requests_per_second": round(self.requests / elapsed, 3),
+                "bytes": self.bytes,
+                "bytes_per_second": round(self.bytes / elapsed, 3),
+                "retries": self.retries,
+                "http_429s": self.throttled,
+                "errors": self.errors,
+                "skipped_exists": self.skipped_exists,
+                "skipped_journal": self.skipped_journal,
+                "skipped_duplicates": self.skipped_duplicates,
+                "endpoints": endpoints,
+            }
+
+    def print_summary(self, console):
+        summary = self.summary()
+        console.print(
+            f"Crash ids: {summary['crash_ids']:,}, "
+            + f"requests: {summary['requests']:,} "
+            + f"({summary['requests_per_second']:,.1f}/s), "
+            + f"downloaded: {format_bytes(summary['bytes'])} "
+            + f"({format_bytes(summary['bytes_per_second'])}/s)"
+        )
+        console.print(
+            f"Retries: {summary['retries']:,}, 429s: {summary['http_429s']:,}, "
+            + f"errors: {summary['errors']:,}"
+        )
+        console.print(
+            f"Skipped: {summary['skipped_exists']:,} already existed, "
+            + f"{summary['skipped_journal']:,} completed in journal, "
+            + f"{summary['skipped_duplicates']:,} duplicates"
+        )
+        for name, data in summary["endpoints"].items():
+            percentiles = ", ".join(
+                f"p{pct}: {data[f'p{pct}']:.3f}s" for pct in self.PERCENTILES
+            )
+            console.print(
+                f"{name}: {data['count']:,} requests, {percentiles}, "
+                + f"max: {data['max']:.3f}s"
+            )
+
+
+class BandwidthLimiter:
+    """Limits bytes per second downloaded across all workers
+
+    Dumps are read in chunks and ``record_chunk`` debits each chunk from a
+    shared token bucket and waits for the bucket to be out of debt before the
+    next chunk is read. That keeps dump downloads under the limit while they're
+    downloading rather than after.
+
+    ``record_response`` is a requests response hook. Other responses are
+    debited from the bucket, too, but never wait, so big dumps absorb the
+    throttling and small metadata requests aren't starved.
+
+    :arg max_bandwidth: maximum bytes per second
+
+    """
+
+    def __init__(self, max_bandwidth):
+        self.bucket = TokenBucket(rate=max_bandwidth)
+
+    def record_response(self, resp, *args, **kwargs):
+        # Streamed responses are debited by record_chunk as they're read
+        if not kwargs.get("stream"):
+            self.bucket.consume(len(resp.content), wait=False)
+        return resp
+
+    def record_chunk(self, size):
+        self.bucket.consume(size)
+
+
+def serialize_json(data, **kwargs):
+    return json.dumps(data, cls=JsonDTEncoder, **kwargs).encode("utf-8")
 
 
 def fetch_crash(
@@ -42,11 +305,36 @@ def fetch_crash(
     overwrite,
     stats,
     outputdir,
+    fsync=False,
+    skip=(),
+    session=None,
+    dump_executor=None,
+    dump_chunk_callback=None,
 ):
     """Fetch crash data and save to correct place on the file system
 
     https://antenna.readthedocs.io/en/latest/overview.html#aws-s3-file-hierarchy
 
+    :arg skip: artifacts ("raw_crash", "dumps", "processed_crash") that are
+        already complete and shouldn't be fetched
+
+    :arg session: requests Session to use for HTTP requests
+
+    :arg dump_executor: executor to download dumps in; None to download them
+        in this thread
+
+        When this is set, dump downloads are submitted to it and this returns
+        without waiting for them. The result has a "dump_futures" list and
+        "dumps" isn't in "completed". Use ``wait_for_dumps`` to finish the
+        result when the dumps are downloaded.
+
+    :arg dump_chunk_callback: function called with the size of each chunk of a
+        dump as it's read; None to download dumps in one go
+
+    :returns: dict with "crash_id", "completed" list of artifacts that are now
+        complete, "written" list of paths of files that were written, and
+        "skipped" list of paths that already existed
+
     """
     if not color:
         console = Console(color_system=None)
@@ -57,31 +345,47 @@ def fetch_crash(
         crash_id = parse_crash_id(crash_id).strip()
     except ValueError:
         console.print(f"[yellow]{crash_id}: not a valid crash id[/yellow]")
-        return
+        return {"crash_id": None, "completed": [], "written": [], "skipped": []}
+
+    completed = []
+    written = []
+    skipped = []
+    dump_futures = []
 
     if fetchraw:
         # Fetch raw crash metadata to OUTPUTDIR/raw_crash/DATE/CRASHID
         fn = os.path.join(outputdir, "raw_crash", "20" + crash_id[-6:], crash_id)
-        if os.path.exists(fn) and not overwrite:
-            if not stats:
-                console.print(f"{crash_id}: fetching raw crash -- already exists")
+        if "raw_crash" in skip or (os.path.exists(fn) and not overwrite):
+            if "raw_crash" not in skip:
+                skipped.append(fn)
+                if not stats:
+                    console.print(f"{crash_id}: fetching raw crash -- already exists")
+            if fetchdumps and "dumps" not in skip:
+                # Writes are atomic, so an existing raw crash is complete
+                with open(fn) as fp:
+                    raw_crash = json.load(fp)
         else:
             if not stats:
                 console.print(f"{crash_id}: fetching raw crash")
-            raw_crash = get_crash_annotations(crash_id, host=host, api_token=api_token)
+            raw_crash = get_crash_annotations(
+                crash_id, host=host, api_token=api_token, session=session
+            )
 
             # Save raw crash to file system
-            create_dir_if_needed(os.path.dirname(fn))
-            with open(fn, "w") as fp:
-                json.dump(raw_crash, fp, cls=JsonDTEncoder, indent=2, sort_keys=True)
+            write_atomically(
+                fn, serialize_json(raw_crash, indent=2, sort_keys=True), fsync=fsync
+            )
+            written.append(fn)
+
+        if "raw_crash" not in skip:
+            completed.append("raw_crash")
 
-        if fetchdumps:
+        if fetchdumps and "dumps" not in skip:
             # Save dump_names to file system
             dump_names = raw_crash.get("metadata", {}).get("dump_checksums", {}).keys()
             fn = os.path.join(outputdir, "dump_names", crash_id)
-            create_dir_if_needed(os.path.dirname(fn))
-            with open(fn, "w") as fp:
-                json.dump(list(dump_names), fp)
+            write_atomically(fn, serialize_json(list(dump_names)), fsync=fsync)
+            written.append(fn)
 
             # Fetch dumps
             for dump_name in dump_names:
@@ -93,6 +397,7 @@ def fetch_crash(
 
                 fn = os.path.join(outputdir, dump_name, crash_id)
                 if os.path.exists(fn) and not overwrite:
+                    skipped.append(fn)
                     if not stats:
                         console.print(
                             f"{crash_id}: fetching dump: {dump_name} -- already exists"
@@ -100,45 +405,374 @@ def fetch_crash(
                 else:
                     if not stats:
                         console.print(f"{crash_id}: fetching dump: {dump_name}")
-                    dump_content = get_dump(
-                        crash_id, dump_name=file_name, api_token=api_token, host=host
+                    fetch_dump = partial(
+                        save_dump,
+                        crash_id,
+                        dump_name=file_name,
+                        fn=fn,
+                        api_token=api_token,
+                        host=host,
+                        session=session,
+                        fsync=fsync,
+                        chunk_callback=dump_chunk_callback,
                     )
-                    create_dir_if_needed(os.path.dirname(fn))
-                    with open(fn, "wb") as fp:
-                        fp.write(dump_content)
+                    if dump_executor:
+                        dump_futures.append(dump_executor.submit(fetch_dump))
+                    else:
+                        written.append(fetch_dump())
 
-    if fetchprocessed:
+            if not dump_futures:
+                completed.append("dumps")
+
+    if fetchprocessed and "processed_crash" not in skip:
         # Fetch processed crash data
         fn = os.path.join(outputdir, "processed_crash", crash_id)
         if os.path.exists(fn) and not overwrite:
+            skipped.append(fn)
             if not stats:
                 console.print(f"{crash_id}: fetching processed crash -- already exists")
         else:
             if not stats:
                 console.print(f"{crash_id}: fetching processed crash")
             processed_crash = get_processed_crash(
-                crash_id, api_token=api_token, host=host
+                crash_id, api_token=api_token, host=host, session=session
             )
 
             # Save processed crash to file system
-            create_dir_if_needed(os.path.dirname(fn))
-            with open(fn, "w") as fp:
-                json.dump(
-                    processed_crash, fp, cls=JsonDTEncoder, indent=2, sort_keys=True
+            write_atomically(
+                fn,
+                serialize_json(processed_crash, indent=2, sort_keys=True),
+                fsync=fsync,
+            )
+            written.append(fn)
+
+        completed.append("processed_crash")
+
+    result = {
+        "crash_id": crash_id,
+        "completed": completed,
+        "written": written,
+        "skipped": skipped,
+    }
+    if dump_futures:
+        result["dump_futures"] = dump_futures
+    return result
+
+
+def save_dump(crash_id, dump_name, fn, api_token, host, session, fsync, chunk_callback):
+    """Downloads a dump and writes it to fn
+
+    :returns: fn
+
+    """
+    dump_content = get_dump(
+        crash_id,
+        dump_name=dump_name,
+        api_token=api_token,
+        host=host,
+        session=session,
+        chunk_callback=chunk_callback,
+    )
+    write_atomically(fn, dump_content, fsync=fsync)
+    return fn
+
+
+def wait_for_dumps(results, max_waiting, catch_errors=False):
+    """Yields results once the dumps they're waiting on are downloaded
+
+    With ``dump_executor``, ``fetch_crash`` returns without waiting for dump
+    downloads so fetch workers can move on to the next crash id. This holds
+    those results until their dumps are downloaded and then adds the dump
+    files to "written" and "dumps" to "completed".
+
+    When ``max_waiting`` results are waiting, this waits for dumps before
+    pulling more results, which keeps fetch workers from getting too far
+    ahead of the dump downloads.
+
+    :arg results: iterable of fetch_crash results
+    :arg max_waiting: maximum number of results waiting on dumps
+    :arg catch_errors: whether to put dump download errors in the result rather
+        than raise them
+
+    :returns: generator of fetch_crash results
+
+    """
+    waiting = []
+
+    def finish(result):
+        try:
+            for future in result.pop("dump_futures"):
+                result["written"].append(future.result())
+        except Exception as exc:
+            if not catch_errors:
+                raise
+            result["error"] = f"{type(exc).__name__}: {exc}"
+        else:
+            result["completed"].append("dumps")
+        return result
+
+    def finished(block):
+        nonlocal waiting
+        if block:
+            wait(
+                [future for result in waiting for future in result["dump_futures"]],
+                return_when=FIRST_COMPLETED,
+            )
+        done = []
+        still_waiting = []
+        for result in waiting:
+            if all(future.done() for future in result["dump_futures"]):
+                done.append(result)
+            else:
+                still_waiting.append(result)
+        waiting = still_waiting
+        return [finish(result) for result in done]
+
+    for result in results:
+        if result.get("dump_futures"):
+            waiting.append(result)
+        else:
+            yield result
+
+        yield from finished(block=False)
+        while len(waiting) >= max_waiting:
+            yield from finished(block=True)
+
+    while waiting:
+        yield from finished(block=True)
+
+
+def fetch_crash_job(job, catch_errors=False, **kwargs):
+    """Unpacks a (crash_id, skip) job and calls fetch_crash with it
+
+    :arg catch_errors: whether to return errors in the result rather than raise
+        them
+
+    """
+    crash_id, skip = job
+    if not catch_errors:
+        return fetch_crash(crash_id, skip=skip, **kwargs)
+
+    try:
+        return fetch_crash(crash_id, skip=skip, **kwargs)
+    except Exception as exc:
+        return {
+            "crash_id": crash_id,
+            "completed": [],
+            "written": [],
+            "skipped": [],
+            "error": f"{type(exc).__name__}: {exc}",
+        }
+
+
+def crash_id_date_range(crash_ids):
+    """Returns Super Search date filters covering the dates in the crash ids
+
+    The last 6 characters of a crash id are the date it was submitted. The
+    range is padded by a day on either side for timezone differences.
+
+    :arg crash_ids: list of valid crash ids
+
+    :returns: list of Super Search "date" filter values
+
+    """
+    dates = sorted(
+        datetime.datetime.strptime(crash_id[-6:], "%y%m%d").date()
+        for crash_id in crash_ids
+    )
+    start = dates[0] - timedelta(days=1)
+    end = dates[-1] + timedelta(days=2)
+    return [f">={start.isoformat()}", f"<{end.isoformat()}"]
+
+
+def fetch_processed_fields(
+    crash_ids,
+    fields,
+    host,
+    api_token,
+    overwrite,
+    stats,
+    outputdir,
+    color,
+    fsync=False,
+    session=None,
+):
+    """Fetches processed crash fields for a batch of crash ids with one search
+
+    Saves each crash's fields as a JSON document in
+    OUTPUTDIR/processed_crash_fields/CRASHID.
+
+    :arg crash_ids: list of valid crash ids; at most FIELDS_BATCH_SIZE
+    :arg fields: list of Super Search fields to fetch
+
+    :returns: dict with "completed" set of crash ids that are now complete,
+        "written" list of paths of files that were written, and "skipped" list
+        of paths that already existed
+
+    """
+    if not color:
+        console = Console(color_system=None)
+    else:
+        console = Console()
+
+    completed = set()
+    written = []
+    skipped = []
+
+    to_fetch = []
+    for crash_id in crash_ids:
+        fn = os.path.join(outputdir, "processed_crash_fields", crash_id)
+        if os.path.exists(fn) and not overwrite:
+            skipped.append(fn)
+            completed.add(crash_id)
+        else:
+            to_fetch.append(crash_id)
+
+    if to_fetch:
+        if not stats:
+            console.print(
+                f"Fetching processed crash fields for {len(to_fetch)} crashes"
+            )
+        params = {
+            "uuid": to_fetch,
+            "date": crash_id_date_range(to_fetch),
+            "_columns": ["uuid"] + [field for field in fields if field != "uuid"],
+            "_facets_size": 0,
+        }
+        hits = supersearch(
+            params=params,
+            num_results=len(to_fetch),
+            host=host,
+            api_token=api_token,
+            session=session,
+        )
+        for hit in hits:
+            crash_id = hit["uuid"]
+            fn = os.path.join(outputdir, "processed_crash_fields", crash_id)
+            write_atomically(
+                fn, serialize_json(hit, indent=2, sort_keys=True), fsync=fsync
+            )
+            written.append(fn)
+            completed.add(crash_id)
+
+        for crash_id in to_fetch:
+            if crash_id not in completed:
+                console.print(
+                    f"[yellow]{crash_id}: fetching processed crash fields -- "
+                    + "not found in Super Search[/yellow]"
                 )
 
+    return {"completed": completed, "written": written, "skipped": skipped}
+
+
+def fetch_crash_batch(jobs, fields, catch_errors=False, **kwargs):
+    """Fetches crash data for a batch of (crash_id, skip) jobs
+
+    Raw crash data and dumps are fetched per crash id. Processed crash fields
+    are fetched for the whole batch with one Super Search request.
 
-@click.command(context_settings={"show_default": True})
+    :arg jobs: list of (crash_id, skip) jobs
+    :arg fields: list of Super Search fields to fetch
+    :arg catch_errors: whether to return errors in the results rather than
+        raise them
+
+    :returns: list of fetch_crash results
+
+    """
+    results = [
+        fetch_crash_job(job, catch_errors=catch_errors, **kwargs) for job in jobs
+    ]
+
+    crash_ids = [
+        result["crash_id"]
+        for job, result in zip(jobs, results)
+        if result["crash_id"]
+        and not result.get("error")
+        and "processed_crash_fields" not in job[1]
+    ]
+    if not crash_ids:
+        return results
+
+    fields_kwargs = {
+        key: kwargs[key]
+        for key in (
+            "host",
+            "api_token",
+            "overwrite",
+            "stats",
+            "outputdir",
+            "color",
+            "fsync",
+            "session",
+        )
+        if key in kwargs
+    }
+    try:
+        fields_result = fetch_processed_fields(crash_ids, fields, **fields_kwargs)
+    except Exception as exc:
+        if not catch_errors:
+            raise
+        for result in results:
+            if result["crash_id"] in crash_ids:
+                result["error"] = f"{type(exc).__name__}: {exc}"
+        return results
+
+    for result in results:
+        crash_id = result["crash_id"]
+        if crash_id in fields_result["completed"]:
+            result["completed"].append("processed_crash_fields")
+        result["written"].extend(
+            fn for fn in fields_result["written"] if os.path.basename(fn) == crash_id
+        )
+        result["skipped"].extend(
+            fn for fn in fields_result["skipped"] if os.path.basename(fn) == crash_id
+        )
+    return results
+
+
+@click.command(context_settings={"show_default": True, "ignore_unknown_options": True})
 @click.option(
     "--host",
     default=DEFAULT_HOST,
     help="host to pull crash data from; this needs to match CRASHSTATS_API_TOKEN value",
 )
+@click.option(
+    "--supersearch-url",
+    default="",
+    help="Super Search url to fetch crash ids from rather than stdin",
+)
+@click.option(
+    "--num",
+    default="100",
+    type=click.UNPROCESSED,
+    help=(
+        'number of crash ids you want from Super Search or "all" for all of them; '
+        "only used with --supersearch-url"
+    ),
+)
 @click.option(
     "--overwrite/--no-overwrite",
     default=True,
     help="whether or not to overwrite existing data",
 )
+@click.option(
+    "--fsync-every",
+    default=0,
+    type=click.IntRange(0),
+    help=(
+        "fsync written files and, once every N files, the directories they were "
+        "renamed into; 0 disables fsync"
+    ),
+)
+@click.option(
+    "--journal",
+    "journal_path",
+    default="",
+    help=(
+        "append-only log of completed crash ids and artifacts; when resuming a run, "
+        "crash ids completed in the journal are skipped"
+    ),
+)
 @click.option(
     "--raw/--no-raw",
     "fetchraw",
@@ -157,12 +791,83 @@ def fetch_crash(
     default=False,
     help="whether or not to save processed crash data",
 )
+@click.option(
+    "--dedupe/--no-dedupe",
+    default=True,
+    help="whether or not to skip crash ids that have already been seen in this run",
+)
+@click.option(
+    "--sort-window",
+    default=0,
+    type=click.IntRange(0),
+    help=(
+        "sort crash ids by date in windows of N crash ids so files are written to "
+        "the same date directories together; 0 disables sorting"
+    ),
+)
+@click.option(
+    "--processed-fields",
+    multiple=True,
+    help=(
+        "Super Search field to save from processed crash data; fields are fetched "
+        f"with one Super Search request per {FIELDS_BATCH_SIZE} crash ids and "
+        "saved to processed_crash_fields/; can be specified multiple times or "
+        "comma-separated"
+    ),
+)
 @click.option(
     "--workers",
     default=1,
     type=click.IntRange(1, 10, clamp=True),
     help="how many workers to use to download data; requires CRASHSTATS_API_TOKEN",
 )
+@click.option(
+    "--max-dump-workers",
+    default=0,
+    type=click.IntRange(0),
+    help=(
+        "download dumps in a separate pool of N workers so other requests keep "
+        "going at full speed; 0 downloads dumps in the --workers workers"
+    ),
+)
+@click.option(
+    "--max-bandwidth",
+    default="0",
+    help=(
+        "maximum bytes per second to download across all workers like 500K or "
+        "5M; dumps are downloaded in chunks and slowed down to stay under it; "
+        "0 for no limit"
+    ),
+)
+@click.option(
+    "--queue",
+    "queue_path",
+    default="",
+    help=(
+        "SQLite file to use as a work queue shared by multiple fetch-data "
+        "processes; crash ids specified are added to the queue and then this "
+        "works until the queue is empty; with --shard, only crash ids in the "
+        "shard are added"
+    ),
+)
+@click.option(
+    "--shard",
+    default="",
+    help=(
+        "K/N to only fetch the crash ids in shard K of N; crash ids are assigned to "
+        "shards by a stable hash so N machines can split one job"
+    ),
+)
+@click.option(
+    "--input",
+    "input_fp",
+    default=None,
+    type=click.File("r"),
+    help=(
+        "file to read crash ids from, one per line; defaults to stdin when no "
+        "crash ids are specified on the command line"
+    ),
+)
 @click.option(
     "--stats/--no-stats",
     default=False,
@@ -171,6 +876,11 @@ def fetch_crash(
         "stats, it's not printing other things"
     ),
 )
+@click.option(
+    "--stats-file",
+    default="",
+    help="write statistics for the run as JSON to this file when done",
+)
 @click.option(
     "--color/--no-color",
     default=True,
@@ -190,12 +900,25 @@ def fetch_crash(
 def fetch_data(
     ctx,
     host,
+    supersearch_url,
+    num,
     overwrite,
+    fsync_every,
+    journal_path,
     fetchraw,
     fetchdumps,
     fetchprocessed,
+    dedupe,
+    sort_window,
+    processed_fields,
     workers,
+    max_dump_workers,
+    max_bandwidth,
+    queue_path,
+    shard,
+    input_fp,
     stats,
+    stats_file,
     color,
     dotenv,
     outputdir,
@@ -204,14 +927,61 @@ def fetch_data(
     """
     Fetches crash data from Crash Stats (https://crash-stats.mozilla.org/) system.
 
-    Given one or more crash ids via command line or stdin (one per line), fetches
-    crash data and puts it in specified directory.
+    Given one or more crash ids via command line, an input file, or stdin (one
+    per line), fetches crash data and puts it in specified directory. Crash ids
+    from a file or stdin are read as they arrive, so fetching starts right away
+    when piped from a slow producer like "supersearch --num=all".
 
     Crash data is split up into directories: raw_crash/, dump_names/,
     processed_crash/, and directories with the same name as the dump type.
 
+    Alternatively, you can pass in a url from a Super Search on Crash Stats plus
+    additional Super Search arguments and fetch-data will page through search
+    results fetching crash data as crash ids arrive.
+
+    \b
+    $ fetch-data --supersearch-url='https://crash-stats.mozilla.org/search/...' \\
+        --product=Firefox --num=all crashdata
+
+    Make sure to use the "--field=value" form for Super Search arguments.
+
     https://antenna.readthedocs.io/en/latest/overview.html#aws-s3-file-hierarchy
 
+    When fetching dumps in bulk, use "--max-bandwidth" to limit how much of
+    your network fetch-data uses and "--max-dump-workers" to download dumps in
+    a separate, smaller pool of workers so fetching everything else isn't held
+    up waiting on dumps.
+
+    Duplicate crash ids are skipped. To write files for the same date together,
+    use "--sort-window=N" to sort crash ids by date N at a time.
+
+    For large jobs, use "--journal" to keep a log of completed crash ids. If the
+    job is interrupted, run it again with the same journal and it'll pick up
+    where it left off.
+
+    If you only need some fields of the processed crash data, use
+    "--processed-fields". This fetches those fields for batches of crash ids
+    using Super Search, which is many fewer requests than fetching whole
+    processed crashes. Fields are Super Search field names.
+
+    \b
+    $ fetch-data --no-raw --processed-fields=signature,product,version \\
+        crashdata < crashids.txt
+
+    To spread a large job across several processes or machines sharing a file
+    system, use "--queue". Crash ids are added to the queue. Then any number of
+    fetch-data processes using that queue claim crash ids, fetch them, and mark
+    them done. Crash ids that fail or whose process dies are retried.
+
+    Claimed crash ids are leased for 5 minutes and leases aren't renewed. If
+    fetching a batch of crash ids takes longer than that (for example, large
+    dumps with "--max-bandwidth"), other processes can claim and fetch the same
+    crash ids again.
+
+    \b
+    $ fetch-data --queue=work.db crashdata < crashids.txt
+    $ fetch-data --queue=work.db crashdata  # on other machines
+
     This requires an API token in order to download dumps and protected data.
     Using an API token also reduces rate-limiting. Set the CRASHSTATS_API_TOKEN
     environment variable to your API token value:
@@ -237,6 +1007,16 @@ def fetch_data(
 
     host = host.rstrip("/")
 
+    try:
+        params, num_results, positional = parse_supersearch_options(
+            supersearch_url, num, (outputdir,) + crash_ids
+        )
+    except InvalidArg as exc:
+        raise click.UsageError(str(exc)) from exc
+    if not positional:
+        raise click.UsageError("Missing argument 'OUTPUTDIR'.")
+    outputdir, crash_ids = positional[0], tuple(positional[1:])
+
     if fetchdumps and not fetchraw:
         raise click.BadOptionUsage(
             "fetchdumps",
@@ -244,6 +1024,19 @@ def fetch_data(
             ctx=ctx,
         )
 
+    processed_fields = [
+        field.strip()
+        for value in processed_fields
+        for field in value.split(",")
+        if field.strip()
+    ]
+    if processed_fields and fetchprocessed:
+        raise click.BadOptionUsage(
+            "processed_fields",
+            "You cannot fetch processed crash fields and processed crashes.",
+            ctx=ctx,
+        )
+
     # Validate outputdir and exit if it doesn't exist or isn't a directory
     if os.path.exists(outputdir) and not os.path.isdir(outputdir):
         raise click.ClickException(f"{outputdir} is not a directory.")
@@ -276,11 +1069,188 @@ def fetch_data(
             ctx=ctx,
         )
 
-    if not crash_ids and not sys.stdin.isatty():
-        crash_ids = list(click.get_text_stream("stdin").readlines())
+    # All workers share a session so they share a connection pool
+    session = session_with_retries()
+    fetch_stats = FetchStats()
+    if stats or stats_file:
+        session.hooks["response"].append(fetch_stats.record_response)
+
+    try:
+        max_bandwidth = parse_size(max_bandwidth)
+    except ValueError as exc:
+        raise click.BadParameter(
+            str(exc), ctx=ctx, param_hint="--max-bandwidth"
+        ) from exc
+    dump_chunk_callback = None
+    if max_bandwidth:
+        limiter = BandwidthLimiter(max_bandwidth)
+        session.hooks["response"].append(limiter.record_response)
+        console.print(f"Limiting bandwidth to {format_bytes(max_bandwidth)}/s.")
+
+        # Dumps are read in chunks so the limiter can slow them down as they
+        # download; the stats hook doesn't see those bytes, so count them here
+        def dump_chunk_callback(size):
+            limiter.record_chunk(size)
+            fetch_stats.record_bytes(size)
+
+    # Dumps get their own pool of workers so crash ids waiting on a dump
+    # download don't tie up the workers fetching everything else
+    dump_executor = None
+    if fetchdumps and max_dump_workers:
+        dump_executor = ThreadPoolExecutor(max_workers=max_dump_workers)
+
+    if shard:
+        try:
+            shard = parse_shard(shard)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), ctx=ctx, param_hint="--shard") from exc
+        console.print(f"Fetching shard {shard[0]} of {shard[1]}.")
+    else:
+        shard = None
+
+    if supersearch_url:
+        if crash_ids or input_fp:
+            raise click.UsageError(
+                "You cannot specify crash ids when using --supersearch-url."
+            )
+
+        # The next page of search results is fetched while workers fetch crash
+        # data for this one
+        total = None
+        lines = supersearch_crash_ids(
+            params,
+            num_results=num_results,
+            host=host,
+            api_token=api_token,
+            session=session,
+        )
+
+    else:
+        # If crash ids came from the command line, we know how many there are;
+        # otherwise they're streamed in and we don't
+        total = len(crash_ids) if crash_ids else None
+        lines = iter_lines(crash_ids, input_fp)
+
+    duplicates = 0
+    if dedupe:
+        seen = CrashIdSet()
+
+        def unique_crash_ids(lines):
+            nonlocal duplicates
+            for line in lines:
+                try:
+                    crash_id = parse_crash_id(line)
+                except ValueError:
+                    # Let fetch_crash complain about it
+                    yield line
+                    continue
+                if crash_id in seen:
+                    duplicates += 1
+                    continue
+                seen.add(crash_id)
+                yield line
+
+        lines = unique_crash_ids(lines)
+        if total is not None:
+            lines = list(lines)
+            total = len(lines)
+
+    if sort_window:
+        # The last 6 characters of a crash id are the date
+        lines = sort_in_windows(lines, sort_window, key=lambda line: line[-6:])
+
+    work_queue = None
+    if queue_path:
+        work_queue = WorkQueue(queue_path)
+
+        def valid_crash_ids():
+            for line in lines:
+                try:
+                    crash_id = parse_crash_id(line)
+                except ValueError:
+                    console.print(f"[yellow]{line}: not a valid crash id[/yellow]")
+                    continue
+                if in_shard(crash_id, shard):
+                    yield crash_id
+
+        # Add any crash ids we were given to the queue and then work on whatever
+        # is claimable in the queue
+        added = work_queue.enqueue(valid_crash_ids())
+        console.print(f"Queue: added {added:,} crash ids.")
+        total = None
+        lines = work_queue.iter_claims(batch_size=max(workers * 2, 10))
+
+    artifacts = []
+    if fetchraw:
+        artifacts.append("raw_crash")
+    if fetchdumps:
+        artifacts.append("dumps")
+    if fetchprocessed:
+        artifacts.append("processed_crash")
+    if processed_fields:
+        artifacts.append("processed_crash_fields")
+
+    journal = Journal(journal_path) if journal_path else None
+    already_completed = 0
+
+    # With a queue, the shard only decides which crash ids this process adds
+    # to the queue. Everything claimed from the queue gets worked on--otherwise
+    # claimed crash ids outside the shard would stay leased and nothing could
+    # claim them until the lease expired.
+    job_shard = None if work_queue else shard
+
+    def generate_jobs():
+        """Generates (crash_id, skip) jobs for this shard
+
+        This skips work the journal says is done.
+
+        """
+        nonlocal already_completed
+
+        for crash_id in lines:
+            skip = ()
+            if journal or job_shard:
+                try:
+                    parsed_crash_id = parse_crash_id(crash_id)
+                except ValueError:
+                    # Let fetch_crash complain about it
+                    parsed_crash_id = None
+
+                if parsed_crash_id and not in_shard(parsed_crash_id, job_shard):
+                    continue
+
+                if parsed_crash_id and journal:
+                    skip = tuple(
+                        artifact
+                        for artifact in artifacts
+                        if journal.has(parsed_crash_id, artifact)
+                    )
+                    if len(skip) == len(artifacts):
+                        already_completed += 1
+                        if work_queue:
+                            work_queue.complete(parsed_crash_id)
+                        continue
+            yield (crash_id, skip)
+
+    jobs = generate_jobs()
+    if journal and total is not None:
+        # The crash ids are all in memory anyway, so figure out what's left
+        jobs = list(jobs)
+        total = len(jobs)
+        console.print(
+            f"Journal: {already_completed:,} crash ids already completed; "
+            + f"{total:,} left."
+        )
+
+    if processed_fields:
+        # Fetch processed crash fields for batches of crash ids at a time
+        jobs = chunked(jobs, FIELDS_BATCH_SIZE)
+        fetch_fn = partial(fetch_crash_batch, fields=processed_fields)
+    else:
+        fetch_fn = fetch_crash_job
 
     fetch_crash_partial = partial(
-        fetch_crash,
+        fetch_fn,
         host=host,
         api_token=api_token,
         fetchraw=fetchraw,
@@ -290,38 +1260,83 @@ def fetch_data(
         overwrite=overwrite,
         stats=stats,
         outputdir=outputdir,
+        fsync=fsync_every > 0,
+        session=session,
+        dump_executor=dump_executor,
+        dump_chunk_callback=dump_chunk_callback,
+        catch_errors=work_queue is not None,
     )
+    syncer = DirectorySyncer(fsync_every)
 
     start_time = time.time()
-    total = len(crash_ids)
-    i = 0
+    results = imap_bounded(fetch_crash_partial, jobs, workers)
+    if processed_fields:
+        results = chain.from_iterable(results)
+    if dump_executor:
+        results = wait_for_dumps(
+            results,
+            max_waiting=MAX_WAITING_FOR_DUMPS,
+            catch_errors=work_queue is not None,
+        )
+    for i, result in enumerate(results):
+        syncer.add(result["written"])
+        fetch_stats.record_result(result)
+        if journal and result["crash_id"]:
+            journal.add(result["crash_id"], result["completed"])
+        if work_queue and result["crash_id"]:
+            if result.get("error"):
+                console.print(
+                    f"[yellow]{result['crash_id']}: {result['error']}[/yellow]"
+                )
+                work_queue.fail(result["crash_id"], result["error"])
+            else:
+                work_queue.complete(result["crash_id"])
 
-    if workers > 1:
-        with Pool(workers) as pool:
-            for _ in pool.imap(fetch_crash_partial, crash_ids):
-                if stats:
-                    # Print something every 100
-                    if i % 100 == 0:
-                        seconds_per_item = (time.time() - start_time) / (i + 1)
-                        estimate_left = str(
-                            timedelta(seconds=seconds_per_item * (total - i + 1))
-                        )
-                        console.print(
-                            (f"Downloaded ({i}/{total}) {estimate_left}").strip()
-                        )
-                    i += 1
+        # Print something every 100
+        if stats and i % 100 == 0:
+            elapsed = time.time() - start_time
+            if total is not None:
+                seconds_per_item = elapsed / (i + 1)
+                estimate_left = str(
+                    timedelta(seconds=int(seconds_per_item * (total - i + 1)))
+                )
+                progress = f"({i}/{total}) {estimate_left}"
+            else:
+                # We don't know the total, so all we can show is the rate
+                rate = (i + 1) / elapsed if elapsed else 0
+                progress = f"({i}) {rate:,.1f}/s"
+            console.print(f"Downloaded {progress} -- {fetch_stats.progress_line()}")
 
-    else:
-        for crash_id in crash_ids:
-            fetch_crash_partial(crash_id)
-            if stats:
-                if i % 100 == 0:
-                    seconds_per_item = (time.time() - start_time) / (i + 1)
-                    estimate_left = str(
-                        timedelta(seconds=int(seconds_per_item * (total - i + 1)))
-                    )
-                    console.print((f"Downloaded ({i}/{total}) {estimate_left}").strip())
-                i += 1
+    if dump_executor:
+        dump_executor.shutdown()
+    syncer.sync()
+    fetch_stats.skipped_journal = already_completed
+    fetch_stats.skipped_duplicates = duplicates
+    if journal:
+        journal.close()
+        if total is None:
+            console.print(
+                f"Journal: skipped {already_completed:,} crash ids already completed."
+            )
+
+    if duplicates:
+        console.print(f"Dropped {duplicates:,} duplicate crash ids.")
+
+    if work_queue:
+        counts = work_queue.counts()
+        work_queue.close()
+        console.print(
+            "Queue: "
+            + ", ".join(f"{count:,} {state}" for state, count in counts.items())
+            + "."
+        )
+
+    if stats:
+        fetch_stats.print_summary(console)
+
+    if stats_file:
+        with open(stats_file, "w") as fp:
+            json.dump(fetch_stats.summary(), fp, indent=2)
 
     total_time = timedelta(seconds=int(time.time() - start_time))
     console.print(f"Completed in {total_time}.")
@@ -2,28 +2,445 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import datetime
 from datetime import timedelta
+from functools import partial
+from itertools import chain, count, islice
+import math
 import os
-import sys
+import random
+import threading
 import time
 
 import click
 from dotenv import load_dotenv
 from rich.console import Console
-from more_itertools import chunked
+from more_itertools import chunked, peekable
+import requests
 
+from crashstats_tools.libcrashstats import (
+    get_processed_crash,
+    supersearch_crash_ids,
+    supersearch_total,
+)
 from crashstats_tools.utils import (
+    CrashIdSet,
     DEFAULT_HOST,
     http_post,
+    imap_bounded,
+    in_shard,
+    InvalidArg,
+    iter_lines,
+    Journal,
     parse_crash_id,
+    parse_shard,
+    parse_supersearch_options,
+    retried_statuses,
+    session_with_retries,
 )
 
 
 CHUNK_SIZE = 50
+
+# Largest group --chunk-size=auto will try
+MAX_CHUNK_SIZE = 1000
 SLEEP_DEFAULT = 1
 
+# Reprocessing more than this many crash ids requires --allow-many
+MANY_CRASH_IDS = 10_000
+
+# Defaults for --pacing=adaptive in crash ids per second
+MIN_RATE_DEFAULT = 10
+MAX_RATE_DEFAULT = 250
+
+# Number of times to try submitting a group that got a 429 or 5xx response
+# with --pacing=adaptive
+MAX_GROUP_ATTEMPTS = 5
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Seconds to wait before retrying a group the first time with --pacing=fixed;
+# this doubles with each retry and --sleep is used if it's longer
+RETRY_BACKOFF = 1.0
+
+# Number of processed crashes to check at once with --wait
+WAIT_WORKERS = 5
+
+# Status the server uses to reject a group for being too big
+TOO_BIG_STATUS = 413
+
+
+class AIMDPacer:
+    """Paces submissions using additive increase, multiplicative decrease
+
+    The rate in crash ids per second goes up by ``increase`` after every fast,
+    successful response. It's multiplied by ``decrease`` after a 429, a 5xx, or
+    a response that's much slower than usual. It stays between ``min_rate`` and
+    ``max_rate``. This is the same scheme TCP uses for congestion control, so
+    it finds the fastest rate the server will take and backs off quickly when
+    the server struggles.
+
+    ``record_response`` is a requests response hook, so it sees statuses of
+    attempts the session retried, too.
+
+    :arg min_rate: minimum rate in crash ids per second; this is the starting rate
+    :arg max_rate: maximum rate in crash ids per second
+    :arg increase: crash ids per second to add after a good response; defaults
+        to min_rate
+    :arg decrease: factor to multiply rate by after a bad response
+
+    """
+
+    # A response slower than this times the average latency counts as bad
+    SLOW_FACTOR = 2.0
+
+    # Weight of the newest latency in the moving average
+    LATENCY_ALPHA = 0.2
+
+    def __init__(self, min_rate, max_rate, increase=None, decrease=0.5):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase if increase is not None else min_rate
+        self.decrease = decrease
+        self.rate = min_rate
+        self.avg_latency = None
+        self.lock = threading.Lock()
+
+    def record(self, statuses, latency):
+        """Adjusts the rate based on a response
+
+        :arg statuses: HTTP status codes of all attempts for the request
+        :arg latency: seconds the request took
+
+        """
+        with self.lock:
+            failed = any(
+                status is None or status in RETRYABLE_STATUSES for status in statuses
+            )
+            slow = (
+                self.avg_latency is not None
+                and latency > self.avg_latency * self.SLOW_FACTOR
+            )
+            if failed or slow:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            if not failed:
+                if self.avg_latency is None:
+                    self.avg_latency = latency
+                else:
+                    self.avg_latency += self.LATENCY_ALPHA * (
+                        latency - self.avg_latency
+                    )
+
+    def record_response(self, resp, *args, **kwargs):
+        self.record(
+            retried_statuses(resp) + [resp.status_code], resp.elapsed.total_seconds()
+        )
+        return resp
+
+    def delay(self, count):
+        """Returns seconds to wait before submitting count crash ids"""
+        with self.lock:
+            return count / self.rate
+
+
+class BatchSizer:
+    """Finds the group size that gets the most crash ids accepted per second
+
+    Starting at ``start``, this measures throughput over a few groups at each
+    size and doubles the size while throughput improves. When throughput stops
+    improving, it settles on the best size so far. When the server rejects a
+    group as too big, the size is halved and can't go above that again.
+
+    Throughput is crash ids divided by the request latency plus ``overhead``
+    seconds, which is the time spent sleeping between groups.
+
+    :arg start: size to start with
+    :arg max_size: largest size to try
+    :arg overhead: seconds spent per group in addition to the request
+
+    """
+
+    # Number of groups to measure at each size
+    SAMPLES = 3
+
+    def __init__(self, start=CHUNK_SIZE, max_size=MAX_CHUNK_SIZE, overhead=0):
+        self.size = start
+        self.max_size = max_size
+        self.overhead = overhead
+        self.best_size = None
+        self.best_rate = 0
+        self.settled = False
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def record(self, size, latency):
+        """Records how long it took to submit a group of size crash ids"""
+        with self.lock:
+            if self.settled or size != self.size:
+                return
+
+            self.latencies.append(latency + self.overhead)
+            if len(self.latencies) < self.SAMPLES:
+                return
+
+            rate = size * len(self.latencies) / max(sum(self.latencies), 0.001)
+            self.latencies = []
+            if rate > self.best_rate:
+                self.best_size = size
+                self.best_rate = rate
+                if size >= self.max_size:
+                    self.settled = True
+                else:
+                    self.size = min(size * 2, self.max_size)
+            else:
+                self.size = self.best_size
+                self.settled = True
+
+    def too_big(self, size):
+        """Records that the server rejected a group of size crash ids"""
+        with self.lock:
+            self.max_size = max(1, min(self.max_size, size // 2))
+            self.size = min(self.size, self.max_size)
+            if self.best_size is not None and self.best_size > self.max_size:
+                self.best_size = self.max_size
+            self.latencies = []
+
+
+def submit_group(
+    url,
+    group,
+    api_token,
+    session,
+    ruleset="",
+    pacer=None,
+    sleep=0,
+    sizer=None,
+    console=None,
+    split_on_400=True,
+):
+    """Submits a group of crash ids for reprocessing
+
+    Groups that get a 429, a 5xx, a connection error, or a timeout are retried
+    up to MAX_GROUP_ATTEMPTS times. Retries wait for the pacer if there is one.
+    If there isn't, they back off starting at RETRY_BACKOFF seconds, but wait
+    at least ``sleep`` seconds.
+
+    A group that times out might have been accepted anyway, but there's no way
+    to know, so if it never succeeds, it's reported as failed.
+
+    With a sizer, groups the server rejects as too big (413) are split up and
+    submitted in smaller groups.
+
+    A 400 might mean the group is too big, too, or it might mean something else
+    like a bad crash id. With a sizer, a group that gets a 400 is split in half
+    once. The halves don't get split again, and the sizer only shrinks if they
+    were both accepted.
+
+    :arg url: the Reprocessing API url
+    :arg group: list of crash ids
+    :arg api_token: the API token to use
+    :arg session: requests Session to use
+    :arg ruleset: processor pipeline ruleset to use or ""
+    :arg pacer: AIMDPacer or None
+    :arg sleep: seconds to wait before retrying without a pacer
+    :arg sizer: BatchSizer or None
+    :arg console: rich Console to print retries to
+    :arg split_on_400: whether to split the group in half if it gets a 400
+
+    :returns: list of dicts, one per group submitted, with "group" list of crash
+        ids, "resp" requests Response or None, "error" string or None, and
+        "submitted_at" UTC datetime the last attempt was started at
+
+    """
+    data = {"crash_ids": group}
+    if ruleset:
+        data["crash_ids"] = [f"{crashid}:{ruleset}" for crashid in group]
+
+    attempt = 1
+    while True:
+        # Take this before the POST so anything reprocessed after the request
+        # is sent counts as reprocessed for --wait
+        submitted_at = datetime.datetime.now(datetime.timezone.utc)
+        start_time = time.perf_counter()
+        try:
+            resp = http_post(url, data=data, api_token=api_token, session=session)
+            if sizer:
+                sizer.record(len(group), time.perf_counter() - start_time)
+            return [
+                {
+                    "group": group,
+                    "resp": resp,
+                    "error": None,
+                    "submitted_at": submitted_at,
+                }
+            ]
+        except requests.RequestException as exc:
+            if isinstance(exc, requests.HTTPError):
+                status_code = exc.response.status_code
+                error = f"HTTP {status_code}"
+                retryable = status_code in RETRYABLE_STATUSES
+            else:
+                # Connection errors and timeouts never get to the pacer's
+                # response hook, so tell the pacer here
+                if pacer:
+                    pacer.record([None], time.perf_counter() - start_time)
+                status_code = None
+                error = f"{type(exc).__name__}: {exc}"
+                retryable = True
+
+            split = partial(
+                submit_group,
+                url,
+                api_token=api_token,
+                session=session,
+                ruleset=ruleset,
+                pacer=pacer,
+                sleep=sleep,
+                sizer=sizer,
+                console=console,
+            )
+
+            if sizer and status_code == TOO_BIG_STATUS and len(group) > 1:
+                sizer.too_big(len(group))
+                if console is not None:
+                    console.print(
+                        f"[yellow]Got back {error}; splitting group ending with "
+                        + f"{group[-1]} into groups of {sizer.size}[/yellow]"
+                    )
+                results = []
+                for subgroup in chunked(group, sizer.size):
+                    results.extend(split(subgroup, split_on_400=split_on_400))
+                return results
+
+            if sizer and status_code == 400 and split_on_400 and len(group) > 1:
+                if console is not None:
+                    console.print(
+                        f"[yellow]Got back {error}; splitting group ending with "
+                        + f"{group[-1]} in half to see if it's too big[/yellow]"
+                    )
+                results = []
+                for subgroup in chunked(group, math.ceil(len(group) / 2)):
+                    results.extend(split(subgroup, split_on_400=False))
+                # If a half got a 400, too, the 400 wasn't about the size
+                if not any(result["error"] == error for result in results):
+                    sizer.too_big(len(group))
+                return results
+
+            if not retryable or attempt >= MAX_GROUP_ATTEMPTS:
+                return [
+                    {
+                        "group": group,
+                        "resp": None,
+                        "error": error,
+                        "submitted_at": submitted_at,
+                    }
+                ]
+
+            if pacer:
+                delay = pacer.delay(len(group))
+            else:
+                delay = max(sleep, RETRY_BACKOFF * 2 ** (attempt - 1))
+            if console is not None:
+                console.print(
+                    f"[yellow]Got back {error}; retrying group ending with "
+                    + f"{group[-1]} in {delay:,.1f} seconds[/yellow]"
+                )
+            time.sleep(delay)
+            attempt += 1
+
+
+def parse_datetime(text):
+    """Parses an ISO 8601 datetime from Crash Stats into an aware datetime"""
+    value = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
 
-@click.command(context_settings={"show_default": True})
+
+def is_reprocessed(item, host, api_token, session):
+    """Returns whether a crash was processed after it was submitted
+
+    :arg item: (crash id, datetime it was submitted) tuple
+    :arg host: the host to check
+    :arg api_token: the API token to use
+    :arg session: requests Session to use
+
+    :returns: (crash id, bool) tuple
+
+    """
+    crashid, submitted_at = item
+    try:
+        processed_crash = get_processed_crash(
+            crashid, api_token=api_token, host=host, session=session
+        )
+    except requests.RequestException:
+        return crashid, False
+
+    completed = processed_crash.get("completed_datetime")
+    if not completed:
+        return crashid, False
+    try:
+        return crashid, parse_datetime(completed) >= submitted_at
+    except ValueError:
+        return crashid, False
+
+
+def wait_for_reprocessing(
+    sample, submitted, start_time, interval, timeout, host, api_token, session, console
+):
+    """Polls sampled crash ids until they've been reprocessed
+
+    Prints what percent of the sample has been reprocessed, how fast crashes are
+    being reprocessed, and an estimate of how long until everything that was
+    submitted is reprocessed.
+
+    :arg sample: list of (crash id, datetime it was submitted) tuples
+    :arg submitted: total number of crash ids that were submitted
+    :arg start_time: time.time() when the first group was submitted
+    :arg interval: seconds to wait between checks
+    :arg timeout: seconds to wait before giving up; 0 waits forever
+
+    :returns: True if all sampled crash ids were reprocessed and False if it
+        timed out
+
+    """
+    check = partial(is_reprocessed, host=host, api_token=api_token, session=session)
+    pending = dict(sample)
+    wait_start = time.time()
+    while True:
+        for crashid, done in imap_bounded(
+            check, list(pending.items()), workers=WAIT_WORKERS
+        ):
+            if done:
+                del pending[crashid]
+
+        done_count = len(sample) - len(pending)
+        done_fraction = done_count / len(sample)
+        elapsed = time.time() - start_time
+        rate = done_fraction * submitted / elapsed if elapsed else 0
+        if rate:
+            time_left = str(
+                timedelta(seconds=int((1 - done_fraction) * submitted / rate))
+            )
+        else:
+            time_left = "unknown"
+        console.print(
+            f"Reprocessed {done_count}/{len(sample)} sampled crashes "
+            + f"({done_fraction:.1%}), about {rate:,.1f} crashes/s, "
+            + f"estimated time left: {time_left}"
+        )
+
+        if not pending:
+            return True
+        if timeout and time.time() - wait_start >= timeout:
+            return False
+        time.sleep(interval)
+
+
+@click.command(context_settings={"show_default": True, "ignore_unknown_options": True})
 @click.option(
     "--host",
     default=DEFAULT_HOST,
@@ -37,6 +454,46 @@ SLEEP_DEFAULT = 1
     show_default=True,
     help="how long in seconds to sleep before submitting the next group",
 )
+@click.option(
+    "--pacing",
+    default="fixed",
+    type=click.Choice(["fixed", "adaptive"], case_sensitive=False),
+    help=(
+        'how to pace submitting groups; "fixed" sleeps --sleep seconds between '
+        'groups; "adaptive" speeds up while the server responds quickly and '
+        "backs off on 429s, 5xxs, and slow responses"
+    ),
+)
+@click.option(
+    "--min-rate",
+    default=MIN_RATE_DEFAULT,
+    type=click.FloatRange(0.1),
+    help="minimum crash ids per second for --pacing=adaptive",
+)
+@click.option(
+    "--max-rate",
+    default=MAX_RATE_DEFAULT,
+    type=click.FloatRange(0.1),
+    help="maximum crash ids per second for --pacing=adaptive",
+)
+@click.option(
+    "--chunk-size",
+    default=str(CHUNK_SIZE),
+    type=click.UNPROCESSED,
+    help=(
+        'number of crash ids to submit in each group or "auto" to find the size '
+        "that gets the most crash ids accepted per second"
+    ),
+)
+@click.option(
+    "--concurrency",
+    default=1,
+    type=click.IntRange(1, 10, clamp=True),
+    help=(
+        "number of groups to submit at once; they share one connection pool and "
+        "the pacing"
+    ),
+)
 @click.option(
     "--ruleset",
     default="",
@@ -51,6 +508,81 @@ SLEEP_DEFAULT = 1
         "more than 10,000 crashes"
     ),
 )
+@click.option(
+    "--supersearch-url",
+    default="",
+    help="Super Search url to reprocess the crash reports of rather than stdin",
+)
+@click.option(
+    "--num",
+    default="all",
+    type=click.UNPROCESSED,
+    help=(
+        'number of crash reports from Super Search to reprocess or "all" for all '
+        "of them; only used with --supersearch-url"
+    ),
+)
+@click.option(
+    "--wait/--no-wait",
+    default=False,
+    help=(
+        "after submitting, wait for a sample of the crash ids to be reprocessed "
+        "and report how fast crashes are being reprocessed"
+    ),
+)
+@click.option(
+    "--wait-sample",
+    default=100,
+    type=click.IntRange(1),
+    help="number of submitted crash ids to check with --wait",
+)
+@click.option(
+    "--wait-interval",
+    default=30,
+    type=click.IntRange(0),
+    help="seconds between checks with --wait",
+)
+@click.option(
+    "--wait-timeout",
+    default=3600,
+    type=click.IntRange(0),
+    help="seconds to wait with --wait before giving up; 0 waits forever",
+)
+@click.option(
+    "--ledger",
+    "ledger_path",
+    default="",
+    help=(
+        "append-only log of crash ids that were accepted or failed; when resuming "
+        "a run, crash ids accepted in the ledger are skipped"
+    ),
+)
+@click.option(
+    "--list-failed/--no-list-failed",
+    default=False,
+    help=(
+        "print crash ids that failed and haven't been accepted since from the "
+        "--ledger file and exit"
+    ),
+)
+@click.option(
+    "--shard",
+    default="",
+    help=(
+        "K/N to only reprocess the crash ids in shard K of N; crash ids are "
+        "assigned to shards by a stable hash"
+    ),
+)
+@click.option(
+    "--input",
+    "input_fp",
+    default=None,
+    type=click.File("r"),
+    help=(
+        "file to read crash ids from, one per line; defaults to stdin when no "
+        "crash ids are specified on the command line"
+    ),
+)
 @click.option(
     "--color/--no-color",
     default=True,
@@ -66,10 +598,38 @@ SLEEP_DEFAULT = 1
 )
 @click.argument("crashids", nargs=-1)
 @click.pass_context
-def reprocess(ctx, host, sleep, ruleset, allow_many, color, dotenv, crashids):
+def reprocess(
+    ctx,
+    host,
+    sleep,
+    pacing,
+    min_rate,
+    max_rate,
+    chunk_size,
+    concurrency,
+    ruleset,
+    allow_many,
+    supersearch_url,
+    num,
+    wait,
+    wait_sample,
+    wait_interval,
+    wait_timeout,
+    ledger_path,
+    list_failed,
+    shard,
+    input_fp,
+    color,
+    dotenv,
+    crashids,
+):
     """
     Sends specified crashes for reprocessing
 
+    Crash ids can be specified on the command line, in a file with "--input", or
+    on stdin (one per line). Crash ids from a file or stdin are read as they
+    arrive, so submitting starts right away when piped from a slow producer.
+
     This requires CRASHSTATS_API_TOKEN to be set in the environment to a valid
     API token.
 
@@ -82,6 +642,43 @@ def reprocess(ctx, host, sleep, ruleset, allow_many, color, dotenv, crashids):
     rate of crash ids being processed. For example, you could use "--sleep 10"
     which will sleep for 10 seconds between submitting groups of crashes.
 
+    Alternatively, use "--pacing=adaptive" to have reprocess find the fastest
+    rate the server will take. It starts at "--min-rate" crash ids per second,
+    speeds up while responses are fast and successful, and backs off on 429s,
+    5xxs, and slow responses. It never goes faster than "--max-rate".
+
+    Alternatively, you can pass in a url from a Super Search on Crash Stats plus
+    additional Super Search arguments and reprocess will page through search
+    results submitting groups as crash ids arrive.
+
+    \b
+    $ reprocess --supersearch-url='https://crash-stats.mozilla.org/search/...' \\
+        --product=Firefox --allow-many
+
+    Make sure to use the "--field=value" form for Super Search arguments.
+
+    Use "--chunk-size" to change how many crash ids are submitted in each group.
+    With "--chunk-size=auto", reprocess tries bigger groups while they get more
+    crash ids accepted per second and settles on the best size.
+
+    Use "--concurrency" to submit several groups at once so network latency
+    isn't the bottleneck. Groups that fail with a 429, 5xx, or connection error
+    are retried. If groups still fail, reprocess says so and exits with 1.
+
+    For large jobs, use "--ledger" to keep a log of which crash ids were
+    accepted and which failed. If the job is interrupted, run it again with the
+    same ledger and it'll skip crash ids that were already accepted. To get a
+    list of crash ids that failed, use "--list-failed".
+
+    \b
+    $ reprocess --ledger=ledger.log --allow-many < crashids.txt
+    $ reprocess --ledger=ledger.log --list-failed > failed.txt
+
+    To find out how fast crashes are being reprocessed, use "--wait". After
+    submitting, reprocess checks the processed crash for a sample of the crash
+    ids until they've been reprocessed, printing progress and an estimate of
+    how long until everything is reprocessed.
+
     Also, if you're processing a lot of crashes, you should let us know before
     you do it.
     """
@@ -97,6 +694,22 @@ def reprocess(ctx, host, sleep, ruleset, allow_many, color, dotenv, crashids):
         console = Console()
         error_console = Console(stderr=True)
 
+    if list_failed:
+        if not ledger_path:
+            raise click.BadOptionUsage(
+                "list_failed", "--list-failed requires --ledger.", ctx=ctx
+            )
+        ledger = Journal(ledger_path, readonly=True)
+        accepted = ledger.records.get("accepted", CrashIdSet())
+        failed = [
+            crashid
+            for crashid in ledger.records.get("failed", CrashIdSet())
+            if crashid not in accepted
+        ]
+        for crashid in sorted(failed):
+            click.echo(crashid)
+        ctx.exit(0)
+
     api_token = os.environ.get("CRASHSTATS_API_TOKEN")
     if not api_token:
         error_console.print(
@@ -108,39 +721,121 @@ def reprocess(ctx, host, sleep, ruleset, allow_many, color, dotenv, crashids):
     masked_token = api_token[:4] + ("x" * (len(api_token) - 4))
     console.print(f"Using API token: {masked_token}")
 
+    sizer = None
+    if chunk_size != "auto":
+        try:
+            chunk_size = int(chunk_size)
+        except ValueError:
+            chunk_size = 0
+        if chunk_size < 1:
+            raise click.BadOptionUsage(
+                "chunk_size",
+                'chunk-size needs to be a positive integer or "auto"',
+                ctx=ctx,
+            )
+
+    if min_rate > max_rate:
+        raise click.BadParameter(
+            "--min-rate must be less than or equal to --max-rate.",
+            ctx=ctx,
+            param_hint="--min-rate",
+        )
+
     url = host.rstrip("/") + "/api/Reprocessing/"
     console.print(f"[bold green]Sending reprocessing requests to: {url}[/bold green]")
 
-    if not crashids and not sys.stdin.isatty():
-        crashids = list(click.get_text_stream("stdin").readlines())
-
-    to_process = []
-    for crashid in crashids:
-        crashid = crashid.strip()
+    if shard:
         try:
-            crashid = parse_crash_id(crashid).strip()
-        except ValueError:
-            console.print(f"[yellow]Crash id not recognized: {crashid}[/yellow]")
-            continue
+            shard = parse_shard(shard)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), ctx=ctx, param_hint="--shard") from exc
+        console.print(f"Reprocessing shard {shard[0]} of {shard[1]}.")
+    else:
+        shard = None
 
-        to_process.append(crashid)
+    ledger = Journal(ledger_path) if ledger_path else None
+    already_submitted = 0
 
-    if not to_process:
-        raise click.BadParameter(
-            message="No crashids specified.",
-            ctx=ctx,
-            param="crashids",
-            param_hint="crashids",
+    def parse_crash_ids(lines):
+        nonlocal already_submitted
+
+        for crashid in lines:
+            try:
+                crashid = parse_crash_id(crashid).strip()
+            except ValueError:
+                console.print(f"[yellow]Crash id not recognized: {crashid}[/yellow]")
+                continue
+
+            if not in_shard(crashid, shard):
+                continue
+
+            if ledger and ledger.has(crashid, "accepted"):
+                already_submitted += 1
+                continue
+
+            yield crashid
+
+    try:
+        params, num_results, crashids = parse_supersearch_options(
+            supersearch_url, num, crashids
         )
+    except InvalidArg as exc:
+        raise click.UsageError(str(exc)) from exc
 
-    console.print(
-        f"[bold green]Reprocessing {len(to_process):,} crashes sleeping {sleep} "
-        + "seconds between groups...[/bold green]"
-    )
-    estimate = timedelta(seconds=int(len(to_process) / CHUNK_SIZE * (sleep + 0.5)))
-    console.print(f"[bold green]Rough estimate: {estimate}")
+    if supersearch_url:
+        if crashids or input_fp:
+            raise click.UsageError(
+                "You cannot specify crash ids when using --supersearch-url."
+            )
+
+        # Searching gets its own session so search latency doesn't affect pacing
+        search_session = session_with_retries()
+
+        # Find out how many crash reports there are up front so the safeguard and
+        # estimates work without paging through everything first
+        search_total = supersearch_total(
+            params, host=host, api_token=api_token, session=search_session
+        )
+        if search_total == 0:
+            console.print("[yellow]Super Search matched no crash reports.[/yellow]")
+            ctx.exit(0)
+        total = min(search_total, num_results)
+        if shard:
+            # Shards are assigned by hash, so this is an estimate
+            total = math.ceil(total / shard[1])
+        console.print(f"Super Search matched {search_total:,} crash reports.")
+
+        # The next page of search results is fetched while groups are submitted
+        to_process = parse_crash_ids(
+            supersearch_crash_ids(
+                params,
+                num_results=num_results,
+                host=host,
+                api_token=api_token,
+                session=search_session,
+            )
+        )
+
+    else:
+        to_process = parse_crash_ids(iter_lines(crashids, input_fp))
 
-    if len(to_process) > 10000 and not allow_many:
+        # If crash ids came from the command line, we know how many there are.
+        # Otherwise, they're streamed in and we only read ahead as far as we
+        # need to in order to enforce the 10,000 crash ids safeguard.
+        if crashids:
+            to_process = list(to_process)
+            total = len(to_process)
+        elif not allow_many:
+            lookahead = list(islice(to_process, MANY_CRASH_IDS + 1))
+            if len(lookahead) <= MANY_CRASH_IDS:
+                total = len(lookahead)
+            else:
+                total = None
+            to_process = chain(lookahead, to_process)
+        else:
+            total = None
+
+    if not allow_many and (total is None or total > MANY_CRASH_IDS):
         console.print(
             "[yellow]You are trying to reprocess more than 10,000 crash reports "
             + "at once.[/yellow]"
@@ -153,41 +848,159 @@ def reprocess(ctx, host, sleep, ruleset, allow_many, color, dotenv, crashids):
         console.print("[yellow]Use --allow-many argument to reprocess.[/yellow]")
         ctx.exit(1)
 
-    start_time = time.time()
+    to_process = peekable(to_process)
+    if ledger and total is not None and not supersearch_url:
+        console.print(
+            f"Ledger: {already_submitted:,} crash ids already submitted; "
+            + f"{total:,} left."
+        )
+    if not to_process and already_submitted:
+        console.print("[bold green]Done![/bold green]")
+        ctx.exit(0)
+    if not to_process:
+        raise click.BadParameter(
+            message="No crashids specified.",
+            ctx=ctx,
+            param="crashids",
+            param_hint="crashids",
+        )
 
-    groups = list(chunked(to_process, CHUNK_SIZE))
-    for i, group in enumerate(groups):
-        if i > 0:
-            # NOTE(willkg): We sleep here because the webapp has a bunch of rate
-            # limiting and we don't want to trigger that. It'd be nice if we didn't
-            # have to do this.
-            time.sleep(sleep)
-
-        last_crashid = group[-1]
-        this_group = i + 1
-        total_groups = len(groups)
-
-        # Calculate a running estimate, but only after 5 groups when it starts
-        # to stabilize
-        if i < 5:
-            estimate = ""
-        else:
-            seconds_per_group = int((time.time() - start_time) / (this_group + 1))
-            estimate = str(
-                timedelta(seconds=seconds_per_group * (len(groups) - this_group + 1))
-            )
+    # All groups are submitted over one session so they share a connection
+    session = session_with_retries()
+    pacer = None
+    if pacing == "adaptive":
+        pacer = AIMDPacer(min_rate=min_rate, max_rate=max_rate)
+        session.hooks["response"].append(pacer.record_response)
+        pacing_text = f"at {min_rate:,g} to {max_rate:,g} crashes/s"
+    else:
+        pacing_text = f"sleeping {sleep} seconds between groups"
 
+    if chunk_size == "auto":
+        sizer = BatchSizer(overhead=0 if pacer else sleep)
+        initial_chunk_size = sizer.size
+    else:
+        initial_chunk_size = chunk_size
+
+    if total is not None:
         console.print(
-            (
-                f"Processing group ending with {last_crashid} ... "
-                + f"({this_group}/{total_groups}) {estimate}"
-            ).strip()
+            f"[bold green]Reprocessing {total:,} crashes {pacing_text}...[/bold green]"
         )
+        if pacer:
+            fastest = timedelta(seconds=int(total / max_rate))
+            slowest = timedelta(seconds=int(total / min_rate))
+            console.print(f"[bold green]Rough estimate: {fastest} to {slowest}")
+        else:
+            estimate = timedelta(
+                seconds=int(total / initial_chunk_size * (sleep + 0.5))
+            )
+            console.print(f"[bold green]Rough estimate: {estimate}")
+        if sizer:
+            # Group sizes change, so we don't know how many groups there will be
+            total_groups = None
+        else:
+            total_groups = math.ceil(total / chunk_size)
+    else:
+        console.print(f"[bold green]Reprocessing crashes {pacing_text}...[/bold green]")
+        total_groups = None
+
+    start_time = time.time()
+    processed = 0
+
+    def paced_groups():
+        """Generates groups of crash ids, pacing them and printing progress
+
+        This runs in this thread as groups are pulled for submitting.
+
+        """
+        nonlocal processed
+
+        items = iter(to_process)
+        for i in count():
+            group = list(islice(items, sizer.size if sizer else chunk_size))
+            if not group:
+                return
+
+            if i > 0:
+                # NOTE(willkg): We sleep here because the webapp has a bunch of
+                # rate limiting and we don't want to trigger that. It'd be nice if
+                # we didn't have to do this.
+                if pacer:
+                    time.sleep(pacer.delay(len(group)))
+                else:
+                    time.sleep(sleep)
+
+            last_crashid = group[-1]
+            this_group = i + 1
+
+            # Calculate a running estimate from the measured rate, but only after
+            # 5 groups when it starts to stabilize
+            elapsed = time.time() - start_time
+            rate = processed / elapsed if elapsed else 0
+            if i < 5:
+                progress = ""
+            elif total is not None:
+                seconds_left = (total - processed) / rate if rate else 0
+                progress = str(timedelta(seconds=int(seconds_left)))
+            else:
+                # We don't know the total, so all we can show is the rate
+                progress = f"{rate:,.1f} crashes/s"
 
-        if ruleset:
-            group = [f"{crashid}:{ruleset}" for crashid in group]
+            if total_groups is not None:
+                counter = f"{this_group}/{total_groups}"
+            else:
+                counter = f"{this_group}"
 
-        resp = http_post(url, data={"crash_ids": group}, api_token=api_token)
+            if sizer:
+                progress = f"{progress} (group size: {len(group)})".strip()
+            if pacer:
+                progress = f"{progress} (pacing: {pacer.rate:,.1f} crashes/s)".strip()
+
+            console.print(
+                (
+                    f"Processing group ending with {last_crashid} ... "
+                    + f"({counter}) {progress}"
+                ).strip()
+            )
+
+            processed += len(group)
+            yield group
+
+    submit = partial(
+        submit_group,
+        url,
+        api_token=api_token,
+        session=session,
+        ruleset=ruleset,
+        pacer=pacer,
+        sleep=sleep,
+        sizer=sizer,
+        console=console,
+    )
+
+    failed_groups = 0
+    failed_crashes = 0
+    # Reservoir sample of (crash id, submitted datetime) for --wait
+    sample = []
+    submitted = 0
+    results = imap_bounded(
+        submit, paced_groups(), workers=concurrency, max_in_flight=concurrency
+    )
+    for result in chain.from_iterable(results):
+        if ledger:
+            ledger.add_many(
+                result["group"], "failed" if result["error"] else "accepted"
+            )
+
+        if result["error"]:
+            console.print(
+                f"[red]Failed to submit group ending with {result['group'][-1]}: "
+                + f"{result['error']}[/red]"
+            )
+            failed_groups += 1
+            failed_crashes += len(result["group"])
+            continue
+
+        resp = result["resp"]
         if resp.status_code != 200:
             console.print(
                 "[yellow]Got back non-200 status code: "
@@ -195,6 +1008,59 @@ def reprocess(ctx, host, sleep, ruleset, allow_many, color, dotenv, crashids):
             )
             continue
 
+        if wait:
+            submitted_at = result["submitted_at"]
+            for crashid in result["group"]:
+                submitted += 1
+                if len(sample) < wait_sample:
+                    sample.append((crashid, submitted_at))
+                else:
+                    index = random.randrange(submitted)
+                    if index < wait_sample:
+                        sample[index] = (crashid, submitted_at)
+
+    if ledger:
+        ledger.close()
+        if total is None or supersearch_url:
+            console.print(
+                f"Ledger: skipped {already_submitted:,} crash ids already submitted."
+            )
+
+    timed_out = False
+    if sample:
+        console.print(
+            f"[bold green]Waiting for {len(sample):,} sampled crashes to be "
+            + "reprocessed...[/bold green]"
+        )
+        timed_out = not wait_for_reprocessing(
+            sample,
+            submitted=submitted,
+            start_time=start_time,
+            interval=wait_interval,
+            timeout=wait_timeout,
+            host=host,
+            api_token=api_token,
+            session=session,
+            console=console,
+        )
+        if timed_out:
+            console.print("[red]Timed out waiting for crashes to be reprocessed.[/red]")
+
+    if failed_groups:
+        console.print(
+            f"[red]Failed to submit {failed_crashes:,} crashes in "
+            + f"{failed_groups:,} groups.[/red]"
+        )
+        if ledger:
+            console.print(
+                f"[red]List failed crash ids with: reprocess --ledger={ledger_path} "
+                + "--list-failed[/red]"
+            )
+        ctx.exit(1)
+
+    if timed_out:
+        ctx.exit(1)
+
     console.print("[bold green]Done![/bold green]")
 
 
@@ -5,7 +5,6 @@
 import json
 import logging
 import os
-from urllib.parse import urlparse, parse_qs
 
 import click
 from dotenv import load_dotenv
@@ -17,6 +16,7 @@ from crashstats_tools.utils import (
     ConsoleLogger,
     DEFAULT_HOST,
     escape_whitespace,
+    extract_supersearch_params,
     INFINITY,
     MissingField,
     parse_args,
@@ -26,20 +26,6 @@ from crashstats_tools.utils import (
 )
 
 
-def extract_supersearch_params(url):
-    """Parses out params from the query string and drops any aggs-related ones."""
-    parsed = urlparse(url)
-    params = parse_qs(parsed.query)
-
-    # Remove any aggs
-    aggs_keys = ("_facets", "_aggs", "_histogram", "_cardinality")
-    for key in list(params.keys()):
-        if key.startswith(aggs_keys):
-            del params[key]
-
-    return params
-
-
 @click.command(
     name="supersearch",
     context_settings={
@@ -2,10 +2,20 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from array import array
+import contextlib
 import datetime
+import functools
+import hashlib
+from itertools import repeat
 import json
 import logging
+import math
+import operator
 import os
+import re
+import sys
+import threading
 from urllib.parse import urlparse, parse_qs
 
 import click
@@ -13,18 +23,29 @@ from dotenv import load_dotenv
 from rich.console import Console
 from rich.table import Table
 from rich import box
+import requests
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
 
 from crashstats_tools.libcrashstats import supersearch_facet
 from crashstats_tools.utils import (
+    BadAPIToken,
+    BadRequest,
     ConsoleLogger,
     DEFAULT_HOST,
+    imap_bounded,
     parse_args,
     parse_relative_date,
     sanitize_text,
+    session_with_retries,
     tableize_csv,
     tableize_markdown,
     tableize_tab,
     thing_to_key,
+    write_atomically,
 )
 
 
@@ -49,16 +70,538 @@ def extract_supersearch_params(url):
     return params
 
 
+# Super Search params for aggregations
+AGGS_KEYS = ("_facets", "_aggs", "_histogram", "_cardinality")
+
+# Number of terms Super Search returns for a facet when _facets_size isn't
+# specified
+FACETS_SIZE_DEFAULT = 50
+
+# Maximum number of date range slices to query at once
+SLICE_WORKERS = 4
+
+# Default for how far back from now facet data can still change
+CACHE_HORIZON_DEFAULT = "2d"
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def split_date_range(start_date, end_date, slices):
+    """Splits a date range into slices of whole days
+
+    :arg start_date: start of the range (inclusive) as "YYYY-MM-DD HH:MM:SS"
+    :arg end_date: end of the range (exclusive) as "YYYY-MM-DD HH:MM:SS"
+    :arg slices: number of slices to split the range into; if the range has
+        fewer days than this or this is None, there's one slice per day
+
+    :returns: list of (start_date, end_date) tuples of strings
+
+    :raises ValueError: if the dates can't be parsed
+
+    """
+    start = datetime.datetime.strptime(start_date, DATETIME_FORMAT)
+    end = datetime.datetime.strptime(end_date, DATETIME_FORMAT)
+    days = max(math.ceil((end - start) / datetime.timedelta(days=1)), 1)
+    slices = days if slices is None else min(slices, days)
+
+    boundaries = [
+        start + datetime.timedelta(days=days * i // slices) for i in range(slices)
+    ]
+    boundaries.append(end)
+    return [
+        (
+            boundaries[i].strftime(DATETIME_FORMAT),
+            boundaries[i + 1].strftime(DATETIME_FORMAT),
+        )
+        for i in range(slices)
+    ]
+
+
+def get_facets_size(params):
+    """Returns the number of terms Super Search returns for a facet
+
+    :arg params: Super Search params
+
+    :returns: the ``_facets_size`` as an int
+
+    """
+    facets_size = params.get("_facets_size", FACETS_SIZE_DEFAULT)
+    if isinstance(facets_size, (list, tuple)):
+        facets_size = facets_size[0]
+    return int(facets_size)
+
+
+def merge_facets(facets_list, facets_size=FACETS_SIZE_DEFAULT):
+    """Merges facets from several Super Search responses
+
+    Counts for the same term are summed and nested facets for the same term are
+    merged. Histogram buckets are concatenated and sorted by term; other terms
+    are sorted by count and truncated to facets_size so the merged facets have
+    the same shape as the facets from a single query. Terms with the same count
+    stay in the order they first appear in facets_list.
+
+    Cardinalities can't be merged exactly--the cardinalities for two slices of
+    data can have values in common. Cardinalities for the same thing are summed
+    and flagged as approximate.
+
+    Super Search only returns the top facets_size terms for each slice. If a
+    slice returned that many, terms that didn't make its top terms aren't
+    counted, so merged counts can be undercounts and terms can be missing.
+    Those are flagged as approximate, too.
+
+    :arg facets_list: list of "facets" values from Super Search responses
+    :arg facets_size: maximum number of terms for each facet
+
+    :returns: tuple of (merged facets, set of the kinds of values that are
+        approximate: "cardinality" and "terms")
+
+    """
+    approximate = set()
+    # Map of key -> {"value": value} for cardinalities or map of term ->
+    # bucket for everything else
+    merged = {}
+    # Map of (key, term) -> list of nested facets to merge
+    nested = {}
+    for facets in facets_list:
+        for key, term_counts in facets.items():
+            if key.startswith("cardinality"):
+                if key in merged:
+                    merged[key]["value"] += term_counts["value"]
+                    approximate.add("cardinality")
+                else:
+                    merged[key] = {"value": term_counts["value"]}
+                continue
+
+            if (
+                len(facets_list) > 1
+                and not key.startswith("histogram")
+                and 0 < facets_size <= len(term_counts)
+            ):
+                approximate.add("terms")
+
+            buckets = merged.setdefault(key, {})
+            for item in term_counts:
+                term = item["term"]
+                bucket = buckets.get(term)
+                if bucket is None:
+                    bucket = buckets[term] = {"term": term, "count": 0}
+                bucket["count"] += item["count"]
+                if "facets" in item:
+                    nested.setdefault((key, term), []).append(item["facets"])
+
+    result = {}
+    for key, value in merged.items():
+        if key.startswith("cardinality"):
+            result[key] = value
+            continue
+
+        if key.startswith("histogram"):
+            buckets = sorted(value.values(), key=lambda item: item["term"])
+        else:
+            buckets = sorted(
+                value.values(), key=lambda item: item["count"], reverse=True
+            )[:facets_size]
+
+        for bucket in buckets:
+            if (key, bucket["term"]) in nested:
+                bucket["facets"], nested_approximate = merge_facets(
+                    nested[key, bucket["term"]], facets_size=facets_size
+                )
+                approximate |= nested_approximate
+        result[key] = buckets
+
+    return result, approximate
+
+
+# Map of kind of approximate value -> warning
+APPROXIMATE_WARNINGS = {
+    "cardinality": "Cardinalities are summed across slices, so they're upper bounds.",
+    "terms": (
+        "Some slices returned a full --_facets_size list of terms, so term counts "
+        + "can be undercounts and terms can be missing. Use a bigger "
+        + "--_facets_size or fewer slices."
+    ),
+}
+
+
+def print_approximate_warnings(console, approximate):
+    """Prints warnings for approximate values from merging slices
+
+    :arg console: rich Console to print to
+    :arg approximate: set of the kinds of values that are approximate
+
+    """
+    for kind in sorted(approximate):
+        console.print(f"[yellow]{APPROXIMATE_WARNINGS[kind]}[/yellow]")
+
+
+class FacetCache:
+    """Directory of cached Super Search facet responses
+
+    Responses are stored as JSON files named by a hash of the host and the
+    normalized params including the date range. Only responses for date ranges
+    that end before the horizon are cached. Data newer than that can still
+    change as crash reports are collected and processed.
+
+    :arg path: path to the cache directory; it's created if it doesn't exist
+    :arg horizon: timedelta; date ranges that end less than this long ago
+        aren't cached
+
+    """
+
+    def __init__(self, path, horizon):
+        self.path = path
+        self.horizon = horizon
+        # Number of slices that came from the cache and that were queried
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, end_date):
+        """Returns whether a date range ending on end_date can be cached
+
+        :arg end_date: end of the date range as "YYYY-MM-DD HH:MM:SS"
+
+        """
+        end = datetime.datetime.strptime(end_date, DATETIME_FORMAT)
+        return end <= datetime.datetime.now() - self.horizon
+
+    def key(self, host, params):
+        """Returns the cache key for a query
+
+        Param values are normalized to lists of strings so the same query
+        has the same key no matter how it was specified.
+
+        """
+        normalized = {
+            name: [str(item) for item in value]
+            if isinstance(value, (list, tuple))
+            else [str(value)]
+            for name, value in params.items()
+        }
+        data = json.dumps([host, normalized], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def record(self, cached):
+        """Counts a slice as having come from the cache or not"""
+        with self._lock:
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Returns the cached payload for key or None"""
+        fn = os.path.join(self.path, f"{key}.json")
+        try:
+            with open(fn, "rb") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, payload):
+        """Caches the payload for key"""
+        fn = os.path.join(self.path, f"{key}.json")
+        write_atomically(fn, json.dumps(payload).encode("utf-8"))
+
+
+def supersearch_facet_sliced(
+    params,
+    start_date,
+    end_date,
+    slices,
+    api_token=None,
+    host=DEFAULT_HOST,
+    logger=None,
+    cache=None,
+    session=None,
+):
+    """Splits the date range into slices, queries them concurrently, and merges
+    the results
+
+    :arg params: dict of super search parameters without "date"
+    :arg start_date: start of the range (inclusive) as "YYYY-MM-DD HH:MM:SS"
+    :arg end_date: end of the range (exclusive) as "YYYY-MM-DD HH:MM:SS"
+    :arg slices: number of slices to split the date range into or None for one
+        slice per day
+    :arg api_token: the API token to use or None
+    :arg host: the host to query
+    :arg logger: logger to use for debug logging
+    :arg cache: ``FacetCache`` to get slices from and add slices to or None
+    :arg session: requests Session to use; defaults to a new session
+
+    :returns: tuple of (merged response payload, set of the kinds of values
+        that are approximate)
+
+    """
+    session = session or session_with_retries()
+
+    def fetch_slice(item):
+        i, date_range = item
+        slice_params = dict(params)
+        slice_params["date"] = [f">={date_range[0]}", f"<{date_range[1]}"]
+
+        key = None
+        if cache is not None and cache.is_cacheable(date_range[1]):
+            key = cache.key(host, slice_params)
+            payload = cache.get(key)
+            if payload is not None:
+                return i, payload, True
+
+        payload = supersearch_facet(
+            params=slice_params,
+            api_token=api_token,
+            host=host,
+            logger=logger,
+            session=session,
+        )
+        if key is not None:
+            cache.set(key, payload)
+        return i, payload, False
+
+    date_ranges = split_date_range(start_date, end_date, slices)
+    # Results come back in completion order, so this puts them back in slice
+    # order to keep the merge deterministic
+    payloads = [None] * len(date_ranges)
+    for i, payload, cached in imap_bounded(
+        fetch_slice,
+        enumerate(date_ranges),
+        workers=min(len(date_ranges), SLICE_WORKERS),
+    ):
+        # Drop the default signature facet before merging so it isn't merged
+        # or flagged as approximate for nothing
+        drop_default_signature_facet(payload, params)
+        payloads[i] = payload
+        if cache is not None:
+            cache.record(cached)
+
+    facets, approximate = merge_facets(
+        [payload["facets"] for payload in payloads],
+        facets_size=get_facets_size(params),
+    )
+    payload = {
+        "hits": [],
+        "total": sum(payload["total"] for payload in payloads),
+        "facets": facets,
+        "errors": [error for payload in payloads for error in payload["errors"]],
+    }
+    return payload, approximate
+
+
+def fetch_facet_data(
+    params,
+    start_date,
+    end_date,
+    slices=1,
+    cache=None,
+    api_token=None,
+    host=DEFAULT_HOST,
+    logger=None,
+    session=None,
+):
+    """Fetches facet data for a query slicing the date range if needed
+
+    :arg params: dict of super search parameters including "date"
+    :arg start_date: start of the date range in params as
+        "YYYY-MM-DD HH:MM:SS"; this is only used when slicing
+    :arg end_date: end of the date range in params as "YYYY-MM-DD HH:MM:SS";
+        this is only used when slicing
+    :arg slices: number of slices to split the date range into
+    :arg cache: ``FacetCache`` or None; if this is specified, the date range is
+        split into days
+    :arg api_token: the API token to use or None
+    :arg host: the host to query
+    :arg logger: logger to use for debug logging
+    :arg session: requests Session to use; defaults to a new session
+
+    :returns: tuple of (response payload, set of the kinds of values that are
+        approximate)
+
+    """
+    if slices > 1 or cache is not None:
+        params_without_date = dict(params)
+        del params_without_date["date"]
+        return supersearch_facet_sliced(
+            params=params_without_date,
+            start_date=start_date,
+            end_date=end_date,
+            # The cache works by day, so it needs one slice per day
+            slices=None if cache is not None else slices,
+            api_token=api_token,
+            host=host,
+            logger=logger,
+            cache=cache,
+            session=session,
+        )
+
+    payload = supersearch_facet(
+        params=params,
+        api_token=api_token,
+        host=host,
+        logger=logger,
+        session=session,
+    )
+    return payload, set()
+
+
+# Maximum number of batch queries to run at once
+BATCH_WORKERS = 4
+
+QUERY_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Map of format -> file extension for batch output files
+OUTPUT_EXTENSIONS = {
+    "table": "txt",
+    "tab": "tsv",
+    "csv": "csv",
+    "markdown": "md",
+    "json": "json",
+    "raw": "json",
+}
+
+
+def load_batch(path):
+    """Loads named queries from a TOML file
+
+    Each query is a table under "queries" mapping Super Search fields to a
+    value or list of values. Values can be strings, numbers, or booleans. For
+    example::
+
+        [queries.firefox]
+        product = "Firefox"
+        _facets = ["version", "release_channel"]
+
+    :arg path: path to the TOML file
+
+    :returns: dict of query name -> params dict
+
+    :raises OSError: if the file can't be read
+    :raises ValueError: if the file isn't valid
+
+    """
+    with open(path, "rb") as fp:
+        data = tomllib.load(fp)
+
+    queries = data.get("queries")
+    if not isinstance(queries, dict) or not queries:
+        raise ValueError(f"{path} has no queries")
+
+    batch = {}
+    for name, query in queries.items():
+        if not QUERY_NAME_RE.match(name):
+            raise ValueError(
+                f"{name!r} is not a valid query name; use letters, numbers, "
+                + "'_', '-', and '.'"
+            )
+        if not isinstance(query, dict):
+            raise ValueError(f"query {name!r} is not a table")
+
+        params = {}
+        for field, value in query.items():
+            values = value if isinstance(value, list) else [value]
+            params[field] = [toml_value_to_param(name, field, item) for item in values]
+        batch[name] = params
+
+    return batch
+
+
+def toml_value_to_param(name, field, value):
+    """Converts a value from a batch file to a Super Search param value
+
+    :arg name: the query name; this is used in error messages
+    :arg field: the Super Search field; this is used in error messages
+    :arg value: the value from the TOML file
+
+    :returns: the value as a string
+
+    :raises ValueError: if the value isn't a string, number, or boolean
+
+    """
+    # Check bool before int because bools are ints
+    if isinstance(value, bool):
+        # Super Search wants lowercase booleans like the url would have
+        return "true" if value else "false"
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    raise ValueError(
+        f"query {name!r} field {field!r} has a {type(value).__name__} value; "
+        + "values must be strings, numbers, or booleans"
+    )
+
+
+class HistogramTable:
+    """Dense matrix of counts for one field of a histogram
+
+    Rows are the histogram terms (usually dates) in sorted order. Columns are
+    the terms of the field and "total". Each column is an ``array`` of counts
+    with a value for every row, so derived columns are computed a column at a
+    time.
+
+    :arg facet_name: the histogram facet name; this is the header for the row
+        keys
+    :arg row_keys: list of row keys
+
+    """
+
+    def __init__(self, facet_name, row_keys):
+        self.facet_name = facet_name
+        self.row_keys = list(row_keys)
+        self.columns = {}
+
+    def add_column(self, name, values):
+        """Adds a column
+
+        :arg name: the column name
+        :arg values: iterable of counts, one for each row
+
+        """
+        self.columns[name] = array("q", values)
+
+    def add_leftover(self):
+        """Adds a "--" column with the total minus the sum of the term columns
+
+        Tables without a "total" column, like cardinalities, are left alone.
+
+        """
+        if "total" not in self.columns:
+            return
+
+        term_columns = [
+            values
+            for name, values in self.columns.items()
+            if name not in ("--", "total")
+        ]
+        if term_columns:
+            sums = map(sum, zip(*term_columns))
+        else:
+            sums = repeat(0)
+        self.add_column("--", map(operator.sub, self.columns["total"], sums))
+
+    def to_records(self):
+        """Returns list of record dicts with columns in sorted order"""
+        names = sorted(self.columns, key=thing_to_key)
+        columns = [self.columns[name] for name in names]
+        return [
+            {self.facet_name: row_key, **dict(zip(names, values))}
+            for row_key, values in zip(self.row_keys, zip(*columns))
+        ]
+
+
 def convert_histogram_data(facet_name, facet_data):
-    """Converts histogram facet data into records
+    """Converts histogram facet data into tables
+
+    This goes through the facet data once building a column index for each
+    field. Then it fills in preallocated columns where rows that don't have a
+    value for a column are 0.
 
     :arg facet_name: the facet name
     :arg facet_data: the facet results from the response payload
 
-    :returns: a map of facet_name -> list of record dicts
+    :returns: a map of field_name -> ``HistogramTable``
 
     """
-    # Map of field_name -> (map of date -> (map of term -> count))
+    # Map of field_name -> (map of column -> index, map of row_term -> list of
+    # (index, value) pairs)
     facet_tables = {}
     for row in facet_data:
         row_term = row["term"]
@@ -67,44 +610,106 @@ def convert_histogram_data(facet_name, facet_data):
             # date portion
             row_term = row_term[:10]
         total = row["count"]
-        records = {}
         for field_name, field_data in row["facets"].items():
+            table = facet_tables.get(field_name)
+            if table is None:
+                table = facet_tables[field_name] = ({}, {})
+            column_index, rows = table
+
             if field_name.startswith("cardinality"):
-                records = {"value": field_data["value"]}
+                items = [("value", field_data["value"])]
             else:
-                records = {item["term"]: item["count"] for item in field_data}
-                records["total"] = total
-            facet_tables.setdefault(field_name, {})[row_term] = records
-
-    # Normalize the data--make sure table rows have all the values
-    for field_data in facet_tables.values():
-        terms = set()
-        for date_data in field_data.values():
-            terms = terms | set(date_data.keys())
-
-        for date_data in field_data.values():
-            missing_terms = terms - set(date_data.keys())
-            for missing_term in missing_terms:
-                date_data[missing_term] = 0
-
-    # Now convert it to map of field_name -> records
+                items = [(item["term"], item["count"]) for item in field_data]
+                items.append(("total", total))
+
+            cells = []
+            for column, value in items:
+                index = column_index.get(column)
+                if index is None:
+                    index = column_index[column] = len(column_index)
+                cells.append((index, value))
+            rows[row_term] = cells
+
+    # Now convert it to map of field_name -> table
     result = {}
-    for field_name, field_data in facet_tables.items():
-        keys = list(field_data.values())[0].keys()
-        headers = [facet_name] + sorted(keys, key=thing_to_key)
-
-        records = []
-        for row_key, row_data in sorted(field_data.items()):
-            row = {facet_name: row_key}
-            row.update(
-                {column: sanitize_text(row_data[column]) for column in headers[1:]}
-            )
-            records.append(row)
-        result[field_name] = records
+    for field_name, (column_index, rows) in facet_tables.items():
+        row_keys = sorted(rows)
+        columns = [array("q", [0]) * len(row_keys) for _ in column_index]
+        for row_i, row_key in enumerate(row_keys):
+            for index, value in rows[row_key]:
+                columns[index][row_i] = value
+
+        table = HistogramTable(facet_name, row_keys)
+        for column, index in column_index.items():
+            table.add_column(column, columns[index])
+        result[field_name] = table
 
     return result
 
 
+def iter_facet_records(key, term_counts):
+    """Walks the aggregation tree for a facet and yields records for the leaves
+
+    Nested aggregations are walked depth-first using a stack rather than
+    recursively. The key and term path prefixes for a level are built once and
+    shared by all the records under it.
+
+    Histograms aren't handled here--use ``convert_histogram_data`` for those.
+
+    :arg key: the facet key
+    :arg term_counts: the facet data for that key
+
+    :returns: generator of (key, record dict) tuples
+
+    """
+    if key.startswith("cardinality"):
+        # term_counts here is something like: {"value": 6}
+        #
+        # convert to {key: "value", "value": 6}
+        yield key, {key: "value", "value": term_counts["value"]}
+        return
+
+    # Stack of (key prefix, term prefix, facet key, iterator). If facet key is
+    # None, the iterator is over (key, term_counts) items of a "facets" dict;
+    # otherwise it's over the term/count buckets for that facet key.
+    stack = [("", "", key, iter(term_counts))]
+    while stack:
+        key_prefix, term_prefix, facet_key, items = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            continue
+
+        if facet_key is None:
+            sub_key, sub_term_counts = item
+            new_key = key_prefix + sub_key
+            if sub_key.startswith("cardinality"):
+                # cardinality has "value", while facets have "count" so this
+                # uses "count" to match the rest of the records for this key
+                yield (
+                    new_key,
+                    {new_key: f"{term_prefix}value", "count": sub_term_counts["value"]},
+                )
+            else:
+                stack.append((key_prefix, term_prefix, new_key, iter(sub_term_counts)))
+
+        elif "facets" in item:
+            stack.append(
+                (
+                    f"{facet_key} / ",
+                    f"{term_prefix}{item['term']} / ",
+                    None,
+                    iter(item["facets"].items()),
+                )
+            )
+
+        else:
+            term = item["term"]
+            if term_prefix:
+                term = f"{term_prefix}{term}"
+            yield facet_key, {facet_key: term, "count": item["count"]}
+
+
 def flatten_facets(facet_data):
     """Flattens facet value data.
 
@@ -118,38 +723,15 @@ def flatten_facets(facet_data):
 
     flattened_facet_data = {}
     for key, term_counts in facet_data.items():
-        if key.startswith("cardinality"):
-            # term_counts here is something like: {"value": 6}
-            #
-            # convert to [{key: "value", "value": 6}]
-            flattened_facet_data[key] = [{key: "value", "value": term_counts["value"]}]
-
-        elif key.startswith("histogram"):
+        if key.startswith("histogram"):
             flattened_facet_data[key] = convert_histogram_data(key, term_counts)
+            continue
 
-        else:
-            for term_count_item in term_counts:
-                term = term_count_item["term"]
-                count = term_count_item["count"]
-
-                if "facets" in term_count_item:
-                    term_counts_dict = flatten_facets(term_count_item["facets"])
-                    for term_key, term_data in term_counts_dict.items():
-                        new_key = f"{key} / {term_key}"
-                        for item in term_data:
-                            new_data = {
-                                new_key: f"{term} / {item[term_key]}",
-                            }
-                            # cardinality has "value", while facets have
-                            # "count" so we need to handle both here
-                            new_data["count"] = item.get("count", item.get("value"))
-                            flattened_facet_data.setdefault(new_key, []).append(
-                                new_data
-                            )
-
-                else:
-                    new_data = {key: term, "count": count}
-                    flattened_facet_data.setdefault(key, []).append(new_data)
+        for new_key, record in iter_facet_records(key, term_counts):
+            records = flattened_facet_data.get(new_key)
+            if records is None:
+                records = flattened_facet_data[new_key] = []
+            records.append(record)
 
     return flattened_facet_data
 
@@ -179,41 +761,94 @@ DATE_TEMPLATES = [
 ]
 
 
-def is_weekend(value):
-    """Denotes whether this date is a weekend.
+@functools.lru_cache(maxsize=1024)
+def parse_date(value):
+    """Parses a date/datetime string
 
-    :arg value: a string value representing a date/datetime
+    Results are memoized since tables repeat the same values a lot.
 
-    :returns: whether or not this is a weekend
+    :arg value: a string value that might be a date/datetime
+
+    :returns: a datetime or None if it's not a date/datetime
 
     """
     for template in DATE_TEMPLATES:
         try:
-            dt = datetime.datetime.strptime(value, template)
-            return dt.weekday() in [5, 6]
+            return datetime.datetime.strptime(value, template)
         except ValueError:
             continue
-    return False
+    return None
+
 
+def is_weekend(value):
+    """Denotes whether this date is a weekend.
 
-def fix_value(value, denote_weekends=False):
+    :arg value: a string value representing a date/datetime
+
+    :returns: whether or not this is a weekend
+
+    """
+    dt = parse_date(value)
+    return dt is not None and dt.weekday() in [5, 6]
+
+
+COLUMN_NUMERIC = "numeric"
+COLUMN_DATE = "date"
+COLUMN_TEXT = "text"
+
+
+def detect_column_type(values):
+    """Determines the type of a column of values
+
+    :arg values: list of values in the column
+
+    :returns: ``COLUMN_NUMERIC`` if all the values are numbers,
+        ``COLUMN_DATE`` if the first value is a date/datetime, and
+        ``COLUMN_TEXT`` otherwise
+
+    """
+    if all(isinstance(value, (int, float)) for value in values):
+        return COLUMN_NUMERIC
+    if values and isinstance(values[0], str) and parse_date(values[0]) is not None:
+        return COLUMN_DATE
+    return COLUMN_TEXT
+
+
+def fix_value(value, denote_weekends=False, column_type=None):
     """Sanitizes text and adds ``**`` if it's a weekend if specified
 
     :arg value: the text to operate on
     :arg denote_weekends: whether or not to denote weekend if the item is a
         date/datetime and it's a weekend
+    :arg column_type: the type of the column the value is in from
+        ``detect_column_type``; numeric values skip sanitizing and only values
+        in date columns are checked for weekends; if None, the value is
+        treated as text that might be a date
 
     :returns: the final value
 
     """
+    if column_type == COLUMN_NUMERIC:
+        return str(value)
+
     value = sanitize_text(str(value))
-    if denote_weekends and isinstance(value, str) and is_weekend(value):
+    if (
+        denote_weekends
+        and column_type in (None, COLUMN_DATE)
+        and isinstance(value, str)
+        and is_weekend(value)
+    ):
         return f"{value} **"
 
     return value
 
 
-def print_table(console, format_type, denote_weekends, facet_name, records):
+def print_table(
+    console, format_type, denote_weekends, facet_name, records, headers=None
+):
+    if isinstance(records, HistogramTable):
+        records = records.to_records()
+
     if isinstance(records, dict):
         for sub_facet_name, sub_records in records.items():
             print_table(
@@ -225,14 +860,24 @@ def print_table(console, format_type, denote_weekends, facet_name, records):
             )
         return
 
-    # Grab the first record keys, take out the facet_name, sort, and then
-    # add the facet_name first
-    headers = list(records[0].keys())
-    headers.remove(facet_name[0])
-    headers = [facet_name[0]] + sorted(headers, key=thing_to_key)
+    if headers is None:
+        # Grab the first record keys, take out the facet_name, sort, and then
+        # add the facet_name first
+        headers = list(records[0].keys())
+        headers.remove(facet_name[0])
+        headers = [facet_name[0]] + sorted(headers, key=thing_to_key)
+
+    # Figure out column types once for the table rather than per value
+    column_types = {
+        header: detect_column_type([record.get(header) for record in records])
+        for header in headers
+    }
 
     records = [
-        {key: fix_value(val, denote_weekends) for key, val in record.items()}
+        {
+            key: fix_value(val, denote_weekends, column_types.get(key))
+            for key, val in record.items()
+        }
         for record in records
     ]
 
@@ -259,6 +904,448 @@ def print_table(console, format_type, denote_weekends, facet_name, records):
             console.file.write(line + "\n")
 
 
+def drop_default_signature_facet(facet_data_payload, params):
+    """Removes the "signature" facet if it wasn't asked for
+
+    The Super Search API adds a "signature" facet by default if no other
+    "_facets" are specified even when you don't want it--this removes it.
+
+    :arg facet_data_payload: the Super Search response payload
+    :arg params: the params for the query
+
+    """
+    if (
+        "signature" not in params.get("_facets", [])
+        and "signature" in facet_data_payload["facets"]
+    ):
+        del facet_data_payload["facets"]["signature"]
+
+
+def prepare_facets(facet_data_payload, params, leftover_count):
+    """Flattens facets from a Super Search response and adds total records
+
+    Call ``drop_default_signature_facet`` on the payload first.
+
+    :arg facet_data_payload: the Super Search response payload
+    :arg params: the params for the query
+    :arg leftover_count: whether to add leftover counts
+
+    :returns: map of facet name -> list of records or, for histograms, map of
+        field name -> ``HistogramTable``
+
+    """
+    total = facet_data_payload["total"]
+    facets = facet_data_payload["facets"]
+
+    flattened_facets = flatten_facets(facets)
+
+    # Add leftover and total records
+    for facet_name, records in flattened_facets.items():
+        if not facet_name.startswith(("histogram", "cardinality")):
+            if leftover_count:
+                record_sum = sum(rec["count"] for rec in records)
+                records.append({facet_name: "--", "count": total - record_sum})
+
+            records.append({facet_name: "total", "count": total})
+
+        elif facet_name.startswith("histogram"):
+            if leftover_count:
+                for table in records.values():
+                    table.add_leftover()
+
+    return flattened_facets
+
+
+def print_json(console, data, compact=False):
+    """Prints data as JSON
+
+    :arg console: rich Console to print to
+    :arg data: the data to print
+    :arg compact: whether to write compact JSON directly to the console's file
+        rather than having rich parse and pretty-print it; this is much faster
+        for large payloads
+
+    """
+    if compact:
+        console.file.write(json.dumps(data, separators=(",", ":")) + "\n")
+    else:
+        console.print_json(json.dumps(data))
+
+
+@contextlib.contextmanager
+def output_console(console, output):
+    """Yields the console to print output to
+
+    :arg console: rich Console to use if there's no output file
+    :arg output: path of the file to write output to or ""
+
+    """
+    if not output:
+        yield console
+        return
+
+    with open(output, "w") as fp:
+        yield Console(file=fp, color_system=None, tab_size=None)
+
+
+def print_facet_data(
+    console,
+    facet_data_payload,
+    params,
+    format_type,
+    denote_weekends,
+    leftover_count,
+    compact=False,
+):
+    """Prints facet data from a Super Search response
+
+    :arg console: rich Console to print to
+    :arg facet_data_payload: the Super Search response payload
+    :arg params: the params for the query
+    :arg format_type: the output format
+    :arg denote_weekends: whether to denote weekends in date columns
+    :arg leftover_count: whether to add leftover counts
+    :arg compact: whether to print compact JSON for the json and raw formats
+
+    :returns: whether anything was printed
+
+    """
+    drop_default_signature_facet(facet_data_payload, params)
+
+    if format_type == "raw":
+        print_json(console, facet_data_payload, compact=compact)
+        return True
+
+    flattened_facets = prepare_facets(facet_data_payload, params, leftover_count)
+
+    if format_type == "json":
+        json_data = {
+            facet_name: (
+                {
+                    field_name: table.to_records()
+                    for field_name, table in records.items()
+                }
+                if facet_name.startswith("histogram")
+                else records
+            )
+            for facet_name, records in flattened_facets.items()
+        }
+        print_json(console, json_data, compact=compact)
+        return True
+
+    # We want to print a blank line between things, so we print a blank line
+    # before any thing that's not the first thing
+    first_thing = True
+    for facet_name, records in flattened_facets.items():
+        if not first_thing:
+            console.print()
+
+        print_table(
+            console=console,
+            format_type=format_type,
+            denote_weekends=denote_weekends,
+            facet_name=[facet_name],
+            records=records,
+        )
+        first_thing = False
+
+    return not first_thing
+
+
+COMPARE_HEADERS = ["count", "compare_count", "delta", "ratio"]
+
+
+def compare_records(
+    facet_name,
+    records,
+    other_records,
+    facets_size=FACETS_SIZE_DEFAULT,
+    other_facets_size=FACETS_SIZE_DEFAULT,
+):
+    """Joins records for a facet from two queries by term
+
+    This is a hash join. Rows are in the order of the first query followed by
+    terms only in the second query. "--" and "total" rows are last.
+
+    Super Search only returns the top facets_size terms, so a term that's in
+    the top terms for only one of the queries has a count of 0 for the other
+    query only if the other query returned fewer terms than that. Otherwise its
+    count is unknown: it's shown as "<=" the smallest count in the other
+    query's terms (or "?" for nested facets where that's not a bound) and the
+    delta and ratio are left blank.
+
+    :arg facet_name: the facet name
+    :arg records: list of records from the first query
+    :arg other_records: list of records from the second query
+    :arg facets_size: the ``_facets_size`` for the first query
+    :arg other_facets_size: the ``_facets_size`` for the second query
+
+    :returns: list of records with "count", "compare_count", "delta", and
+        "ratio"
+
+    """
+
+    def record_count(record):
+        # cardinality has "value", while facets have "count"
+        return record.get("count", record.get("value", 0))
+
+    def missing_count(term_counts, size):
+        # The count for a term that isn't in term_counts
+        if len(term_counts) < size:
+            return 0
+        if " / " in facet_name:
+            # Nested terms are cut per parent term, so the smallest count
+            # overall isn't a bound for a missing term
+            return "?"
+        return f"<={min(term_counts.values())}"
+
+    counts = {record[facet_name]: record_count(record) for record in records}
+    other_counts = {
+        record[facet_name]: record_count(record) for record in other_records
+    }
+
+    terms = list(counts)
+    terms.extend(term for term in other_counts if term not in counts)
+    # Move the leftover and total records to the end
+    summary_terms = [term for term in ("--", "total") if term in terms]
+    terms = [term for term in terms if term not in summary_terms] + summary_terms
+
+    term_counts = {
+        term: count for term, count in counts.items() if term not in summary_terms
+    }
+    other_term_counts = {
+        term: count for term, count in other_counts.items() if term not in summary_terms
+    }
+
+    joined = []
+    for term in terms:
+        count = counts.get(term)
+        if count is None:
+            count = missing_count(term_counts, facets_size)
+        other_count = other_counts.get(term)
+        if other_count is None:
+            other_count = missing_count(other_term_counts, other_facets_size)
+
+        if isinstance(count, str) or isinstance(other_count, str):
+            delta = ratio = ""
+        else:
+            delta = count - other_count
+            ratio = round(count / other_count, 2) if other_count else "-"
+
+        joined.append(
+            {
+                facet_name: term,
+                "count": count,
+                "compare_count": other_count,
+                "delta": delta,
+                "ratio": ratio,
+            }
+        )
+    return joined
+
+
+def run_compare(
+    ctx,
+    console,
+    console_err,
+    params,
+    compare_params,
+    start_date,
+    end_date,
+    compare_start_date,
+    compare_end_date,
+    slices,
+    cache,
+    api_token,
+    host,
+    logger,
+    format_type,
+    denote_weekends,
+    leftover_count,
+    compact=False,
+):
+    """Runs a query and a comparison query concurrently and prints a comparison
+    of the facets"""
+    session = session_with_retries()
+
+    def run_query(item):
+        which, query_params, query_start_date, query_end_date = item
+        payload, approximate = fetch_facet_data(
+            params=query_params,
+            start_date=query_start_date,
+            end_date=query_end_date,
+            slices=slices,
+            cache=cache,
+            api_token=api_token,
+            host=host,
+            logger=logger,
+            session=session,
+        )
+        return which, payload, approximate
+
+    queries = [
+        ("query", params, start_date, end_date),
+        ("compare", compare_params, compare_start_date, compare_end_date),
+    ]
+    payloads = {}
+    approximate = set()
+    for which, payload, query_approximate in imap_bounded(
+        run_query, queries, workers=len(queries)
+    ):
+        payloads[which] = payload
+        approximate |= query_approximate
+
+    print_approximate_warnings(console_err, approximate)
+
+    drop_default_signature_facet(payloads["query"], params)
+    drop_default_signature_facet(payloads["compare"], compare_params)
+
+    if format_type == "raw":
+        print_json(console, payloads, compact=compact)
+        return
+
+    facets = prepare_facets(payloads["query"], params, leftover_count)
+    other_facets = prepare_facets(payloads["compare"], compare_params, leftover_count)
+
+    facet_names = list(facets)
+    facet_names.extend(name for name in other_facets if name not in facets)
+    compared = {
+        facet_name: compare_records(
+            facet_name,
+            facets.get(facet_name, []),
+            other_facets.get(facet_name, []),
+            facets_size=get_facets_size(params),
+            other_facets_size=get_facets_size(compare_params),
+        )
+        for facet_name in facet_names
+    }
+
+    if not compared:
+        console_err.print("No output--something went wrong.")
+        ctx.exit(1)
+
+    if format_type == "json":
+        print_json(console, compared, compact=compact)
+        return
+
+    for i, (facet_name, records) in enumerate(compared.items()):
+        if i > 0:
+            console.print()
+
+        print_table(
+            console=console,
+            format_type=format_type,
+            denote_weekends=denote_weekends,
+            facet_name=[facet_name],
+            records=records,
+            headers=[facet_name] + COMPARE_HEADERS,
+        )
+
+
+def run_batch(
+    ctx,
+    console,
+    console_err,
+    batch_params,
+    start_date,
+    end_date,
+    slices,
+    cache,
+    api_token,
+    host,
+    logger,
+    output_dir,
+    format_type,
+    denote_weekends,
+    leftover_count,
+    compact=False,
+):
+    """Runs batch queries concurrently over one session and prints the output
+
+    Output for each query goes to its own file in output_dir or, if there's no
+    output_dir, they're all printed to the console in order.
+
+    """
+    session = session_with_retries()
+
+    def run_query(item):
+        name, query_params = item
+        try:
+            payload, approximate = fetch_facet_data(
+                params=query_params,
+                start_date=start_date,
+                end_date=end_date,
+                slices=slices,
+                cache=cache,
+                api_token=api_token,
+                host=host,
+                logger=logger,
+                session=session,
+            )
+        except (
+            BadAPIToken,
+            BadRequest,
+            ValueError,
+            requests.exceptions.RequestException,
+        ) as exc:
+            return name, None, set(), exc
+        return name, payload, approximate, None
+
+    results = {}
+    for name, payload, approximate, error in imap_bounded(
+        run_query,
+        list(batch_params.items()),
+        workers=min(len(batch_params), BATCH_WORKERS),
+    ):
+        results[name] = (payload, approximate, error)
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    any_approximate = set()
+    failed = 0
+    for i, (name, query_params) in enumerate(batch_params.items()):
+        payload, approximate, error = results[name]
+        if error is not None:
+            console_err.print(f"[red]{name}: {error}[/red]")
+            failed += 1
+            continue
+
+        any_approximate |= approximate
+        print_kwargs = {
+            "facet_data_payload": payload,
+            "params": query_params,
+            "format_type": format_type,
+            "denote_weekends": denote_weekends,
+            "leftover_count": leftover_count,
+            "compact": compact,
+        }
+        if output_dir:
+            fn = os.path.join(output_dir, f"{name}.{OUTPUT_EXTENSIONS[format_type]}")
+            with output_console(console, fn) as file_console:
+                printed = print_facet_data(console=file_console, **print_kwargs)
+            console.print(f"{name}: wrote {fn}")
+        else:
+            if i > 0:
+                console.print()
+            console.print(f"== {name} ==")
+            printed = print_facet_data(console=console, **print_kwargs)
+
+        if not printed:
+            console_err.print(f"[red]{name}: No output--something went wrong.[/red]")
+            failed += 1
+
+    if cache is not None:
+        console_err.print(
+            f"Cache: {cache.hits:,} days from cache, {cache.misses:,} days queried."
+        )
+
+    print_approximate_warnings(console_err, any_approximate)
+
+    if failed:
+        ctx.exit(1)
+
+
 @click.command(
     context_settings={
         "show_default": True,
@@ -292,6 +1379,58 @@ def print_table(console, format_type, denote_weekends, facet_name, records):
 @click.option(
     "--relative-range", default="7d", help="relative range ending on end-date"
 )
+@click.option(
+    "--slices",
+    default=1,
+    type=click.IntRange(1),
+    help=(
+        "split the date range into this many slices of whole days, query them "
+        + "concurrently, and merge the results; this helps with long date ranges "
+        + "that are slow or time out"
+    ),
+)
+@click.option(
+    "--cache-dir",
+    default="",
+    help=(
+        "directory for caching facet data by day; days that ended before the "
+        + "cache horizon are only queried once; term facets are merged from each "
+        + "day's top terms"
+    ),
+)
+@click.option(
+    "--cache-horizon",
+    default=CACHE_HORIZON_DEFAULT,
+    help=(
+        "how far back from now facet data can still change; days that ended "
+        + "less than this long ago are always queried"
+    ),
+)
+@click.option(
+    "--batch",
+    default="",
+    help=(
+        "TOML file of named queries to run concurrently; Super Search fields "
+        + "specified on the command line apply to all queries"
+    ),
+)
+@click.option(
+    "--output-dir",
+    default="",
+    help=(
+        "directory to write the output for each --batch query to; defaults to "
+        + "printing them all to stdout"
+    ),
+)
+@click.option(
+    "--compare-with",
+    default="",
+    help=(
+        "compare with another query; either a relative offset like 1w to compare "
+        + "with the date range shifted back by that much or a Super Search url "
+        + "whose filters replace the ones for this query"
+    ),
+)
 @click.option(
     "--format",
     "format_type",
@@ -302,6 +1441,19 @@ def print_table(console, format_type, denote_weekends, facet_name, records):
     ),
     help="format to print output",
 )
+@click.option(
+    "--compact/--no-compact",
+    default=False,
+    help=(
+        "for json and raw formats, print compact JSON without pretty-printing; "
+        + "this is much faster for large results"
+    ),
+)
+@click.option(
+    "--output",
+    default="",
+    help="file to write output to; defaults to stdout",
+)
 @click.option(
     "--verbose/--no-verbose", default=False, help="whether to print debugging output"
 )
@@ -341,7 +1493,15 @@ def supersearchfacet(
     end_date,
     start_date,
     relative_range,
+    slices,
+    cache_dir,
+    cache_horizon,
+    batch,
+    output_dir,
+    compare_with,
     format_type,
+    compact,
+    output,
     verbose,
     color,
     denote_weekends,
@@ -403,6 +1563,68 @@ def supersearchfacet(
 
     $ supersearchfacet --_aggs.product.version=_cardinality.install_time
 
+    Queries over long date ranges can be slow and can time out. You can split
+    the date range into slices that are queried concurrently and merged. For
+    example, this queries a year in 12 slices:
+
+    \b
+    $ supersearchfacet --_histogram.date=product --relative-range=52w \\
+        --slices=12
+
+    Counts for terms that aren't in the top terms for every slice are
+    undercounts, and cardinalities are summed across slices, so they're upper
+    bounds. supersearchfacet prints a warning when that happens.
+
+    If you run the same query repeatedly, you can cache facet data by day.
+    Days that ended before the cache horizon (default 2 days) are queried once
+    and read from the cache after that:
+
+    \b
+    $ supersearchfacet --_histogram.date=product --relative-range=90d \\
+        --cache-dir=facetcache
+
+    The cache queries one slice per day, so it works best for histograms.
+    Term counts are merged from each day's top terms, so use a bigger
+    "--_facets_size" for term facets.
+
+    You can run several queries at once with a TOML file of named queries.
+    Each query is a table under "queries" of Super Search fields and values.
+    Values can be strings, numbers, booleans, or lists of those. Super Search
+    fields specified on the command line apply to all the queries. For
+    example, with a file queries.toml:
+
+    \b
+    [queries.firefox]
+    product = "Firefox"
+    [queries.fenix]
+    product = "Fenix"
+    _facets = ["version", "release_channel"]
+
+    this runs both queries and writes output to reports/firefox.csv and
+    reports/fenix.csv:
+
+    \b
+    $ supersearchfacet --_facets=version --batch=queries.toml \\
+        --output-dir=reports --format=csv
+
+    You can compare facets with another query using ``--compare-with``. This
+    prints counts for both queries along with the delta and the ratio. Terms
+    that are only in one query's top ``--_facets_size`` terms have an unknown
+    count for the other query, which is shown as at most the smallest count in
+    its terms. For example, this compares signatures for the last week with the
+    week before:
+
+    \b
+    $ supersearchfacet --product=Firefox --_facets=signature \\
+        --compare-with=1w
+
+    For large results, ``--compact`` with the json and raw formats prints
+    compact JSON, and ``--output`` writes the output to a file:
+
+    \b
+    $ supersearchfacet --_aggs.product.version=platform --format=raw \\
+        --compact --output=aggs.json
+
     Make sure to specify at least one of ``_facets``, ``_aggs``,
     ``_histogram``, or ``_cardinality``.
 
@@ -483,6 +1705,21 @@ def supersearchfacet(
             )
             console.print("[yellow]Skipping dumps and protected data.[/yellow]")
 
+    if (slices > 1 or cache_dir) and "date" in params:
+        raise click.UsageError(
+            "--slices and --cache-dir can't be used with a date parameter; use "
+            + "--start-date and --end-date instead."
+        )
+
+    has_date_param = "date" in params
+
+    cache = None
+    if cache_dir:
+        try:
+            cache = FacetCache(cache_dir, parse_relative_date(cache_horizon))
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="--cache-horizon") from exc
+
     if "date" not in params and not start_date:
         try:
             range_timedelta = parse_relative_date(relative_range)
@@ -503,7 +1740,22 @@ def supersearchfacet(
     if verbose:
         console.print(f"Params: {params}")
 
+    if slices > 1 or cache is not None:
+        # Make sure the date range can be sliced before querying anything
+        try:
+            split_date_range(start_date, end_date, slices=1)
+        except ValueError as exc:
+            raise click.UsageError(f"Can't slice date range: {exc}") from exc
+
+    if output and batch:
+        raise click.UsageError(
+            "--output can't be used with --batch; use --output-dir instead."
+        )
+
     if "_return_query" in params:
+        if batch:
+            raise click.UsageError("_return_query can't be used with --batch.")
+
         if not api_token:
             console.print(
                 "[red]No API token provided, so _return_query cannot be used.[/red]"
@@ -520,74 +1772,144 @@ def supersearchfacet(
         console.print(query)
         return
 
-    facet_data_payload = supersearch_facet(
+    if compare_with:
+        if batch:
+            raise click.UsageError("--compare-with can't be used with --batch.")
+        if any(key.startswith("_histogram") for key in params):
+            raise click.UsageError("--compare-with doesn't support histograms.")
+
+        if compare_with.startswith(("http://", "https://")):
+            url_params = extract_supersearch_params(compare_with)
+            if "date" in url_params and (slices > 1 or cache is not None):
+                raise click.UsageError(
+                    "--slices and --cache-dir can't be used with a --compare-with "
+                    + "url that has a date parameter."
+                )
+
+            compare_params = dict(params)
+            for key, value in url_params.items():
+                # Aggregations come from this query so both queries have the
+                # same facets
+                if not key.startswith(AGGS_KEYS):
+                    compare_params[key] = value
+            compare_start_date, compare_end_date = start_date, end_date
+
+        else:
+            try:
+                offset = parse_relative_date(compare_with)
+            except ValueError as exc:
+                raise click.BadParameter(
+                    f"{exc} Use a relative offset like 1w or a Super Search url.",
+                    param_hint="--compare-with",
+                ) from exc
+            if has_date_param:
+                raise click.UsageError(
+                    "--compare-with offsets can't be used with a date parameter; "
+                    + "use --start-date and --end-date instead."
+                )
+            try:
+                compare_start_date, compare_end_date = [
+                    (
+                        datetime.datetime.strptime(date, DATETIME_FORMAT) - offset
+                    ).strftime(DATETIME_FORMAT)
+                    for date in (start_date, end_date)
+                ]
+            except ValueError as exc:
+                raise click.UsageError(f"Can't shift date range: {exc}") from exc
+            compare_params = dict(params)
+            compare_params["date"] = [
+                f">={compare_start_date}",
+                f"<{compare_end_date}",
+            ]
+
+        with output_console(console, output) as out_console:
+            run_compare(
+                ctx=ctx,
+                console=out_console,
+                console_err=console_err,
+                params=params,
+                compare_params=compare_params,
+                start_date=start_date,
+                end_date=end_date,
+                compare_start_date=compare_start_date,
+                compare_end_date=compare_end_date,
+                slices=slices,
+                cache=cache,
+                api_token=api_token,
+                host=host,
+                logger=ConsoleLogger(console) if verbose else None,
+                format_type=format_type,
+                denote_weekends=denote_weekends,
+                leftover_count=leftover_count,
+                compact=compact,
+            )
+        return
+
+    if batch:
+        try:
+            queries = load_batch(batch)
+        except (OSError, ValueError) as exc:
+            raise click.BadParameter(str(exc), param_hint="--batch") from exc
+
+        batch_params = {}
+        for name, query_params in queries.items():
+            if (slices > 1 or cache is not None) and "date" in query_params:
+                raise click.UsageError(
+                    f"Query {name!r} has a date parameter; --slices and "
+                    + "--cache-dir can't be used with a date parameter."
+                )
+            batch_params[name] = {**params, **query_params}
+
+        run_batch(
+            ctx=ctx,
+            console=console,
+            console_err=console_err,
+            batch_params=batch_params,
+            start_date=start_date,
+            end_date=end_date,
+            slices=slices,
+            cache=cache,
+            api_token=api_token,
+            host=host,
+            logger=ConsoleLogger(console) if verbose else None,
+            output_dir=output_dir,
+            format_type=format_type,
+            denote_weekends=denote_weekends,
+            leftover_count=leftover_count,
+            compact=compact,
+        )
+        return
+
+    facet_data_payload, approximate = fetch_facet_data(
         params=params,
+        start_date=start_date,
+        end_date=end_date,
+        slices=slices,
+        cache=cache,
         api_token=api_token,
         host=host,
         logger=ConsoleLogger(console) if verbose else None,
     )
 
-    if (
-        "signature" not in params["_facets"]
-        and "signature" in facet_data_payload["facets"]
-    ):
-        # The Super Search API adds a "signature" facet by default if no other
-        # "_facets" are specified even when you don't want it--this removes it
-        del facet_data_payload["facets"]["signature"]
-
-    if format_type == "raw":
-        console.print_json(json.dumps(facet_data_payload))
-        return
-
-    total = facet_data_payload["total"]
-    facets = facet_data_payload["facets"]
-
-    flattened_facets = flatten_facets(facets)
-
-    # Add leftover and total records
-    for facet_name, records in flattened_facets.items():
-        if not facet_name.startswith(("histogram", "cardinality")):
-            if leftover_count:
-                record_sum = sum(rec["count"] for rec in records)
-                records.append({facet_name: "--", "count": total - record_sum})
-
-            records.append({facet_name: "total", "count": total})
-
-        elif facet_name.startswith("histogram"):
-            if leftover_count:
-                for _, rows in records.items():
-                    for row in rows:
-                        count = 0
-                        for key, val in row.items():
-                            if key == facet_name:
-                                continue
-                            elif key == "total":
-                                count -= int(val)
-                            else:
-                                count += int(val)
-                        row["--"] = str(count)
-
-    if format_type == "json":
-        console.print_json(json.dumps(flattened_facets))
-        return
+    if cache is not None:
+        console_err.print(
+            f"Cache: {cache.hits:,} days from cache, {cache.misses:,} days queried."
+        )
 
-    # We want to print a blank line between things, so we print a blank line
-    # before any thing that's not the first thing
-    first_thing = True
-    for facet_name, records in flattened_facets.items():
-        if not first_thing:
-            console.print()
+    print_approximate_warnings(console_err, approximate)
 
-        print_table(
-            console=console,
+    with output_console(console, output) as out_console:
+        printed = print_facet_data(
+            console=out_console,
+            facet_data_payload=facet_data_payload,
+            params=params,
             format_type=format_type,
             denote_weekends=denote_weekends,
-            facet_name=[facet_name],
-            records=records,
+            leftover_count=leftover_count,
+            compact=compact,
         )
-        first_thing = False
 
-    if first_thing:
+    if not printed:
         # This is weird--it means we didn't print any tables, so something is
         # wrong.
         console_err.print("No output--something went wrong.")
@@ -0,0 +1,168 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import click
+from rich.console import Console
+
+from crashstats_tools.utils import (
+    in_shard,
+    iter_lines,
+    Journal,
+    missing_artifacts,
+    parse_crash_id,
+    parse_shard,
+)
+
+
+@click.command(context_settings={"show_default": True})
+@click.option(
+    "--raw/--no-raw",
+    "checkraw",
+    default=True,
+    help="whether or not to check for raw crash data",
+)
+@click.option(
+    "--dumps/--no-dumps",
+    "checkdumps",
+    default=False,
+    help="whether or not to check for dumps",
+)
+@click.option(
+    "--processed/--no-processed",
+    "checkprocessed",
+    default=False,
+    help="whether or not to check for processed crash data",
+)
+@click.option(
+    "--processed-fields/--no-processed-fields",
+    "checkprocessedfields",
+    default=False,
+    help="whether or not to check for processed crash fields",
+)
+@click.option(
+    "--journal",
+    "journal_paths",
+    multiple=True,
+    help=(
+        "fetch-data journal to merge; artifacts recorded in any journal count as "
+        "complete; can be specified multiple times"
+    ),
+)
+@click.option(
+    "--shard",
+    default="",
+    help="K/N to only verify the crash ids in shard K of N",
+)
+@click.option(
+    "--input",
+    "input_fp",
+    default=None,
+    type=click.File("r"),
+    help=(
+        "file to read crash ids from, one per line; defaults to stdin when no "
+        "crash ids are specified on the command line"
+    ),
+)
+@click.option(
+    "--color/--no-color",
+    default=True,
+    help=(
+        "whether or not to colorize output; note that color is shut off "
+        "when stdout is not an interactive terminal automatically"
+    ),
+)
+@click.argument("outputdir")
+@click.argument("crash_ids", nargs=-1)
+@click.pass_context
+def verify_data(
+    ctx,
+    checkraw,
+    checkdumps,
+    checkprocessed,
+    checkprocessedfields,
+    journal_paths,
+    shard,
+    input_fp,
+    color,
+    outputdir,
+    crash_ids,
+):
+    """
+    Verifies fetch-data fetched everything for a list of crash ids.
+
+    Given one or more crash ids via command line, an input file, or stdin (one
+    per line), checks that crash data exists in the specified directory or is
+    recorded as complete in one of the specified journals.
+
+    This is helpful after splitting a large job across machines with
+    "fetch-data --shard=K/N". Merge the output directories or pass in each
+    machine's journal and verify the full list of crash ids.
+
+    Crash ids that are missing data are printed to stdout, so they can be
+    piped back into fetch-data. A summary is printed to stderr. Exits with 1
+    if anything is missing.
+
+    \b
+    $ verify-data --journal=shard1.log --journal=shard2.log crashdata \\
+        < crashids.txt | fetch-data crashdata
+    """
+    if not color:
+        console_err = Console(color_system=None, stderr=True)
+    else:
+        console_err = Console(stderr=True)
+
+    if shard:
+        try:
+            shard = parse_shard(shard)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), ctx=ctx, param_hint="--shard") from exc
+    else:
+        shard = None
+
+    artifacts = []
+    if checkraw:
+        artifacts.append("raw_crash")
+    if checkdumps:
+        artifacts.append("dumps")
+    if checkprocessed:
+        artifacts.append("processed_crash")
+    if checkprocessedfields:
+        artifacts.append("processed_crash_fields")
+
+    journals = [Journal(path, readonly=True) for path in journal_paths]
+
+    checked = 0
+    missing_count = 0
+    invalid_count = 0
+    for crash_id in iter_lines(crash_ids, input_fp):
+        try:
+            crash_id = parse_crash_id(crash_id)
+        except ValueError:
+            console_err.print(f"[yellow]{crash_id}: not a valid crash id[/yellow]")
+            invalid_count += 1
+            continue
+
+        if not in_shard(crash_id, shard):
+            continue
+
+        checked += 1
+        not_journaled = [
+            artifact
+            for artifact in artifacts
+            if not any(journal.has(crash_id, artifact) for journal in journals)
+        ]
+        if missing_artifacts(outputdir, crash_id, not_journaled):
+            missing_count += 1
+            click.echo(crash_id)
+
+    console_err.print(
+        f"Checked {checked:,} crash ids: {checked - missing_count:,} complete, "
+        + f"{missing_count:,} missing data, {invalid_count:,} not valid."
+    )
+    if missing_count:
+        ctx.exit(1)
+
+
+if __name__ == "__main__":
+    verify_data()
@@ -5,12 +5,16 @@
 from crashstats_tools.utils import (
     DEFAULT_HOST,
     http_get,
+    prefetch,
 )
 
 
 # Maximum number of results per page for super search
 MAX_PAGE = 1000
 
+# Number of bytes to read at a time when reading a dump in chunks
+DUMP_CHUNK_SIZE = 64 * 1024
+
 
 class BadRequest(Exception):
     pass
@@ -20,7 +24,7 @@ class WrongSupersearchFunction(Exception):
     pass
 
 
-def get_crash_annotations(crash_id, api_token=None, host=DEFAULT_HOST):
+def get_crash_annotations(crash_id, api_token=None, host=DEFAULT_HOST, session=None):
     """Fetches crash annotations from host for given crash_id
 
     The crash annotations from a crash report are saved as a "raw crash" in
@@ -34,6 +38,7 @@ def get_crash_annotations(crash_id, api_token=None, host=DEFAULT_HOST):
     :arg crash_id: the crash id to retrieve annotation data for
     :arg api_token: the api token to use; defaults to None
     :arg host: the host to retrieve from; defaults to DEFAULT_HOST
+    :arg session: requests Session to use; defaults to a new session
 
     :returns: annotations as a Python dict
 
@@ -42,12 +47,20 @@ def get_crash_annotations(crash_id, api_token=None, host=DEFAULT_HOST):
         url=f"{host}/api/RawCrash/",
         params={"crash_id": crash_id, "format": "meta"},
         api_token=api_token,
+        session=session,
     )
 
     return resp.json()
 
 
-def get_dump(crash_id, dump_name, api_token, host=DEFAULT_HOST):
+def get_dump(
+    crash_id,
+    dump_name,
+    api_token,
+    host=DEFAULT_HOST,
+    session=None,
+    chunk_callback=None,
+):
     """Fetches dump, memory_report, or other crash report binary for given crash_id
 
     .. Note::
@@ -65,6 +78,10 @@ def get_dump(crash_id, dump_name, api_token, host=DEFAULT_HOST):
         "dump", etc
     :arg api_token: the api token to use
     :arg host: the host to retrieve from; defaults to DEFAULT_HOST
+    :arg session: requests Session to use; defaults to a new session
+    :arg chunk_callback: function called with the size of each chunk of the
+        dump as it's read; when set, the dump is read in chunks of
+        DUMP_CHUNK_SIZE bytes so the callback can slow the download down
 
     :returns: annotations as a Python dict
 
@@ -77,12 +94,22 @@ def get_dump(crash_id, dump_name, api_token, host=DEFAULT_HOST):
             "name": dump_name,
         },
         api_token=api_token,
+        session=session,
+        stream=chunk_callback is not None,
     )
     resp.raise_for_status()
-    return resp.content
+    if chunk_callback is None:
+        return resp.content
+
+    chunks = []
+    with resp:
+        for chunk in resp.iter_content(chunk_size=DUMP_CHUNK_SIZE):
+            chunk_callback(len(chunk))
+            chunks.append(chunk)
+    return b"".join(chunks)
 
 
-def get_processed_crash(crash_id, api_token=None, host=DEFAULT_HOST):
+def get_processed_crash(crash_id, api_token=None, host=DEFAULT_HOST, session=None):
     """Fetches the processed crash from host for given crash_id
 
     .. Note::
@@ -93,6 +120,7 @@ def get_processed_crash(crash_id, api_token=None, host=DEFAULT_HOST):
     :arg crash_id: the crash id to retrieve processed crash data for
     :arg api_token: the api token to use; defaults to None
     :arg host: the host to retrieve from; defaults to DEFAULT_HOST
+    :arg session: requests Session to use; defaults to a new session
 
     :returns: processed crash data as a Python dict
 
@@ -101,13 +129,14 @@ def get_processed_crash(crash_id, api_token=None, host=DEFAULT_HOST):
         f"{host}/api/ProcessedCrash/",
         params={"crash_id": crash_id, "format": "meta"},
         api_token=api_token,
+        session=session,
     )
     resp.raise_for_status()
     return resp.json()
 
 
 def supersearch_return_query(
-    params, num_results, host=DEFAULT_HOST, api_token=None, logger=None
+    params, num_results, host=DEFAULT_HOST, api_token=None, logger=None, session=None
 ):
     """Performs search with _return_query parameter and returns elasticsearch query
 
@@ -116,6 +145,7 @@ def supersearch_return_query(
     :arg str host: the host to query
     :arg str api_token: the API token to use or None
     :arg varies logger: logger to use for printing what it's doing
+    :arg session: requests Session to use; defaults to a new session
 
     :returns: the Elasticsearch query as a Python dict
 
@@ -131,14 +161,16 @@ def supersearch_return_query(
     if logger:
         logger.debug("supersearch: url: %s, params: %r", url, params)
 
-    resp = http_get(url=url, params=params, api_token=api_token)
+    resp = http_get(url=url, params=params, api_token=api_token, session=session)
     resp.raise_for_status()
 
     # This is the Elasticsearch query that would have been executed
     return resp.json()
 
 
-def supersearch(params, num_results, host=DEFAULT_HOST, api_token=None, logger=None):
+def supersearch(
+    params, num_results, host=DEFAULT_HOST, api_token=None, logger=None, session=None
+):
     """Performs search and returns generator of result hits
 
     .. Note::
@@ -151,6 +183,7 @@ def supersearch(params, num_results, host=DEFAULT_HOST, api_token=None, logger=N
     :arg str host: the host to query
     :arg str api_token: the API token to use or None
     :arg varies logger: logger to use for printing what it's doing
+    :arg session: requests Session to use; defaults to a new session
 
     :returns: generator of crash ids
 
@@ -171,7 +204,7 @@ def supersearch(params, num_results, host=DEFAULT_HOST, api_token=None, logger=N
         if logger:
             logger.debug("supersearch: url: %s, params: %r", url, params)
 
-        resp = http_get(url=url, params=params, api_token=api_token)
+        resp = http_get(url=url, params=params, api_token=api_token, session=session)
         resp.raise_for_status()
 
         hits = resp.json()["hits"]
@@ -202,13 +235,77 @@ def supersearch(params, num_results, host=DEFAULT_HOST, api_token=None, logger=N
         )
 
 
-def supersearch_facet(params, api_token=None, host=DEFAULT_HOST, logger=None):
+def supersearch_total(
+    params, host=DEFAULT_HOST, api_token=None, logger=None, session=None
+):
+    """Returns the number of crash reports a search matches
+
+    This doesn't fetch any results, so it's a cheap way to find out how big a
+    search is before paging through it.
+
+    :arg dict params: dict of super search parameters to base the query on
+    :arg str host: the host to query
+    :arg str api_token: the API token to use or None
+    :arg varies logger: logger to use for printing what it's doing
+    :arg session: requests Session to use; defaults to a new session
+
+    :returns: total number of matching crash reports as an int
+
+    """
+    url = f"{host}/api/SuperSearch/"
+
+    params = dict(params)
+    params["_results_number"] = 0
+    params["_facets_size"] = 0
+
+    if logger:
+        logger.debug("supersearch: url: %s, params: %r", url, params)
+
+    resp = http_get(url=url, params=params, api_token=api_token, session=session)
+    resp.raise_for_status()
+    return resp.json()["total"]
+
+
+def supersearch_crash_ids(
+    params, num_results, host=DEFAULT_HOST, api_token=None, logger=None, session=None
+):
+    """Performs search and returns generator of crash ids
+
+    Pages are fetched in a background thread, so the next page is fetched while
+    the caller works on crash ids from this one. At most a page of crash ids is
+    held in memory.
+
+    :arg dict params: dict of super search parameters to base the query on
+    :arg varies num: number of results to get or INFINITY
+    :arg str host: the host to query
+    :arg str api_token: the API token to use or None
+    :arg varies logger: logger to use for printing what it's doing
+    :arg session: requests Session to use; defaults to a new session
+
+    :returns: generator of crash ids
+
+    """
+    hits = supersearch(
+        params=params,
+        num_results=num_results,
+        host=host,
+        api_token=api_token,
+        logger=logger,
+        session=session,
+    )
+    return prefetch((hit["uuid"] for hit in hits), maxsize=MAX_PAGE)
+
+
+def supersearch_facet(
+    params, api_token=None, host=DEFAULT_HOST, logger=None, session=None
+):
     """Returns super search facet data
 
     :arg str host: the host to query
     :arg dict params: dict of super search parameters to base the query on
     :arg str api_token: the API token to use or None
     :arg bool verbose: whether or not to print verbose things
+    :arg session: requests Session to use; defaults to a new session
 
     :returns: response payload as a Python dict
 
@@ -225,6 +322,7 @@ def supersearch_facet(params, api_token=None, host=DEFAULT_HOST, logger=None):
         url=url,
         params=params,
         api_token=api_token,
+        session=session,
     )
     resp.raise_for_status()
     return resp.json()
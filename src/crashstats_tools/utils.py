@@ -2,17 +2,24 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import csv
 import datetime
 from functools import total_ordering
 import inspect
 import io
+import itertools
 import json
 import os
+import queue
 import re
 import string
+import sys
+import threading
+import time
 from typing import Any, Dict, Generator, Iterable, List
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
+import zlib
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
@@ -181,6 +188,24 @@ def session_with_retries(
     return session
 
 
+def retried_statuses(resp):
+    """Returns HTTP status codes of attempts that were retried for this response
+
+    The session from ``session_with_retries`` retries some HTTP status codes
+    (429, 5xx) transparently. This digs the history of those retries out of the
+    response.
+
+    :arg resp: requests Response
+
+    :returns: list of HTTP status codes (None for connection errors)
+
+    """
+    retries = getattr(resp.raw, "retries", None)
+    if not retries:
+        return []
+    return [item.status for item in retries.history]
+
+
 class BadRequest(Exception):
     """HTTP Request is not valid."""
 
@@ -189,9 +214,13 @@ class BadAPIToken(Exception):
     """API Token is not valid."""
 
 
-def http_get(url, params, api_token=None):
+def http_get(url, params, api_token=None, session=None, stream=False):
     """Retrieve data at url with params and api_token.
 
+    :arg session: requests Session to use; defaults to a new session with retries
+    :arg stream: whether to leave the response body unread so the caller can
+        read it in chunks
+
     :raises CrashDoesNotExist:
     :raises BadAPIToken:
 
@@ -203,9 +232,9 @@ def http_get(url, params, api_token=None):
     else:
         headers = {}
 
-    session = session_with_retries()
+    session = session or session_with_retries()
 
-    resp = session.get(url, params=params, headers=headers)
+    resp = session.get(url, params=params, headers=headers, stream=stream)
 
     # Handle 403 so we can provide the user more context
     if api_token and resp.status_code == 403:
@@ -230,9 +259,11 @@ def http_get(url, params, api_token=None):
     return resp
 
 
-def http_post(url, data, api_token=None):
+def http_post(url, data, api_token=None, session=None):
     """POST data at url with api_token.
 
+    :arg session: requests Session to use; defaults to a new session with retries
+
     :raises BadAPIToken:
 
     :returns: requests Response
@@ -243,7 +274,7 @@ def http_post(url, data, api_token=None):
     else:
         headers = {}
 
-    session = session_with_retries()
+    session = session or session_with_retries()
 
     resp = session.post(url, data=data, headers=headers)
 
@@ -348,6 +379,71 @@ def parse_args(args):
     return params
 
 
+def extract_supersearch_params(url):
+    """Parses out params from the query string and drops any aggs-related ones."""
+    parsed = urlparse(url)
+    params = parse_qs(parsed.query)
+
+    # Remove any aggs
+    aggs_keys = ("_facets", "_aggs", "_histogram", "_cardinality")
+    for key in list(params.keys()):
+        if key.startswith(aggs_keys):
+            del params[key]
+
+    return params
+
+
+def parse_supersearch_options(supersearch_url, num, args):
+    """Parses options for commands that can get crash ids from Super Search
+
+    fetch-data and reprocess take ``--supersearch-url``, ``--num``, and Super
+    Search arguments in the "--field=value" form. They use
+    ignore_unknown_options, so the Super Search arguments end up mixed in with
+    their positional arguments.
+
+    :arg supersearch_url: the ``--supersearch-url`` value or ""
+    :arg num: the ``--num`` value; number of crash ids or "all"
+    :arg args: the positional arguments
+
+    :returns: (params, num_results, args) tuple of Super Search params for
+        fetching crash ids (None if there's no supersearch_url), the number of
+        crash ids to fetch, and the positional arguments minus Super Search
+        arguments
+
+    :raises InvalidArg: if Super Search arguments or ``num`` aren't valid
+
+    """
+    search_args = [item for item in args if item.startswith("--")]
+    args = [item for item in args if not item.startswith("--")]
+    if not supersearch_url:
+        if search_args:
+            raise InvalidArg(
+                f"Unknown options: {' '.join(search_args)}; Super Search arguments "
+                + "require --supersearch-url."
+            )
+        return None, None, args
+
+    if num == "all":
+        num_results = INFINITY
+    else:
+        try:
+            num_results = int(num)
+        except ValueError as exc:
+            raise InvalidArg('num needs to be an integer or "all"') from exc
+
+    params = extract_supersearch_params(supersearch_url)
+    params.update(parse_args(search_args))
+
+    # We only need crash ids
+    params["_columns"] = ["uuid"]
+    params["_facets_size"] = 0
+    if "_sort" not in params and "date" not in params:
+        # Assume the user wants the most recent crash reports
+        params["_sort"] = ["-date"]
+
+    return params, num_results, args
+
+
 CRASH_ID_RE = re.compile(
     r"""
     ^
@@ -407,6 +503,67 @@ def parse_crash_id(item):
     raise ValueError(f"Not a valid crash id: {item}")
 
 
+def parse_shard(text):
+    """Parses a shard specification of the form ``K/N``
+
+    K is the 1-based index of the shard and N is the number of shards.
+
+    :arg str text: the shard specification
+
+    :returns: (K, N) tuple of ints
+
+    :raises ValueError: if the specification isn't valid
+
+    """
+    try:
+        k, n = (int(part) for part in text.split("/"))
+    except ValueError as exc:
+        raise ValueError(f"'{text}' is not a valid shard; use K/N like 1/4") from exc
+
+    if not 1 <= k <= n:
+        raise ValueError(f"'{text}' is not a valid shard; K must be between 1 and N")
+    return k, n
+
+
+def in_shard(crash_id, shard):
+    """Returns whether a crash id belongs to a shard
+
+    This uses a stable hash of the crash id, so every process sharding the same
+    crash ids gets a disjoint subset without coordinating.
+
+    :arg str crash_id: a valid crash id
+    :arg shard: (K, N) tuple from ``parse_shard`` or None for no sharding
+
+    :returns: True if it belongs to the shard
+
+    """
+    if shard is None:
+        return True
+    k, n = shard
+    return zlib.crc32(crash_id.encode("ascii")) % n == k - 1
+
+
+def parse_size(text):
+    """Parses a size in bytes with an optional K, M, or G suffix
+
+    Suffixes are powers of 1024 and can be followed by "B". For example, "5M"
+    and "5MB" are both 5,242,880.
+
+    :arg str text: the size
+
+    :returns: size in bytes as an int
+
+    :raises ValueError: if the size isn't valid
+
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"'{text}' is not a valid size; use bytes or a suffix like 5M")
+
+    multiplier = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}[match.group(2).upper()]
+    return int(float(match.group(1)) * multiplier)
+
+
 class MissingField(Exception):
     """Denotes a missing field."""
 
@@ -525,3 +682,368 @@ def thing_to_key(item):
     if item == "total":
         return AlwaysLast()
     return item
+
+
+class CrashIdSet:
+    """Memory-compact set of crash ids
+
+    Crash ids are stored as 16-byte keys rather than 36-character strings which
+    makes a big difference when holding hundreds of thousands of them.
+
+    Crash ids must be valid crash ids.
+
+    """
+
+    def __init__(self, crash_ids=()):
+        self._keys = set()
+        for crash_id in crash_ids:
+            self.add(crash_id)
+
+    @staticmethod
+    def _key(crash_id):
+        return bytes.fromhex(crash_id.replace("-", ""))
+
+    def add(self, crash_id):
+        self._keys.add(self._key(crash_id))
+
+    def __contains__(self, crash_id):
+        return self._key(crash_id) in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        for key in self._keys:
+            text = key.hex()
+            yield (f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}")
+
+
+class Journal:
+    """Append-only log of (crash_id, tag) records
+
+    Each record is a line of the form ``CRASHID<tab>TAG``. When the journal is
+    opened, existing records are loaded into a map of tag -> CrashIdSet so
+    lookups don't touch the file system.
+
+    Partial lines left by a process that was killed mid-write are ignored.
+
+    :arg path: path to the journal file; it's created if it doesn't exist
+    :arg readonly: whether to only load records without opening the journal
+        for appending
+
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.records = {}
+
+        needs_newline = False
+        if os.path.exists(path):
+            with open(path) as fp:
+                for line in fp:
+                    if not line.endswith("\n"):
+                        needs_newline = True
+                        continue
+                    crash_id, _, tag = line.strip().partition("\t")
+                    if tag and is_crash_id_valid(crash_id):
+                        self.records.setdefault(tag, CrashIdSet()).add(crash_id)
+
+        self.fp = None
+        if not readonly:
+            self.fp = open(path, "a")
+            if needs_newline:
+                self.fp.write("\n")
+
+    def has(self, crash_id, tag):
+        """Returns whether there's a record for this crash id and tag"""
+        return tag in self.records and crash_id in self.records[tag]
+
+    def count(self, tag):
+        """Returns number of crash ids with a record for this tag"""
+        return len(self.records.get(tag, ()))
+
+    def add(self, crash_id, tags):
+        """Appends records for crash id and each tag and flushes them to disk"""
+        if not tags:
+            return
+        self.fp.write("".join(f"{crash_id}\t{tag}\n" for tag in tags))
+        self.fp.flush()
+        for tag in tags:
+            self.records.setdefault(tag, CrashIdSet()).add(crash_id)
+
+    def add_many(self, crash_ids, tag):
+        """Appends records for each crash id with tag and flushes them to disk"""
+        if not crash_ids:
+            return
+        self.fp.write("".join(f"{crash_id}\t{tag}\n" for crash_id in crash_ids))
+        self.fp.flush()
+        records = self.records.setdefault(tag, CrashIdSet())
+        for crash_id in crash_ids:
+            records.add(crash_id)
+
+    def close(self):
+        if self.fp:
+            self.fp.close()
+
+
+def create_dir_if_needed(d):
+    if not os.path.exists(d):
+        os.makedirs(d, exist_ok=True)
+
+
+def write_atomically(fn, data, fsync=False):
+    """Writes data to fn by way of a temp file in the same directory and a rename
+
+    This guarantees fn either doesn't exist or has the complete contents. A
+    killed worker never leaves a truncated file behind that would later get
+    treated as complete.
+
+    :arg fn: the final path of the file
+    :arg data: the bytes to write
+    :arg fsync: whether to fsync the file data before renaming it into place
+
+    """
+    dirname = os.path.dirname(fn)
+    create_dir_if_needed(dirname)
+    tmp_fn = os.path.join(
+        dirname,
+        f".{os.path.basename(fn)}.{os.getpid()}-{threading.get_ident()}.tmp",
+    )
+    try:
+        with open(tmp_fn, "wb") as fp:
+            fp.write(data)
+            if fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        os.replace(tmp_fn, fn)
+    except BaseException:
+        if os.path.exists(tmp_fn):
+            os.unlink(tmp_fn)
+        raise
+
+
+def missing_artifacts(outputdir, crash_id, artifacts):
+    """Returns which artifacts for a crash id are missing from outputdir
+
+    :arg outputdir: the directory fetch-data saved crash data to
+    :arg crash_id: a valid crash id
+    :arg artifacts: list of artifacts ("raw_crash", "dumps", "processed_crash")
+        to check
+
+    :returns: list of missing artifacts
+
+    """
+    missing = []
+    for artifact in artifacts:
+        if artifact == "raw_crash":
+            exists = os.path.exists(
+                os.path.join(outputdir, "raw_crash", "20" + crash_id[-6:], crash_id)
+            )
+
+        elif artifact == "dumps":
+            fn = os.path.join(outputdir, "dump_names", crash_id)
+            exists = os.path.exists(fn)
+            if exists:
+                with open(fn) as fp:
+                    dump_names = json.load(fp)
+                exists = all(
+                    os.path.exists(os.path.join(outputdir, dump_name, crash_id))
+                    for dump_name in dump_names
+                )
+
+        else:
+            exists = os.path.exists(os.path.join(outputdir, artifact, crash_id))
+
+        if not exists:
+            missing.append(artifact)
+
+    return missing
+
+
+def iter_lines(args, fp=None):
+    """Lazily yields non-empty stripped lines
+
+    Lines come from command line arguments if there are any, otherwise from the
+    open file ``fp``, otherwise from stdin if it's not an interactive terminal.
+
+    Nothing is read ahead, so this works with slow producers on the other end of
+    a pipe.
+
+    :arg args: values from the command line
+    :arg fp: open file to read from if there are no args
+
+    :returns: generator of str
+
+    """
+    if args:
+        lines = args
+    elif fp is not None:
+        lines = fp
+    elif not sys.stdin.isatty():
+        lines = sys.stdin
+    else:
+        lines = []
+
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def imap_bounded(fn, items, workers, max_in_flight=None):
+    """Lazily maps fn over items using a pool of worker threads
+
+    Unlike ``multiprocessing.Pool.imap``, items are only pulled from the
+    iterable when there's room for them, so memory stays flat no matter how
+    many items there are and work starts as soon as the first item arrives.
+
+    Results are yielded in completion order.
+
+    :arg fn: function to call on each item
+    :arg items: iterable of items
+    :arg workers: number of worker threads; 1 runs everything in this thread
+    :arg max_in_flight: maximum number of items submitted but not yet yielded;
+        defaults to twice the number of workers
+
+    :returns: generator of results
+
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for item in items:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(fn, item))
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def prefetch(iterable, maxsize):
+    """Iterates over iterable in a background thread
+
+    Items are passed through a bounded queue. This lets a slow producer (like
+    paging through Super Search results) run concurrently with whatever is
+    consuming the items while the queue size provides backpressure.
+
+    Exceptions raised by the producer are re-raised in the consumer.
+
+    :arg iterable: the iterable to produce items from
+    :arg maxsize: maximum number of items to hold in the queue
+
+    :returns: generator of items
+
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # Block until there's room in the queue or the consumer goes away
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((False, item)):
+                    return
+        except Exception as exc:
+            put((True, exc))
+            return
+        put((True, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            done, item = items.get()
+            if done:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def sort_in_windows(items, window, key=None):
+    """Sorts items within consecutive windows of items
+
+    This gives most of the locality of sorting everything while only holding
+    ``window`` items in memory, so it works on streams.
+
+    :arg items: iterable of items
+    :arg window: number of items to sort at a time; 1 or less doesn't sort
+    :arg key: key function for sorting
+
+    :returns: generator of items
+
+    """
+    if window <= 1:
+        yield from items
+        return
+
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, window))
+        if not chunk:
+            return
+        yield from sorted(chunk, key=key)
+
+
+class TokenBucket:
+    """Thread-safe token bucket for limiting a rate like bytes per second
+
+    Tokens accrue at ``rate`` per second up to ``capacity``. Consuming tokens
+    can put the bucket in debt. That lets callers debit amounts they only know
+    after the fact, like the size of a response, and then wait until the debt
+    is paid off.
+
+    :arg rate: tokens added per second
+    :arg capacity: maximum number of tokens the bucket holds; defaults to rate
+
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount, wait=True):
+        """Consumes tokens and, if the bucket is in debt, waits until it's not
+
+        :arg amount: number of tokens to consume
+        :arg wait: whether to sleep until the bucket is out of debt
+
+        :returns: number of seconds until the bucket is out of debt
+
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last) * self.rate
+            )
+            self.last = now
+            self.tokens -= amount
+            delay = max(0.0, -self.tokens / self.rate)
+
+        if wait and delay:
+            time.sleep(delay)
+        return delay
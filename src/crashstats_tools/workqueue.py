@@ -0,0 +1,206 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import socket
+import sqlite3
+import time
+
+from more_itertools import chunked
+
+
+# Number of seconds a claimed crash id is leased for before another process
+# can claim it
+LEASE_SECONDS = 300
+
+# Number of times to try a crash id before marking it failed
+MAX_ATTEMPTS = 3
+
+
+class WorkQueue:
+    """SQLite-backed queue of crash ids with leases
+
+    Any number of processes can share a queue file, either on one machine or on
+    machines sharing a file system. Each process claims a batch of crash ids
+    which leases them for ``lease_seconds``. When it's done with a crash id, it
+    marks it done or failed. Crash ids whose leases expire (because the process
+    died) and crash ids that failed go back into the pool to be claimed again
+    until they've been attempted ``max_attempts`` times.
+
+    Leases aren't renewed. If a process takes longer than ``lease_seconds`` to
+    finish a claimed crash id, another process can claim it and work on it,
+    too.
+
+    This doesn't use WAL mode because that doesn't work on network file
+    systems.
+
+    States are:
+
+    * "pending": waiting to be claimed
+    * "leased": claimed by a process; it's pending again after the lease expires
+    * "done": completed
+    * "failed": failed or had its lease expire ``max_attempts`` times
+
+    :arg path: path to the SQLite database file; it's created if it doesn't
+        exist
+    :arg lease_seconds: number of seconds a claim is leased for
+    :arg max_attempts: number of times to try a crash id before giving up
+
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        # isolation_level=None lets us manage transactions ourselves
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS work (
+                crash_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                error TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS work_state ON work (state, lease_expires)"
+        )
+
+    def enqueue(self, crash_ids, batch_size=1000):
+        """Adds crash ids to the queue
+
+        Crash ids already in the queue are left alone.
+
+        :arg crash_ids: iterable of valid crash ids
+        :arg batch_size: number of crash ids to insert per transaction
+
+        :returns: number of crash ids added
+
+        """
+        added = 0
+        for batch in chunked(crash_ids, batch_size):
+            self.conn.execute("BEGIN IMMEDIATE")
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO work (crash_id) VALUES (?)",
+                [(crash_id,) for crash_id in batch],
+            )
+            added += cursor.rowcount
+            self.conn.execute("COMMIT")
+        return added
+
+    def claim(self, count):
+        """Claims up to count crash ids
+
+        :arg count: maximum number of crash ids to claim
+
+        :returns: list of crash ids
+
+        """
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock so two processes can't claim the
+        # same crash ids
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A crash id whose lease expired ``max_attempts`` times probably
+            # kills the process working on it, so stop handing it out
+            self.conn.execute(
+                """
+                UPDATE work
+                SET state = 'failed', lease_owner = NULL, lease_expires = NULL,
+                    error = 'lease expired'
+                WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?
+                """,
+                (now, self.max_attempts),
+            )
+            crash_ids = [
+                row[0]
+                for row in self.conn.execute(
+                    """
+                    SELECT crash_id FROM work
+                    WHERE state = 'pending'
+                        OR (
+                            state = 'leased' AND lease_expires < ?
+                            AND attempts < ?
+                        )
+                    LIMIT ?
+                    """,
+                    (now, self.max_attempts, count),
+                )
+            ]
+            self.conn.executemany(
+                """
+                UPDATE work
+                SET state = 'leased', lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1
+                WHERE crash_id = ?
+                """,
+                [
+                    (self.owner, now + self.lease_seconds, crash_id)
+                    for crash_id in crash_ids
+                ],
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return crash_ids
+
+    def iter_claims(self, batch_size):
+        """Claims crash ids in batches and yields them until there are none left
+
+        :arg batch_size: number of crash ids to claim at a time
+
+        :returns: generator of crash ids
+
+        """
+        while True:
+            crash_ids = self.claim(batch_size)
+            if not crash_ids:
+                return
+            yield from crash_ids
+
+    def complete(self, crash_id):
+        """Marks a crash id as done"""
+        self.conn.execute(
+            """
+            UPDATE work SET state = 'done', lease_owner = NULL, lease_expires = NULL
+            WHERE crash_id = ?
+            """,
+            (crash_id,),
+        )
+
+    def fail(self, crash_id, error):
+        """Marks a claimed crash id as failed
+
+        If it hasn't been attempted ``max_attempts`` times, it goes back to
+        pending so it'll get retried.
+
+        """
+        self.conn.execute(
+            """
+            UPDATE work
+            SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                lease_owner = NULL, lease_expires = NULL, error = ?
+            WHERE crash_id = ? AND lease_owner = ?
+            """,
+            (self.max_attempts, error, crash_id, self.owner),
+        )
+
+    def counts(self):
+        """Returns map of state -> number of crash ids in that state"""
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for state, count in self.conn.execute(
+            "SELECT state, COUNT(*) FROM work GROUP BY state"
+        ):
+            counts[state] = count
+        return counts
+
+    def close(self):
+        self.conn.close()
@@ -4,14 +4,19 @@
 
 import hashlib
 import json
+import os
 import pathlib
+import re
+import threading
 from textwrap import dedent
 
 from click.testing import CliRunner
+import pytest
 import responses
 
 from crashstats_tools import cmd_fetch_data
-from crashstats_tools.utils import DEFAULT_HOST
+from crashstats_tools.workqueue import WorkQueue
+from crashstats_tools.utils import DEFAULT_HOST, in_shard, Journal, parse_shard
 
 
 @responses.activate
@@ -250,6 +255,181 @@ def test_fetch_dumps(tmpdir):
     assert data == minidump
 
 
+@responses.activate
+def test_fetch_dumps_with_budgets(tmpdir):
+    crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    # Big enough to be read in several chunks
+    minidump = b"abcde" * 30_000
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+
+    raw_crash = {
+        "ProductName": "Firefox",
+        "metadata": {
+            "dump_checksums": {
+                "upload_file_minidump": hashlib.sha256(minidump).hexdigest(),
+            },
+        },
+    }
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"crash_id": crash_id, "format": "meta"}
+            ),
+        ],
+        status=200,
+        json=raw_crash,
+    )
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"crash_id": crash_id, "format": "raw", "name": "dump"}
+            ),
+        ],
+        status=200,
+        body=minidump,
+    )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--dumps",
+        "--no-processed",
+        "--max-bandwidth=1M",
+        "--max-dump-workers=1",
+        "--stats-file",
+        str(tmpdir / "stats.json"),
+        str(tmpdir),
+        crash_id,
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Limiting bandwidth to 1.0 MB/s.
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching raw crash
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching dump: upload_file_minidump
+        Completed in 0:00:00.
+        """
+    )
+    data = pathlib.Path(tmpdir / "upload_file_minidump" / crash_id).read_bytes()
+    assert data == minidump
+
+    # The dump is streamed, so its bytes are counted as chunks are read
+    stats = json.loads(pathlib.Path(tmpdir / "stats.json").read_text())
+    assert stats["bytes"] == len(json.dumps(raw_crash)) + len(minidump)
+
+
+@responses.activate
+def test_dump_workers_dont_hold_up_metadata(tmpdir):
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+    minidump = b"abcde"
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    raw_crash_2_fetched = threading.Event()
+    released = []
+
+    def raw_crash_callback(request):
+        if request.params["crash_id"] == crash_id_2:
+            raw_crash_2_fetched.set()
+        raw_crash = {
+            "metadata": {
+                "dump_checksums": {
+                    "upload_file_minidump": hashlib.sha256(minidump).hexdigest(),
+                },
+            },
+        }
+        return (200, {}, json.dumps(raw_crash))
+
+    def dump_callback(request):
+        # The dump for the first crash id can't finish until the raw crash for
+        # the second one is fetched, so this only passes if fetching metadata
+        # doesn't wait on dump downloads
+        if request.params["crash_id"] == crash_id_1:
+            released.append(raw_crash_2_fetched.wait(timeout=5))
+        return (200, {}, minidump)
+
+    responses.add_callback(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"format": "meta"}, strict_match=False
+            )
+        ],
+        callback=raw_crash_callback,
+    )
+    responses.add_callback(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"format": "raw"}, strict_match=False
+            )
+        ],
+        callback=dump_callback,
+    )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--dumps",
+        "--no-processed",
+        "--max-bandwidth=1M",
+        "--max-dump-workers=1",
+        "--journal",
+        str(tmpdir / "journal.log"),
+        str(tmpdir / "data"),
+        crash_id_1,
+        crash_id_2,
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert released == [True]
+    for crash_id in (crash_id_1, crash_id_2):
+        data = pathlib.Path(
+            tmpdir / "data" / "upload_file_minidump" / crash_id
+        ).read_bytes()
+        assert data == minidump
+
+    # Crash ids are only journaled as having dumps once the dumps are written
+    journal = Journal(str(tmpdir / "journal.log"))
+    for crash_id in (crash_id_1, crash_id_2):
+        assert journal.has(crash_id, "raw_crash")
+        assert journal.has(crash_id, "dumps")
+    journal.close()
+
+
+def test_max_bandwidth_invalid(tmpdir):
+    runner = CliRunner()
+    args = ["--max-bandwidth=lots", str(tmpdir)]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 2
+    assert "'lots' is not a valid size" in result.output
+
+
 @responses.activate
 def test_fetch_processed(tmpdir):
     crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
@@ -416,15 +596,176 @@ def test_stats(tmpdir):
         json=raw_crash,
     )
 
+    stats_file = tmpdir / "stats.json"
     runner = CliRunner()
     args = [
         "--raw",
         "--no-dumps",
         "--no-processed",
         "--stats",
+        f"--stats-file={stats_file}",
+        str(tmpdir),
+        crash_id,
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0:2] == [
+        "No API token provided. Set CRASHSTATS_API_TOKEN in the environment.",
+        "Skipping dumps and protected data.",
+    ]
+    assert re.match(
+        r"Downloaded \(0/1\) 0:00:00 -- [\d,.]+ req/s, [\d,.]+ \w+/s, "
+        + r"retries: 0, 429s: 0",
+        lines[2],
+    )
+    assert re.match(r"Crash ids: 1, requests: 1 ", lines[3])
+    assert lines[4] == "Retries: 0, 429s: 0, errors: 0"
+    assert lines[5] == (
+        "Skipped: 0 already existed, 0 completed in journal, 0 duplicates"
+    )
+    assert re.match(r"RawCrash meta: 1 requests, p50: [\d.]+s, ", lines[6])
+    assert lines[7] == "Completed in 0:00:00."
+
+    data = json.loads(stats_file.read())
+    assert data["crash_ids"] == 1
+    assert data["requests"] == 1
+    assert data["bytes"] == len(json.dumps(raw_crash))
+    assert list(data["endpoints"].keys()) == ["RawCrash meta"]
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (DEFAULT_HOST + "/api/RawCrash/?crash_id=abc&format=meta", "RawCrash meta"),
+        (DEFAULT_HOST + "/api/RawCrash/?crash_id=abc&format=raw", "RawCrash raw"),
+        (DEFAULT_HOST + "/api/ProcessedCrash/?crash_id=abc", "ProcessedCrash"),
+    ],
+)
+def test_endpoint_name(url, expected):
+    assert cmd_fetch_data.endpoint_name(url) == expected
+
+
+def test_percentile():
+    values = sorted([0.5, 0.1, 0.2, 0.4, 0.3])
+    assert cmd_fetch_data.percentile(values, 50) == 0.3
+    assert cmd_fetch_data.percentile(values, 99) == 0.5
+    assert cmd_fetch_data.percentile([], 50) == 0.0
+
+
+@responses.activate
+def test_fetch_dumps_no_overwrite(tmpdir):
+    crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    minidump = b"abcde"
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+
+    raw_crash = {
+        "ProductName": "Firefox",
+        "Version": "100.0",
+        "metadata": {
+            "dump_checksums": {
+                "upload_file_minidump": hashlib.sha256(minidump).hexdigest(),
+            },
+        },
+    }
+
+    # Raw crash already exists, so it should get read from disk rather than
+    # fetched
+    raw_crash_path = pathlib.Path(tmpdir / "raw_crash" / f"20{crash_id[-6:]}")
+    raw_crash_path.mkdir(parents=True)
+    (raw_crash_path / crash_id).write_text(json.dumps(raw_crash))
+
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "crash_id": crash_id,
+                    "format": "raw",
+                    "name": "dump",
+                }
+            ),
+        ],
+        status=200,
+        body=minidump,
+    )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--dumps",
+        "--no-processed",
+        "--no-overwrite",
+        "--fsync-every=2",
         str(tmpdir),
         crash_id,
     ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching raw crash -- already exists
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching dump: upload_file_minidump
+        Completed in 0:00:00.
+        """
+    )
+    data = pathlib.Path(tmpdir / "upload_file_minidump" / crash_id).read_bytes()
+    assert data == minidump
+    data = pathlib.Path(tmpdir / "dump_names" / crash_id).read_bytes()
+    assert json.loads(data) == ["upload_file_minidump"]
+
+
+@responses.activate
+def test_journal(tmpdir):
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+    raw_crash = {
+        "ProductName": "Firefox",
+        "Version": "100.0",
+    }
+    journal_path = tmpdir / "journal.log"
+
+    # crash_id_1 was completed in a previous run
+    journal_path.write(f"{crash_id_1}\traw_crash\n")
+
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "crash_id": crash_id_2,
+                    "format": "meta",
+                }
+            )
+        ],
+        status=200,
+        json=raw_crash,
+    )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--no-dumps",
+        "--no-processed",
+        f"--journal={journal_path}",
+        str(tmpdir),
+        crash_id_1,
+        crash_id_2,
+    ]
     result = runner.invoke(
         cli=cmd_fetch_data.fetch_data,
         args=args,
@@ -435,7 +776,503 @@ def test_stats(tmpdir):
         """\
         No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
         Skipping dumps and protected data.
-        Downloaded (0/1) 0:00:00
+        Journal: 1 crash ids already completed; 1 left.
+        b4f58e9f-49be-4ba5-a203-8ef160220512: fetching raw crash
         Completed in 0:00:00.
         """
     )
+    assert journal_path.read() == (
+        f"{crash_id_1}\traw_crash\n" + f"{crash_id_2}\traw_crash\n"
+    )
+
+
+@responses.activate
+def test_queue(tmpdir):
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+    raw_crash = {
+        "ProductName": "Firefox",
+        "Version": "100.0",
+    }
+    queue_path = tmpdir / "queue.db"
+
+    for crash_id in [crash_id_1, crash_id_2]:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/RawCrash/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "crash_id": crash_id,
+                        "format": "meta",
+                    }
+                )
+            ],
+            status=200,
+            json=raw_crash,
+        )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--no-dumps",
+        "--no-processed",
+        f"--queue={queue_path}",
+        str(tmpdir / "data"),
+        crash_id_1,
+        crash_id_2,
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
+        Skipping dumps and protected data.
+        Queue: added 2 crash ids.
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching raw crash
+        b4f58e9f-49be-4ba5-a203-8ef160220512: fetching raw crash
+        Queue: 0 pending, 0 leased, 2 done, 0 failed.
+        Completed in 0:00:00.
+        """
+    )
+
+    # Running again with the same queue has nothing left to do
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
+        Skipping dumps and protected data.
+        Queue: added 0 crash ids.
+        Queue: 0 pending, 0 leased, 2 done, 0 failed.
+        Completed in 0:00:00.
+        """
+    )
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_queue_with_shard(tmpdir):
+    crash_ids = [
+        "2ac9a763-83d2-4dca-89bb-091bd0220630",
+        "b4f58e9f-49be-4ba5-a203-8ef160220512",
+        "1d55b9b8-3c2e-4f5d-8e36-b0e1f0220514",
+        "7e8a3c1a-5b7e-4a93-9c0e-2f4d8a220515",
+    ]
+    for crash_id in crash_ids:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/RawCrash/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {"crash_id": crash_id, "format": "meta"}
+                )
+            ],
+            status=200,
+            json={"ProductName": "Firefox"},
+        )
+    in_shard_1 = [
+        crash_id for crash_id in crash_ids if in_shard(crash_id, parse_shard("1/2"))
+    ]
+    # Make sure the test covers crash ids in both shards
+    assert 0 < len(in_shard_1) < len(crash_ids)
+
+    # Another process added the crash ids in shard 2 to the queue
+    queue_path = str(tmpdir / "queue.db")
+    work_queue = WorkQueue(queue_path)
+    work_queue.enqueue(
+        [crash_id for crash_id in crash_ids if crash_id not in in_shard_1]
+    )
+    work_queue.close()
+
+    # This only adds crash ids in its shard, but works on everything it claims
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=[
+            "--raw",
+            "--no-dumps",
+            "--no-processed",
+            "--shard=1/2",
+            f"--queue={queue_path}",
+            str(tmpdir / "data"),
+            *crash_ids,
+        ],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert f"Queue: added {len(in_shard_1)} crash ids." in result.output
+    assert (
+        f"Queue: 0 pending, 0 leased, {len(crash_ids)} done, 0 failed." in result.output
+    )
+    assert len(responses.calls) == len(crash_ids)
+
+
+@responses.activate
+def test_dedupe_and_sort_window(tmpdir):
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+    for crash_id in [crash_id_1, crash_id_2]:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/RawCrash/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "crash_id": crash_id,
+                        "format": "meta",
+                    }
+                )
+            ],
+            status=200,
+            json={"ProductName": "Firefox"},
+        )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--no-dumps",
+        "--no-processed",
+        "--sort-window=10",
+        str(tmpdir),
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        input=f"{crash_id_1}\n{crash_id_2}\n{crash_id_1}\n",
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    # crash_id_2 is from an earlier date, so it's fetched first
+    assert result.output == dedent(
+        """\
+        No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
+        Skipping dumps and protected data.
+        b4f58e9f-49be-4ba5-a203-8ef160220512: fetching raw crash
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching raw crash
+        Dropped 1 duplicate crash ids.
+        Completed in 0:00:00.
+        """
+    )
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_fetch_from_stdin_with_workers(tmpdir):
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [
+        "2ac9a763-83d2-4dca-89bb-091bd0220630",
+        "b4f58e9f-49be-4ba5-a203-8ef160220512",
+        "e58ec5aa-4ea1-4a2b-8b0b-2b5490220512",
+    ]
+    for crash_id in crash_ids:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/RawCrash/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "crash_id": crash_id,
+                        "format": "meta",
+                    }
+                )
+            ],
+            status=200,
+            json={"ProductName": "Firefox", "uuid": crash_id},
+        )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--no-dumps",
+        "--no-processed",
+        "--workers=2",
+        "--stats",
+        str(tmpdir),
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        input="\n".join(crash_ids) + "\n",
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0:2] == [
+        "Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx",
+        "Using 2 workers.",
+    ]
+    # The total isn't known when streaming from stdin, so stats show the rate
+    assert re.match(r"Downloaded \(0\) [\d,.]+/s -- ", lines[2])
+    assert lines[-1] == "Completed in 0:00:00."
+
+    for crash_id in crash_ids:
+        data = pathlib.Path(
+            tmpdir / "raw_crash" / f"20{crash_id[-6:]}" / crash_id
+        ).read_bytes()
+        assert json.loads(data)["uuid"] == crash_id
+
+
+@responses.activate
+def test_fetch_from_input_file(tmpdir):
+    crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    input_path = tmpdir / "crashids.txt"
+    input_path.write(f"{crash_id}\n")
+
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/RawCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "crash_id": crash_id,
+                    "format": "meta",
+                }
+            )
+        ],
+        status=200,
+        json={"ProductName": "Firefox"},
+    )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--no-dumps",
+        "--no-processed",
+        f"--input={input_path}",
+        str(tmpdir),
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
+        Skipping dumps and protected data.
+        2ac9a763-83d2-4dca-89bb-091bd0220630: fetching raw crash
+        Completed in 0:00:00.
+        """
+    )
+
+
+@responses.activate
+def test_fetch_from_supersearch(tmpdir):
+    crash_ids = [
+        "ecf15793-caa9-4af8-94b5-90c810220624",
+        "ae692700-2230-411e-95d0-3feaf0220624",
+    ]
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "product": "Firefox",
+                    "release_channel": "nightly",
+                    "_columns": "uuid",
+                    "_sort": "-date",
+                    "_results_offset": "0",
+                    "_results_number": "100",
+                    "_facets_size": "0",
+                }
+            )
+        ],
+        status=200,
+        json={
+            "hits": [{"uuid": crash_id} for crash_id in crash_ids],
+            "total": 2,
+            "facets": {},
+            "errors": [],
+        },
+    )
+    for crash_id in crash_ids:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/RawCrash/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "crash_id": crash_id,
+                        "format": "meta",
+                    }
+                )
+            ],
+            status=200,
+            json={"ProductName": "Firefox", "uuid": crash_id},
+        )
+
+    runner = CliRunner()
+    args = [
+        "--raw",
+        "--no-dumps",
+        "--no-processed",
+        "--supersearch-url=https://crash-stats.mozilla.org/search/?product=Firefox",
+        "--release_channel=nightly",
+        str(tmpdir),
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
+        Skipping dumps and protected data.
+        ecf15793-caa9-4af8-94b5-90c810220624: fetching raw crash
+        ae692700-2230-411e-95d0-3feaf0220624: fetching raw crash
+        Completed in 0:00:00.
+        """
+    )
+    for crash_id in crash_ids:
+        data = pathlib.Path(
+            tmpdir / "raw_crash" / f"20{crash_id[-6:]}" / crash_id
+        ).read_bytes()
+        assert json.loads(data)["uuid"] == crash_id
+
+
+@responses.activate
+def test_fetch_processed_fields(tmpdir):
+    crash_id_1 = "ecf15793-caa9-4af8-94b5-90c810220624"
+    crash_id_2 = "ae692700-2230-411e-95d0-3feaf0220626"
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "uuid": [crash_id_1, crash_id_2],
+                    "date": [">=2022-06-23", "<2022-06-28"],
+                    "_columns": ["uuid", "signature", "product"],
+                    "_results_offset": "0",
+                    "_results_number": "2",
+                    "_facets_size": "0",
+                }
+            )
+        ],
+        status=200,
+        json={
+            "hits": [
+                {"uuid": crash_id_1, "signature": "OOM | small", "product": "Firefox"}
+            ],
+            "total": 1,
+            "facets": {},
+            "errors": [],
+        },
+    )
+
+    runner = CliRunner()
+    args = [
+        "--no-raw",
+        "--no-dumps",
+        "--processed-fields=signature,product",
+        str(tmpdir),
+        crash_id_1,
+        crash_id_2,
+    ]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "200"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        No API token provided. Set CRASHSTATS_API_TOKEN in the environment.
+        Skipping dumps and protected data.
+        Fetching processed crash fields for 2 crashes
+        ae692700-2230-411e-95d0-3feaf0220626: fetching processed crash fields -- not found in Super Search
+        Completed in 0:00:00.
+        """
+    )
+    data = pathlib.Path(tmpdir / "processed_crash_fields" / crash_id_1).read_bytes()
+    assert json.loads(data) == {
+        "uuid": crash_id_1,
+        "signature": "OOM | small",
+        "product": "Firefox",
+    }
+    assert not os.path.exists(tmpdir / "processed_crash_fields" / crash_id_2)
+
+
+def test_processed_fields_and_processed(tmpdir):
+    runner = CliRunner()
+    args = ["--processed", "--processed-fields=signature", str(tmpdir)]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 2
+    assert "You cannot fetch processed crash fields and processed crashes." in (
+        result.output
+    )
+
+
+def test_search_args_without_supersearch_url(tmpdir):
+    runner = CliRunner()
+    args = ["--product=Firefox", str(tmpdir)]
+    result = runner.invoke(
+        cli=cmd_fetch_data.fetch_data,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 2
+    assert result.output.endswith(
+        "Error: Unknown options: --product=Firefox; Super Search arguments "
+        + "require --supersearch-url.\n"
+    )
+
+
+@pytest.mark.parametrize("shard", ["1/2", "2/2"])
+def test_shard(tmpdir, shard):
+    crash_ids = [f"00000000-0000-0000-0000-{i:06d}220630" for i in range(10)]
+    shard_crash_ids = [
+        crash_id for crash_id in crash_ids if in_shard(crash_id, parse_shard(shard))
+    ]
+
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        for crash_id in crash_ids:
+            rsps.add(
+                responses.GET,
+                DEFAULT_HOST + "/api/RawCrash/",
+                match=[
+                    responses.matchers.query_param_matcher(
+                        {
+                            "crash_id": crash_id,
+                            "format": "meta",
+                        }
+                    )
+                ],
+                status=200,
+                json={"uuid": crash_id},
+            )
+
+        runner = CliRunner()
+        args = ["--raw", f"--shard={shard}", str(tmpdir)] + crash_ids
+        result = runner.invoke(
+            cli=cmd_fetch_data.fetch_data,
+            args=args,
+            env={"COLUMNS": "100"},
+        )
+        assert result.exit_code == 0
+        assert f"Fetching shard {shard.replace('/', ' of ')}." in result.output
+
+    fetched = sorted(
+        path.name for path in pathlib.Path(tmpdir / "raw_crash" / "20220630").iterdir()
+    )
+    assert fetched == shard_crash_ids
@@ -3,15 +3,18 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import datetime
+import re
 from textwrap import dedent
 from unittest import mock
+from urllib.parse import parse_qs
 import uuid
 
 from click.testing import CliRunner
+import requests
 import responses
 
 from crashstats_tools import cmd_reprocess
-from crashstats_tools.utils import DEFAULT_HOST
+from crashstats_tools.utils import DEFAULT_HOST, in_shard, session_with_retries
 
 
 @responses.activate
@@ -234,8 +237,6 @@ def test_reprocess_tenthousand():
         """\
         Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
         Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
-        Reprocessing 10,010 crashes sleeping 1 seconds between groups...
-        Rough estimate: 0:05:00
         You are trying to reprocess more than 10,000 crash reports at once.
         Please let us know on #crashreporting on Matrix before you do this.
 
@@ -272,6 +273,54 @@ def test_reprocess_tenthousand_allowmany():
         },
     )
     assert result.exit_code == 0
+    # Crash ids are streamed from stdin, so the total isn't known and progress
+    # shows the rate
+    assert result.output.startswith(
+        dedent(
+            f"""\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
+        Reprocessing crashes sleeping 0 seconds between groups...
+        Processing group ending with {crash_ids[49]} ... (1)
+        Processing group ending with {crash_ids[99]} ... (2)
+        """
+        )
+    )
+    lines = result.output.splitlines()
+    assert re.match(
+        rf"Processing group ending with {crash_ids[10_009]} \.\.\. \(201\) [\d,.]+ crashes/s",
+        lines[-2],
+    )
+    assert lines[-1] == "Done!"
+    assert len(responses.calls) == 201
+
+
+@responses.activate
+def test_reprocess_tenthousand_allowmany_args():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [create_new_ooid() for i in range(10_010)]
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        match=[
+            responses.matchers.header_matcher({"Auth-Token": api_token}),
+            responses.matchers.urlencoded_params_matcher({"crash_ids": mock.ANY}),
+        ],
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--allow-many", "--sleep=0"] + crash_ids,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    # Crash ids are from the command line, so the total is known
     assert result.output.startswith(
         dedent(
             f"""\
@@ -294,3 +343,747 @@ def test_reprocess_tenthousand_allowmany():
         """
         )
     )
+
+
+@responses.activate
+def test_reprocess_from_input_file(tmp_path):
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    input_path = tmp_path / "crashids.txt"
+    input_path.write_text(f"{crash_id}\n\nbp-{crash_id}\nfoo\n")
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        match=[
+            responses.matchers.header_matcher({"Auth-Token": api_token}),
+        ],
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=[f"--input={input_path}"],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
+        Crash id not recognized: foo
+        Reprocessing 2 crashes sleeping 1 seconds between groups...
+        Rough estimate: 0:00:00
+        Processing group ending with 2ac9a763-83d2-4dca-89bb-091bd0220630 ... (1/1)
+        Done!
+        """
+    )
+    assert parse_qs(responses.calls[0].request.body) == {
+        "crash_ids": [crash_id, crash_id]
+    }
+
+
+@responses.activate
+def test_reprocess_shard():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [f"00000000-0000-0000-0000-{i:06d}220630" for i in range(10)]
+    shard_crash_ids = [crash_id for crash_id in crash_ids if in_shard(crash_id, (2, 3))]
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--shard=2/3"] + crash_ids,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert "Reprocessing shard 2 of 3." in result.output
+    assert parse_qs(responses.calls[0].request.body) == {"crash_ids": shard_crash_ids}
+
+
+def test_aimd_pacer():
+    pacer = cmd_reprocess.AIMDPacer(min_rate=10, max_rate=35)
+    assert pacer.rate == 10
+
+    # Fast, successful responses increase the rate additively up to max_rate
+    pacer.record([200], latency=0.1)
+    assert pacer.rate == 20
+    pacer.record([200], latency=0.1)
+    pacer.record([200], latency=0.1)
+    assert pacer.rate == 35
+
+    # 429s and 5xxs, including ones that got retried, halve the rate
+    pacer.record([429, 200], latency=0.1)
+    assert pacer.rate == 17.5
+    pacer.record([502], latency=0.1)
+    assert pacer.rate == 10
+
+    # Slow responses halve it, too, but never below min_rate
+    pacer.record([200], latency=0.1)
+    assert pacer.rate == 20
+    pacer.record([200], latency=1.0)
+    assert pacer.rate == 10
+
+    assert pacer.delay(50) == 5
+
+
+@responses.activate
+def test_reprocess_adaptive_retries():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=429,
+    )
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--pacing=adaptive", "--min-rate=100", "--max-rate=200", crash_id],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "200",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
+        Reprocessing 1 crashes at 100 to 200 crashes/s...
+        Rough estimate: 0:00:00 to 0:00:00
+        Processing group ending with 2ac9a763-83d2-4dca-89bb-091bd0220630 ... (1/1) (pacing: 100.0 crashes/s)
+        Got back HTTP 429; retrying group ending with 2ac9a763-83d2-4dca-89bb-091bd0220630 in 0.0 seconds
+        Done!
+        """
+    )
+    assert len(responses.calls) == 2
+
+
+def test_reprocess_min_rate_more_than_max_rate():
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--pacing=adaptive", "--min-rate=100", "--max-rate=10", "abc"],
+        env={
+            "CRASHSTATS_API_TOKEN": "935e136cdfe14b83abae0e0cd97b634f",
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 2
+    assert "--min-rate must be less than or equal to --max-rate." in result.output
+
+
+@responses.activate
+def test_reprocess_concurrency():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [create_new_ooid() for i in range(200)]
+
+    def reprocessing_callback(request):
+        # The group with the last crash id always fails
+        if crash_ids[-1] in parse_qs(request.body)["crash_ids"]:
+            return (500, {}, "")
+        return (200, {}, "")
+
+    responses.add_callback(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        callback=reprocessing_callback,
+    )
+
+    runner = CliRunner()
+    with mock.patch.object(cmd_reprocess, "RETRY_BACKOFF", 0):
+        result = runner.invoke(
+            cli=cmd_reprocess.reprocess,
+            args=["--concurrency=3", "--sleep=0"] + crash_ids,
+            env={
+                "CRASHSTATS_API_TOKEN": api_token,
+                "COLUMNS": "200",
+            },
+        )
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert (
+        len([line for line in lines if line.startswith("Processing group ending")]) == 4
+    )
+    assert (
+        len([line for line in lines if line.startswith("Got back HTTP 500")])
+        == cmd_reprocess.MAX_GROUP_ATTEMPTS - 1
+    )
+    assert lines[-2] == (
+        f"Failed to submit group ending with {crash_ids[-1]}: HTTP 500"
+    )
+    assert lines[-1] == "Failed to submit 50 crashes in 1 groups."
+    # 3 groups succeed and the 4th is tried MAX_GROUP_ATTEMPTS times
+    assert len(responses.calls) == 3 + cmd_reprocess.MAX_GROUP_ATTEMPTS
+
+
+@responses.activate
+def test_reprocess_concurrency_timeout(tmp_path):
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [create_new_ooid() for i in range(100)]
+    ledger_path = tmp_path / "ledger.log"
+
+    def reprocessing_callback(request):
+        # The group with the last crash id always times out
+        if crash_ids[-1] in parse_qs(request.body)["crash_ids"]:
+            raise requests.ReadTimeout("Read timed out.")
+        return (200, {}, "")
+
+    responses.add_callback(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        callback=reprocessing_callback,
+    )
+
+    runner = CliRunner()
+    with mock.patch.object(cmd_reprocess, "RETRY_BACKOFF", 0.1):
+        result = runner.invoke(
+            cli=cmd_reprocess.reprocess,
+            args=["--concurrency=2", "--sleep=0", f"--ledger={ledger_path}"]
+            + crash_ids,
+            env={
+                "CRASHSTATS_API_TOKEN": api_token,
+                "COLUMNS": "200",
+            },
+        )
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+
+    # Retries back off even though --sleep=0
+    assert [
+        line.split(" in ")[-1]
+        for line in lines
+        if line.startswith("Got back ReadTimeout")
+    ] == ["0.1 seconds", "0.2 seconds", "0.4 seconds", "0.8 seconds"]
+    assert (
+        f"Failed to submit group ending with {crash_ids[-1]}: "
+        + "ReadTimeout: Read timed out."
+    ) in lines
+    assert "Failed to submit 50 crashes in 1 groups." in lines
+
+    # The group that timed out might have been accepted, but it's recorded as
+    # failed; the other group is recorded as accepted
+    ledger = ledger_path.read_text().splitlines()
+    assert sorted(ledger) == sorted(
+        [f"{crash_id}\taccepted" for crash_id in crash_ids[:50]]
+        + [f"{crash_id}\tfailed" for crash_id in crash_ids[50:]]
+    )
+
+
+@responses.activate
+def test_reprocess_ledger(tmp_path):
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+    crash_id_3 = "e58ec5aa-4ea1-4a2b-8b0b-2b5490220512"
+    ledger_path = tmp_path / "ledger.log"
+
+    # crash_id_1 was accepted in a previous run and crash_id_2 failed
+    ledger_path.write_text(f"{crash_id_1}\taccepted\n{crash_id_2}\tfailed\n")
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=[f"--ledger={ledger_path}", crash_id_1, crash_id_2, crash_id_3],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
+        Ledger: 1 crash ids already submitted; 2 left.
+        Reprocessing 2 crashes sleeping 1 seconds between groups...
+        Rough estimate: 0:00:00
+        Processing group ending with e58ec5aa-4ea1-4a2b-8b0b-2b5490220512 ... (1/1)
+        Done!
+        """
+    )
+    assert parse_qs(responses.calls[0].request.body) == {
+        "crash_ids": [crash_id_2, crash_id_3]
+    }
+    assert ledger_path.read_text() == (
+        f"{crash_id_1}\taccepted\n"
+        + f"{crash_id_2}\tfailed\n"
+        + f"{crash_id_2}\taccepted\n"
+        + f"{crash_id_3}\taccepted\n"
+    )
+
+
+def test_reprocess_list_failed(tmp_path):
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+    crash_id_3 = "e58ec5aa-4ea1-4a2b-8b0b-2b5490220512"
+    ledger_path = tmp_path / "ledger.log"
+
+    # crash_id_1 failed and then got accepted on a later run
+    ledger_path.write_text(
+        f"{crash_id_1}\tfailed\n"
+        + f"{crash_id_3}\tfailed\n"
+        + f"{crash_id_2}\taccepted\n"
+        + f"{crash_id_1}\taccepted\n"
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=[f"--ledger={ledger_path}", "--list-failed"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == f"{crash_id_3}\n"
+
+
+def test_batch_sizer():
+    sizer = cmd_reprocess.BatchSizer(start=50, max_size=1000)
+    # Latency is the same no matter the size, so bigger is better
+    for size in [50, 100, 200]:
+        assert sizer.size == size
+        for _ in range(sizer.SAMPLES):
+            sizer.record(size, latency=0.5)
+    assert sizer.size == 400
+
+    # The server rejects 400, so the size is halved and capped
+    sizer.too_big(400)
+    assert sizer.size == 200
+    assert sizer.max_size == 200
+
+    for _ in range(sizer.SAMPLES):
+        sizer.record(200, latency=0.5)
+    assert sizer.settled
+    assert sizer.size == 200
+
+
+def test_batch_sizer_settles_on_best():
+    sizer = cmd_reprocess.BatchSizer(start=50, max_size=1000)
+    for _ in range(sizer.SAMPLES):
+        sizer.record(50, latency=0.5)
+    # Doubling the size more than doubles the latency, so it's worse
+    for _ in range(sizer.SAMPLES):
+        sizer.record(100, latency=2.0)
+    assert sizer.settled
+    assert sizer.size == 50
+
+
+@responses.activate
+def test_reprocess_chunk_size():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [create_new_ooid() for i in range(5)]
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--chunk-size=2", "--sleep=0"] + crash_ids,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        f"""\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
+        Reprocessing 5 crashes sleeping 0 seconds between groups...
+        Rough estimate: 0:00:01
+        Processing group ending with {crash_ids[1]} ... (1/3)
+        Processing group ending with {crash_ids[3]} ... (2/3)
+        Processing group ending with {crash_ids[4]} ... (3/3)
+        Done!
+        """
+    )
+    assert [
+        len(parse_qs(call.request.body)["crash_ids"]) for call in responses.calls
+    ] == [2, 2, 1]
+
+
+@responses.activate
+def test_reprocess_chunk_size_auto_splits_rejected_groups():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [create_new_ooid() for i in range(50)]
+
+    def reprocessing_callback(request):
+        # Pretend the server only takes 20 crash ids at a time
+        if len(parse_qs(request.body)["crash_ids"]) > 20:
+            return (413, {}, "too many crash ids")
+        return (200, {}, "")
+
+    responses.add_callback(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        callback=reprocessing_callback,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--chunk-size=auto", "--sleep=0"] + crash_ids,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "200",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines()[-4:] == [
+        f"Got back HTTP 413; splitting group ending with {crash_ids[-1]} into "
+        + "groups of 25",
+        f"Got back HTTP 413; splitting group ending with {crash_ids[24]} into "
+        + "groups of 12",
+        f"Got back HTTP 413; splitting group ending with {crash_ids[-1]} into "
+        + "groups of 12",
+        "Done!",
+    ]
+    # Groups get split until they're small enough
+    assert [
+        len(parse_qs(call.request.body)["crash_ids"]) for call in responses.calls
+    ] == [50, 25, 12, 12, 1, 25, 12, 12, 1]
+
+
+@responses.activate
+def test_reprocess_chunk_size_auto_bad_request():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [create_new_ooid() for i in range(100)]
+    bad_crash_id = crash_ids[10]
+
+    def reprocessing_callback(request):
+        # Any group with the bad crash id gets a 400
+        if bad_crash_id in parse_qs(request.body)["crash_ids"]:
+            return (400, {}, "invalid crash id")
+        return (200, {}, "")
+
+    responses.add_callback(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        callback=reprocessing_callback,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--chunk-size=auto", "--sleep=0"] + crash_ids,
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "200",
+        },
+    )
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert (
+        f"Got back HTTP 400; splitting group ending with {crash_ids[49]} in half "
+        + "to see if it's too big"
+    ) in lines
+    assert "Failed to submit 25 crashes in 1 groups." in lines
+    # The half with the bad crash id gets a 400, too, so it isn't split again
+    # and the group size doesn't shrink
+    assert [
+        len(parse_qs(call.request.body)["crash_ids"]) for call in responses.calls
+    ] == [50, 25, 25, 50]
+
+
+def test_reprocess_chunk_size_invalid():
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--chunk-size=lots", "abc"],
+        env={
+            "CRASHSTATS_API_TOKEN": "935e136cdfe14b83abae0e0cd97b634f",
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 2
+    assert 'chunk-size needs to be a positive integer or "auto"' in result.output
+
+
+@responses.activate
+def test_reprocess_from_supersearch():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_ids = [
+        "ecf15793-caa9-4af8-94b5-90c810220624",
+        "ae692700-2230-411e-95d0-3feaf0220624",
+    ]
+    # The total is fetched first
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "product": "Firefox",
+                    "release_channel": "nightly",
+                    "_columns": "uuid",
+                    "_sort": "-date",
+                    "_results_number": "0",
+                    "_facets_size": "0",
+                }
+            )
+        ],
+        status=200,
+        json={"hits": [], "total": 2, "facets": {}, "errors": []},
+    )
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "product": "Firefox",
+                    "release_channel": "nightly",
+                    "_columns": "uuid",
+                    "_sort": "-date",
+                    "_results_offset": "0",
+                    "_results_number": "1000",
+                    "_facets_size": "0",
+                }
+            )
+        ],
+        status=200,
+        json={
+            "hits": [{"uuid": crash_id} for crash_id in crash_ids],
+            "total": 2,
+            "facets": {},
+            "errors": [],
+        },
+    )
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=[
+            "--supersearch-url=https://crash-stats.mozilla.org/search/?product=Firefox",
+            "--release_channel=nightly",
+        ],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        Using API token: 935exxxxxxxxxxxxxxxxxxxxxxxxxxxx
+        Sending reprocessing requests to: https://crash-stats.mozilla.org/api/Reprocessing/
+        Super Search matched 2 crash reports.
+        Reprocessing 2 crashes sleeping 1 seconds between groups...
+        Rough estimate: 0:00:00
+        Processing group ending with ae692700-2230-411e-95d0-3feaf0220624 ... (1/1)
+        Done!
+        """
+    )
+    assert parse_qs(responses.calls[2].request.body) == {"crash_ids": crash_ids}
+
+
+@responses.activate
+def test_reprocess_from_supersearch_tenthousand():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        status=200,
+        json={"hits": [], "total": 10_001, "facets": {}, "errors": []},
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=[
+            "--supersearch-url=https://crash-stats.mozilla.org/search/?product=Firefox",
+        ],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 1
+    assert "Use --allow-many argument to reprocess." in result.output
+    # Only the total was fetched
+    assert len(responses.calls) == 1
+
+
+def test_reprocess_search_args_without_supersearch_url():
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--product=Firefox"],
+        env={
+            "CRASHSTATS_API_TOKEN": "935e136cdfe14b83abae0e0cd97b634f",
+            "COLUMNS": "100",
+        },
+    )
+    assert result.exit_code == 2
+    assert "Super Search arguments require --supersearch-url." in result.output
+
+
+@responses.activate
+def test_submit_group_submitted_at():
+    posted_at = []
+
+    def reprocessing_callback(request):
+        posted_at.append(datetime.datetime.now(datetime.timezone.utc))
+        return (200, {}, "")
+
+    responses.add_callback(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        callback=reprocessing_callback,
+    )
+    group = ["2ac9a763-83d2-4dca-89bb-091bd0220630"]
+    [result] = cmd_reprocess.submit_group(
+        DEFAULT_HOST + "/api/Reprocessing/",
+        group,
+        api_token="935e136cdfe14b83abae0e0cd97b634f",
+        session=session_with_retries(),
+    )
+    assert result["group"] == group
+    # The timestamp is taken before the request is sent, not when the result
+    # is handled
+    assert result["submitted_at"] <= posted_at[0]
+
+
+@responses.activate
+def test_reprocess_wait():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_id_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+    crash_id_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+    # crash_id_1 is reprocessed right away
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/ProcessedCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"crash_id": crash_id_1, "format": "meta"}
+            )
+        ],
+        status=200,
+        json={"uuid": crash_id_1, "completed_datetime": "2099-01-01T00:00:00Z"},
+    )
+    # crash_id_2 hasn't been reprocessed the first time it's checked
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/ProcessedCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"crash_id": crash_id_2, "format": "meta"}
+            )
+        ],
+        status=200,
+        json={"uuid": crash_id_2, "completed_datetime": "2022-05-12T00:00:00Z"},
+    )
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/ProcessedCrash/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {"crash_id": crash_id_2, "format": "meta"}
+            )
+        ],
+        status=200,
+        json={
+            "uuid": crash_id_2,
+            "completed_datetime": "2099-01-01 00:00:00.000000+00:00",
+        },
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--wait", "--wait-interval=0", crash_id_1, crash_id_2],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "200",
+        },
+    )
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[-4] == "Waiting for 2 sampled crashes to be reprocessed..."
+    assert re.match(
+        r"Reprocessed 1/2 sampled crashes \(50\.0%\), about [\d,.]+ crashes/s, "
+        + r"estimated time left: \d+:\d\d:\d\d",
+        lines[-3],
+    )
+    assert re.match(
+        r"Reprocessed 2/2 sampled crashes \(100\.0%\), about [\d,.]+ crashes/s, "
+        + r"estimated time left: 0:00:00",
+        lines[-2],
+    )
+    assert lines[-1] == "Done!"
+
+
+@responses.activate
+def test_reprocess_wait_timeout():
+    api_token = "935e136cdfe14b83abae0e0cd97b634f"
+    crash_id = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+
+    responses.add(
+        responses.POST,
+        DEFAULT_HOST + "/api/Reprocessing/",
+        status=200,
+    )
+    # The processed crash is never updated
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/ProcessedCrash/",
+        status=200,
+        json={"uuid": crash_id, "completed_datetime": "2022-06-30T00:00:00+00:00"},
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli=cmd_reprocess.reprocess,
+        args=["--wait", "--wait-interval=1", "--wait-timeout=1", crash_id],
+        env={
+            "CRASHSTATS_API_TOKEN": api_token,
+            "COLUMNS": "200",
+        },
+    )
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert lines[-2] == (
+        "Reprocessed 0/1 sampled crashes (0.0%), about 0.0 crashes/s, "
+        + "estimated time left: unknown"
+    )
+    assert lines[-1] == "Timed out waiting for crashes to be reprocessed."
@@ -2,6 +2,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import json
 from textwrap import dedent
 
 from click.testing import CliRunner
@@ -641,7 +642,165 @@ def test_supersearch_url():
     ],
 )
 def test_flatten_facets(data, expected):
-    assert cmd_supersearchfacet.flatten_facets(data) == expected
+    flattened = cmd_supersearchfacet.flatten_facets(data)
+    # Histograms are HistogramTable instances, so convert those to records
+    for key, value in flattened.items():
+        if key.startswith("histogram"):
+            flattened[key] = {
+                field_name: table.to_records() for field_name, table in value.items()
+            }
+    assert flattened == expected
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        ([5, 10, 2.5], cmd_supersearchfacet.COLUMN_NUMERIC),
+        (["2024-04-06", "2024-04-07", "total"], cmd_supersearchfacet.COLUMN_DATE),
+        (["Firefox", "2024-04-06"], cmd_supersearchfacet.COLUMN_TEXT),
+        (["Firefox", 5], cmd_supersearchfacet.COLUMN_TEXT),
+    ],
+)
+def test_detect_column_type(values, expected):
+    assert cmd_supersearchfacet.detect_column_type(values) == expected
+
+
+@pytest.mark.parametrize(
+    "value, column_type, expected",
+    [
+        (5, cmd_supersearchfacet.COLUMN_NUMERIC, "5"),
+        ("2024-04-06", cmd_supersearchfacet.COLUMN_DATE, "2024-04-06 **"),
+        ("2024-04-08", cmd_supersearchfacet.COLUMN_DATE, "2024-04-08"),
+        ("total", cmd_supersearchfacet.COLUMN_DATE, "total"),
+        ("2024-04-06", cmd_supersearchfacet.COLUMN_TEXT, "2024-04-06"),
+        ("2024-04-06", None, "2024-04-06 **"),
+        ("Fire\x00fox", cmd_supersearchfacet.COLUMN_TEXT, "Firefox"),
+    ],
+)
+def test_fix_value(value, column_type, expected):
+    assert (
+        cmd_supersearchfacet.fix_value(
+            value, denote_weekends=True, column_type=column_type
+        )
+        == expected
+    )
+
+
+def test_iter_facet_records_three_levels():
+    term_counts = [
+        {
+            "term": "Firefox",
+            "count": 3,
+            "facets": {
+                "release_channel": [
+                    {
+                        "term": "beta",
+                        "count": 3,
+                        "facets": {
+                            "platform": [
+                                {"term": "Windows NT", "count": 2},
+                                {"term": "Linux", "count": 1},
+                            ]
+                        },
+                    },
+                ],
+            },
+        },
+        {
+            "term": "Fenix",
+            "count": 1,
+            "facets": {
+                "release_channel": [
+                    {
+                        "term": "release",
+                        "count": 1,
+                        "facets": {"platform": [{"term": "Android", "count": 1}]},
+                    },
+                ],
+            },
+        },
+    ]
+    key = "product / release_channel / platform"
+    assert list(cmd_supersearchfacet.iter_facet_records("product", term_counts)) == [
+        (key, {key: "Firefox / beta / Windows NT", "count": 2}),
+        (key, {key: "Firefox / beta / Linux", "count": 1}),
+        (key, {key: "Fenix / release / Android", "count": 1}),
+    ]
+
+
+def test_convert_histogram_data_fills_missing_terms():
+    facet_data = [
+        {
+            "term": "2024-04-02T00:00:00+00:00",
+            "count": 5,
+            "facets": {
+                "product": [{"term": "Firefox", "count": 5}],
+                "cardinality_version": {"value": 2},
+            },
+        },
+        {
+            "term": "2024-04-01T00:00:00+00:00",
+            "count": 7,
+            "facets": {
+                "product": [
+                    {"term": "Fenix", "count": 3},
+                    {"term": "Firefox", "count": 4},
+                ],
+                "cardinality_version": {"value": 3},
+            },
+        },
+    ]
+    tables = cmd_supersearchfacet.convert_histogram_data("histogram_date", facet_data)
+    records = {field_name: table.to_records() for field_name, table in tables.items()}
+    assert records == {
+        "product": [
+            {"histogram_date": "2024-04-01", "Fenix": 3, "Firefox": 4, "total": 7},
+            {"histogram_date": "2024-04-02", "Fenix": 0, "Firefox": 5, "total": 5},
+        ],
+        "cardinality_version": [
+            {"histogram_date": "2024-04-01", "value": 3},
+            {"histogram_date": "2024-04-02", "value": 2},
+        ],
+    }
+    # Columns are in sorted order with total last
+    assert list(records["product"][1].keys()) == [
+        "histogram_date",
+        "Fenix",
+        "Firefox",
+        "total",
+    ]
+
+
+def test_histogram_table_add_leftover():
+    table = cmd_supersearchfacet.HistogramTable(
+        "histogram_date", ["2024-04-01", "2024-04-02"]
+    )
+    table.add_column("Firefox", [4, 5])
+    table.add_column("Fenix", [3, 0])
+    table.add_column("total", [10, 5])
+    table.add_leftover()
+    assert table.to_records() == [
+        {
+            "histogram_date": "2024-04-01",
+            "--": 3,
+            "Fenix": 3,
+            "Firefox": 4,
+            "total": 10,
+        },
+        {
+            "histogram_date": "2024-04-02",
+            "--": 0,
+            "Fenix": 0,
+            "Firefox": 5,
+            "total": 5,
+        },
+    ]
+
+    # Cardinality tables have no total, so there's no leftover
+    table = cmd_supersearchfacet.HistogramTable("histogram_date", ["2024-04-01"])
+    table.add_column("value", [3])
+    table.add_leftover()
+    assert table.to_records() == [{"histogram_date": "2024-04-01", "value": 3}]
 
 
 @freezegun.freeze_time("2022-07-01 12:00:00")
@@ -1061,6 +1220,675 @@ def test_histogram_date_product_with_leftover():
     )
 
 
+def test_split_date_range():
+    assert cmd_supersearchfacet.split_date_range(
+        "2022-06-24 00:00:00", "2022-07-01 23:59:59", 3
+    ) == [
+        ("2022-06-24 00:00:00", "2022-06-26 00:00:00"),
+        ("2022-06-26 00:00:00", "2022-06-29 00:00:00"),
+        ("2022-06-29 00:00:00", "2022-07-01 23:59:59"),
+    ]
+    # There are never more slices than days
+    assert cmd_supersearchfacet.split_date_range(
+        "2022-06-30 00:00:00", "2022-06-30 23:59:59", 5
+    ) == [("2022-06-30 00:00:00", "2022-06-30 23:59:59")]
+
+
+def test_merge_facets():
+    facets_list = [
+        {
+            "product": [
+                {
+                    "term": "Firefox",
+                    "count": 5,
+                    "facets": {"cardinality_version": {"value": 2}},
+                },
+                {
+                    "term": "Fenix",
+                    "count": 4,
+                    "facets": {"cardinality_version": {"value": 1}},
+                },
+            ],
+            "histogram_date": [
+                {
+                    "term": "2022-06-25T00:00:00+00:00",
+                    "count": 9,
+                    "facets": {"product": [{"term": "Firefox", "count": 9}]},
+                },
+            ],
+        },
+        {
+            "product": [
+                {
+                    "term": "Fenix",
+                    "count": 6,
+                    "facets": {"cardinality_version": {"value": 2}},
+                },
+            ],
+            "histogram_date": [
+                {
+                    "term": "2022-06-24T00:00:00+00:00",
+                    "count": 6,
+                    "facets": {"product": [{"term": "Fenix", "count": 6}]},
+                },
+            ],
+        },
+    ]
+    facets, approximate = cmd_supersearchfacet.merge_facets(facets_list)
+    assert facets == {
+        "product": [
+            {
+                "term": "Fenix",
+                "count": 10,
+                "facets": {"cardinality_version": {"value": 3}},
+            },
+            {
+                "term": "Firefox",
+                "count": 5,
+                "facets": {"cardinality_version": {"value": 2}},
+            },
+        ],
+        "histogram_date": [
+            {
+                "term": "2022-06-24T00:00:00+00:00",
+                "count": 6,
+                "facets": {"product": [{"term": "Fenix", "count": 6}]},
+            },
+            {
+                "term": "2022-06-25T00:00:00+00:00",
+                "count": 9,
+                "facets": {"product": [{"term": "Firefox", "count": 9}]},
+            },
+        ],
+    }
+    # The Fenix version cardinality was summed, so it's approximate; no slice
+    # returned a full list of terms, so term counts are exact
+    assert approximate == {"cardinality"}
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_slices():
+    for start, end, data in [
+        (
+            "2022-06-24 00:00:00",
+            "2022-06-28 00:00:00",
+            [("2022-06-27T00:00:00+00:00", {"Firefox": 5, "Fenix": 4})],
+        ),
+        (
+            "2022-06-28 00:00:00",
+            "2022-07-01 23:59:59",
+            [("2022-06-28T00:00:00+00:00", {"Firefox": 3})],
+        ),
+    ]:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/SuperSearch/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "_histogram.date": "product",
+                        "date": [f">={start}", f"<{end}"],
+                        "_results_number": "0",
+                    }
+                ),
+            ],
+            status=200,
+            json={
+                "hits": [],
+                "total": sum(sum(counts.values()) for _, counts in data),
+                "facets": {
+                    "histogram_date": [
+                        {
+                            "term": term,
+                            "count": sum(counts.values()),
+                            "facets": {
+                                "product": [
+                                    {"term": product, "count": count}
+                                    for product, count in counts.items()
+                                ]
+                            },
+                        }
+                        for term, counts in data
+                    ],
+                    # Super Search adds a full signature facet by default
+                    "signature": [{"term": f"sig{i}", "count": 1} for i in range(50)],
+                },
+                "errors": [],
+            },
+        )
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_histogram.date=product", "--format=tab", "--slices=2"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        histogram_date.product
+        histogram_date\tFenix\tFirefox\ttotal
+        2022-06-27\t4\t5\t9
+        2022-06-28\t0\t3\t3
+        """
+    )
+    # The default signature facet is dropped, so it isn't flagged as approximate
+    assert result.stderr == ""
+
+
+def test_merge_facets_truncates_and_keeps_order():
+    facets_list = [
+        {
+            "product": [
+                {"term": "t1", "count": 5},
+                {"term": "t3", "count": 1},
+            ]
+        },
+        {
+            "product": [
+                {"term": "t2", "count": 4},
+                {"term": "t1", "count": 0},
+                {"term": "t4", "count": 1},
+            ]
+        },
+        {"product": [{"term": "t2", "count": 1}, {"term": "t5", "count": 1}]},
+    ]
+    facets, approximate = cmd_supersearchfacet.merge_facets(facets_list, facets_size=2)
+    # t1 and t2 tie, so they're in the order they first appear
+    assert facets == {
+        "product": [{"term": "t1", "count": 5}, {"term": "t2", "count": 5}]
+    }
+    # Slices returned full lists of terms, so other terms might have been left
+    # out of them
+    assert approximate == {"terms"}
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_slices_facets_size():
+    def facet_callback(request):
+        start = request.params["date"][0][2:12]
+        terms = {
+            "2022-06-24": [("t1", 3), ("t2", 2)],
+            "2022-06-28": [("t3", 4), ("t2", 1)],
+        }[start]
+        payload = {
+            "hits": [],
+            "total": sum(count for _, count in terms),
+            "facets": {
+                "product": [{"term": term, "count": count} for term, count in terms]
+            },
+            "errors": [],
+        }
+        return (200, {}, json.dumps(payload))
+
+    responses.add_callback(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        callback=facet_callback,
+    )
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_facets=product", "--_facets_size=2", "--format=tab", "--slices=2"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        product
+        product\tcount
+        t3\t4
+        t1\t3
+        total\t10
+        """
+    )
+    assert "term counts can be undercounts" in result.stderr
+
+
+def test_slices_with_date():
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_facets=product", "--date=>=2022-06-24", "--slices=2"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 2
+    assert (
+        "--slices and --cache-dir can't be used with a date parameter" in result.stderr
+    )
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_cache_dir(tmp_path):
+    queried = []
+
+    def facet_callback(request):
+        start = request.params["date"][0][2:12]
+        queried.append(start)
+        payload = {
+            "hits": [],
+            "total": 5,
+            "facets": {"product": [{"term": "Firefox", "count": 5}]},
+            "errors": [],
+        }
+        return (200, {}, json.dumps(payload))
+
+    responses.add_callback(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        callback=facet_callback,
+    )
+
+    args = [
+        "--_facets=product",
+        "--format=tab",
+        "--relative-range=2d",
+        f"--cache-dir={tmp_path}",
+        "--cache-horizon=1d",
+    ]
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        product
+        product\tcount
+        Firefox\t15
+        total\t15
+        """
+    )
+    assert result.stderr == "Cache: 0 days from cache, 3 days queried.\n"
+    assert sorted(queried) == ["2022-06-29", "2022-06-30", "2022-07-01"]
+
+    # 2022-06-29 ended before the horizon, so it comes from the cache this time
+    queried.clear()
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=args,
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert "Firefox\t15" in result.output
+    assert result.stderr == "Cache: 1 days from cache, 2 days queried.\n"
+    assert sorted(queried) == ["2022-06-30", "2022-07-01"]
+
+
+def test_load_batch(tmp_path):
+    path = tmp_path / "queries.toml"
+    path.write_text(
+        dedent(
+            """\
+            [queries.firefox]
+            product = "Firefox"
+
+            [queries.fenix-beta]
+            product = "Fenix"
+            release_channel = "beta"
+            _facets = ["version", "platform"]
+            _facets_size = 10
+            is_garbage_collecting = true
+            """
+        )
+    )
+    assert cmd_supersearchfacet.load_batch(str(path)) == {
+        "firefox": {"product": ["Firefox"]},
+        "fenix-beta": {
+            "product": ["Fenix"],
+            "release_channel": ["beta"],
+            "_facets": ["version", "platform"],
+            "_facets_size": ["10"],
+            "is_garbage_collecting": ["true"],
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "text, error",
+    [
+        ("", "has no queries"),
+        ('[queries."../firefox"]\nproduct = "Firefox"\n', "not a valid query name"),
+        ("[queries]\nfirefox = 5\n", "is not a table"),
+        (
+            "[queries.firefox]\ndate = 2022-06-24\n",
+            "field 'date' has a date value",
+        ),
+        (
+            "[queries.firefox]\nproduct = {name = 'Firefox'}\n",
+            "field 'product' has a dict value",
+        ),
+    ],
+)
+def test_load_batch_invalid(tmp_path, text, error):
+    path = tmp_path / "queries.toml"
+    path.write_text(text)
+    with pytest.raises(ValueError, match=error):
+        cmd_supersearchfacet.load_batch(str(path))
+
+
+def add_batch_responses():
+    for product, count in [("Firefox", 5), ("Fenix", 4)]:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/SuperSearch/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "_facets": "version",
+                        "product": product,
+                        "date": [">=2022-06-24 00:00:00", "<2022-07-01 23:59:59"],
+                        "_results_number": "0",
+                    }
+                ),
+            ],
+            status=200,
+            json={
+                "hits": [],
+                "total": count,
+                "facets": {"version": [{"term": "100.0", "count": count}]},
+                "errors": [],
+            },
+        )
+
+
+BATCH_TOML = """\
+[queries.firefox]
+product = "Firefox"
+
+[queries.fenix]
+product = "Fenix"
+"""
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_batch(tmp_path):
+    add_batch_responses()
+    path = tmp_path / "queries.toml"
+    path.write_text(BATCH_TOML)
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_facets=version", "--format=tab", f"--batch={path}"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        == firefox ==
+        version
+        version\tcount
+        100.0\t5
+        total\t5
+
+        == fenix ==
+        version
+        version\tcount
+        100.0\t4
+        total\t4
+        """
+    )
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_batch_output_dir(tmp_path):
+    add_batch_responses()
+    path = tmp_path / "queries.toml"
+    path.write_text(BATCH_TOML)
+    output_dir = tmp_path / "reports"
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=[
+            "--_facets=version",
+            "--format=csv",
+            f"--batch={path}",
+            f"--output-dir={output_dir}",
+        ],
+        env={"COLUMNS": "200"},
+    )
+    assert result.exit_code == 0
+    assert result.output == (
+        f"firefox: wrote {output_dir / 'firefox.csv'}\n"
+        + f"fenix: wrote {output_dir / 'fenix.csv'}\n"
+    )
+    assert (output_dir / "fenix.csv").read_text() == dedent(
+        """\
+        version
+        version,count
+        100.0,4
+        total,4
+        """
+    )
+
+
+def test_compare_records():
+    records = [
+        {"product": "Firefox", "count": 10},
+        {"product": "Fenix", "count": 4},
+        {"product": "total", "count": 14},
+    ]
+    other_records = [
+        {"product": "Firefox", "count": 5},
+        {"product": "Thunderbird", "count": 2},
+        {"product": "total", "count": 7},
+    ]
+    assert cmd_supersearchfacet.compare_records("product", records, other_records) == [
+        {
+            "product": "Firefox",
+            "count": 10,
+            "compare_count": 5,
+            "delta": 5,
+            "ratio": 2.0,
+        },
+        {"product": "Fenix", "count": 4, "compare_count": 0, "delta": 4, "ratio": "-"},
+        {
+            "product": "Thunderbird",
+            "count": 0,
+            "compare_count": 2,
+            "delta": -2,
+            "ratio": 0.0,
+        },
+        {"product": "total", "count": 14, "compare_count": 7, "delta": 7, "ratio": 2.0},
+    ]
+
+
+def test_compare_records_truncated():
+    # Both queries returned a full list of terms, so the counts for terms that
+    # aren't in the other query's list are unknown
+    records = [
+        {"product": "Firefox", "count": 10},
+        {"product": "Fenix", "count": 4},
+        {"product": "total", "count": 20},
+    ]
+    other_records = [
+        {"product": "Firefox", "count": 5},
+        {"product": "Thunderbird", "count": 3},
+        {"product": "total", "count": 12},
+    ]
+    assert cmd_supersearchfacet.compare_records(
+        "product", records, other_records, facets_size=2, other_facets_size=2
+    ) == [
+        {
+            "product": "Firefox",
+            "count": 10,
+            "compare_count": 5,
+            "delta": 5,
+            "ratio": 2.0,
+        },
+        {
+            "product": "Fenix",
+            "count": 4,
+            "compare_count": "<=3",
+            "delta": "",
+            "ratio": "",
+        },
+        {
+            "product": "Thunderbird",
+            "count": "<=4",
+            "compare_count": 3,
+            "delta": "",
+            "ratio": "",
+        },
+        {
+            "product": "total",
+            "count": 20,
+            "compare_count": 12,
+            "delta": 8,
+            "ratio": 1.67,
+        },
+    ]
+
+    # The smallest count isn't a bound for nested terms
+    records = [
+        {"product / version": "Firefox / 100.0", "count": 10},
+        {"product / version": "Firefox / 99.0", "count": 2},
+    ]
+    other_records = [
+        {"product / version": "Firefox / 100.0", "count": 10},
+        {"product / version": "Fenix / 100.0", "count": 8},
+    ]
+    assert cmd_supersearchfacet.compare_records(
+        "product / version", records, other_records, facets_size=2, other_facets_size=2
+    )[1:] == [
+        {
+            "product / version": "Firefox / 99.0",
+            "count": 2,
+            "compare_count": "?",
+            "delta": "",
+            "ratio": "",
+        },
+        {
+            "product / version": "Fenix / 100.0",
+            "count": "?",
+            "compare_count": 8,
+            "delta": "",
+            "ratio": "",
+        },
+    ]
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_compare_with_offset():
+    for date, facets in [
+        (
+            [">=2022-06-24 00:00:00", "<2022-07-01 23:59:59"],
+            [{"term": "Firefox", "count": 10}, {"term": "Fenix", "count": 4}],
+        ),
+        (
+            [">=2022-06-17 00:00:00", "<2022-06-24 23:59:59"],
+            [{"term": "Firefox", "count": 5}, {"term": "Thunderbird", "count": 2}],
+        ),
+    ]:
+        responses.add(
+            responses.GET,
+            DEFAULT_HOST + "/api/SuperSearch/",
+            match=[
+                responses.matchers.query_param_matcher(
+                    {"_facets": "product", "date": date, "_results_number": "0"}
+                ),
+            ],
+            status=200,
+            json={
+                "hits": [],
+                "total": sum(facet["count"] for facet in facets),
+                "facets": {"product": facets},
+                "errors": [],
+            },
+        )
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_facets=product", "--format=tab", "--compare-with=1w"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == dedent(
+        """\
+        product
+        product\tcount\tcompare_count\tdelta\tratio
+        Firefox\t10\t5\t5\t2.0
+        Fenix\t4\t0\t4\t-
+        Thunderbird\t0\t2\t-2\t0.0
+        total\t14\t7\t7\t2.0
+        """
+    )
+
+
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_raw_drops_default_signature_facet():
+    supersearch_data = {
+        "hits": [],
+        "total": 9,
+        "facets": {
+            "product": [
+                {
+                    "term": "Firefox",
+                    "count": 9,
+                    "facets": {"version": [{"term": "100.0", "count": 9}]},
+                }
+            ],
+            "signature": [{"term": "OOM | small", "count": 9}],
+        },
+        "errors": [],
+    }
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        status=200,
+        json=supersearch_data,
+    )
+
+    runner = CliRunner(mix_stderr=False)
+    for args in [
+        ["--_aggs.product=version", "--format=raw"],
+        ["--_aggs.product=version", "--format=raw", "--compact"],
+    ]:
+        result = runner.invoke(
+            cli=cmd_supersearchfacet.supersearchfacet,
+            args=args,
+            env={"COLUMNS": "100"},
+        )
+        assert result.exit_code == 0
+        payload = json.loads(result.output)
+        assert list(payload["facets"].keys()) == ["product"]
+
+    # --compare-with prints both payloads for raw and drops it from both
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_aggs.product=version", "--format=raw", "--compare-with=1w"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    payloads = json.loads(result.output)
+    assert list(payloads["query"]["facets"].keys()) == ["product"]
+    assert list(payloads["compare"]["facets"].keys()) == ["product"]
+
+
+def test_compare_with_histogram():
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_histogram.date=product", "--compare-with=1w"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 2
+    assert "--compare-with doesn't support histograms." in result.stderr
+
+
 @freezegun.freeze_time("2022-07-01 12:00:00")
 @responses.activate
 def test_table():
@@ -1269,6 +2097,74 @@ def test_json():
     )
 
 
+@freezegun.freeze_time("2022-07-01 12:00:00")
+@responses.activate
+def test_compact_json_and_output(tmp_path):
+    supersearch_data = {
+        "hits": [],
+        "total": 19,
+        "facets": {
+            "product": [
+                {"term": "Firefox", "count": 5},
+                {"term": "Fenix", "count": 4},
+            ]
+        },
+        "errors": [],
+    }
+
+    responses.add(
+        responses.GET,
+        DEFAULT_HOST + "/api/SuperSearch/",
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    "_facets": "product",
+                    "date": [">=2022-06-24 00:00:00", "<2022-07-01 23:59:59"],
+                    "_results_number": "0",
+                }
+            ),
+        ],
+        status=200,
+        json=supersearch_data,
+    )
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_facets=product", "--format=json", "--compact"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == (
+        '{"product":[{"product":"Firefox","count":5},'
+        + '{"product":"Fenix","count":4},{"product":"total","count":19}]}\n'
+    )
+
+    output = tmp_path / "facets.json"
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=["--_facets=product", "--format=raw", "--compact", f"--output={output}"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.output == ""
+    assert json.loads(output.read_text()) == supersearch_data
+
+
+def test_output_with_batch(tmp_path):
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_supersearchfacet.supersearchfacet,
+        args=[
+            "--_facets=product",
+            f"--batch={tmp_path / 'queries.toml'}",
+            f"--output={tmp_path / 'out.txt'}",
+        ],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 2
+    assert "--output can't be used with --batch" in result.stderr
+
+
 @freezegun.freeze_time("2024-10-15 13:02:00")
 @responses.activate
 def test_return_query():
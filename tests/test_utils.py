@@ -5,19 +5,33 @@
 import datetime
 import inspect
 import operator
+import pathlib
 
 import pytest
 
 from crashstats_tools.utils import (
+    CrashIdSet,
     escape_pipes,
     escape_whitespace,
+    imap_bounded,
+    in_shard,
     INFINITY,
+    InvalidArg,
     is_crash_id_valid,
+    iter_lines,
+    Journal,
     parse_args,
     parse_crash_id,
     parse_relative_date,
+    parse_shard,
+    parse_size,
+    parse_supersearch_options,
+    prefetch,
+    sort_in_windows,
     tableize_markdown,
     tableize_tab,
+    TokenBucket,
+    write_atomically,
 )
 
 
@@ -77,6 +91,43 @@ def test_parse_args(args, expected):
     assert parse_args(args) == expected
 
 
+def test_parse_supersearch_options():
+    params, num_results, args = parse_supersearch_options(
+        "https://crash-stats.mozilla.org/search/?product=Firefox&_facets=signature",
+        "all",
+        ("crashdata", "--version=120.0"),
+    )
+    assert params == {
+        "product": ["Firefox"],
+        "version": ["120.0"],
+        "_columns": ["uuid"],
+        "_facets_size": 0,
+        "_sort": ["-date"],
+    }
+    assert num_results == INFINITY
+    assert args == ["crashdata"]
+
+    # Without a Super Search url, there are no params
+    assert parse_supersearch_options("", "100", ("crashdata",)) == (
+        None,
+        None,
+        ["crashdata"],
+    )
+
+
+@pytest.mark.parametrize(
+    "supersearch_url, num, args, error",
+    [
+        ("", "100", ("--product=Firefox",), "require --supersearch-url"),
+        ("https://example.com/?product=Firefox", "lots", (), "num needs to be"),
+        ("https://example.com/?product=Firefox", "100", ("--product",), "no value"),
+    ],
+)
+def test_parse_supersearch_options_invalid(supersearch_url, num, args, error):
+    with pytest.raises(InvalidArg, match=error):
+        parse_supersearch_options(supersearch_url, num, args)
+
+
 @pytest.mark.parametrize(
     "item, expected",
     [
@@ -252,3 +303,190 @@ def test_parse_relative_date(text, expected):
             parse_relative_date(text)
     else:
         assert parse_relative_date(text) == expected
+
+
+def test_crash_id_set():
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    crash_ids = CrashIdSet([crash_id])
+    assert crash_id in crash_ids
+    assert "00000000-0000-0000-0000-000000000000" not in crash_ids
+    assert len(crash_ids) == 1
+
+    crash_ids.add(crash_id)
+    assert len(crash_ids) == 1
+    assert list(crash_ids) == [crash_id]
+
+
+def test_journal(tmp_path):
+    crash_id_1 = "de1bb258-cbbf-4589-a673-34f800160918"
+    crash_id_2 = "00000000-0000-0000-0000-000000000000"
+    path = tmp_path / "journal.log"
+
+    journal = Journal(str(path))
+    journal.add(crash_id_1, ["raw_crash", "dumps"])
+    journal.add(crash_id_2, ["raw_crash"])
+    journal.close()
+
+    # Simulate a process killed mid-write
+    with open(path, "a") as fp:
+        fp.write(f"{crash_id_2}\tdu")
+
+    journal = Journal(str(path))
+    assert journal.has(crash_id_1, "raw_crash")
+    assert journal.has(crash_id_1, "dumps")
+    assert journal.has(crash_id_2, "raw_crash")
+    assert not journal.has(crash_id_2, "dumps")
+    assert journal.count("raw_crash") == 2
+
+    # The partial line is terminated so new records are intact
+    journal.add(crash_id_2, ["dumps"])
+    journal.close()
+    assert Journal(str(path)).has(crash_id_2, "dumps")
+
+
+def test_journal_add_many(tmp_path):
+    crash_id_1 = "de1bb258-cbbf-4589-a673-34f800160918"
+    crash_id_2 = "00000000-0000-0000-0000-000000000000"
+    path = tmp_path / "journal.log"
+
+    journal = Journal(str(path))
+    journal.add_many([crash_id_1, crash_id_2], "accepted")
+    assert journal.count("accepted") == 2
+    journal.close()
+
+    assert path.read_text() == f"{crash_id_1}\taccepted\n{crash_id_2}\taccepted\n"
+
+
+def test_write_atomically(tmp_path):
+    fn = str(tmp_path / "raw_crash" / "20220630" / "abc")
+    write_atomically(fn, b"abcde", fsync=True)
+    assert pathlib.Path(fn).read_bytes() == b"abcde"
+
+    # The temp file was renamed, so it's the only thing in the directory
+    assert [path.name for path in pathlib.Path(fn).parent.iterdir()] == ["abc"]
+
+
+def test_write_atomically_error_leaves_nothing(tmp_path):
+    fn = str(tmp_path / "abc")
+    with pytest.raises(TypeError):
+        # Writing a str to a binary file raises an error part-way through
+        write_atomically(fn, "abcde")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_iter_lines():
+    assert list(iter_lines(["a", " b ", ""])) == ["a", "b"]
+    assert list(iter_lines([], ["a\n", "\n", "b\n"])) == ["a", "b"]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_imap_bounded(workers):
+    pulled = []
+
+    def generate_items():
+        for i in range(20):
+            pulled.append(i)
+            yield i
+
+    results = imap_bounded(lambda x: x * 2, generate_items(), workers=workers)
+
+    # Nothing is pulled from the iterable until results are asked for
+    assert pulled == []
+
+    # Items are pulled lazily, so only a bounded number have been pulled after
+    # the first result
+    first = next(results)
+    assert len(pulled) <= workers * 2 + 1
+
+    assert sorted([first] + list(results)) == [i * 2 for i in range(20)]
+
+
+def test_prefetch():
+    assert list(prefetch(iter(range(10)), maxsize=2)) == list(range(10))
+
+
+def test_prefetch_error():
+    def generate_items():
+        yield 1
+        raise ValueError("bad thing")
+
+    items = prefetch(generate_items(), maxsize=2)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="bad thing"):
+        next(items)
+
+
+@pytest.mark.parametrize(
+    "window, expected",
+    [
+        (0, [5, 3, 4, 1, 2]),
+        (1, [5, 3, 4, 1, 2]),
+        (2, [3, 5, 1, 4, 2]),
+        (10, [1, 2, 3, 4, 5]),
+    ],
+)
+def test_sort_in_windows(window, expected):
+    assert list(sort_in_windows([5, 3, 4, 1, 2], window)) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("1/1", (1, 1)),
+        ("1/4", (1, 4)),
+        ("4/4", (4, 4)),
+    ],
+)
+def test_parse_shard(text, expected):
+    assert parse_shard(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "1", "0/4", "5/4", "a/b", "1/2/3"])
+def test_parse_shard_invalid(text):
+    with pytest.raises(ValueError):
+        parse_shard(text)
+
+
+def test_in_shard():
+    crash_ids = [f"00000000-0000-0000-0000-{i:06d}220630" for i in range(100)]
+    assert all(in_shard(crash_id, None) for crash_id in crash_ids)
+
+    # Every crash id is in exactly one shard
+    shards = [(k, 4) for k in range(1, 5)]
+    for crash_id in crash_ids:
+        assert sum(in_shard(crash_id, shard) for shard in shards) == 1
+
+    # Shards are reasonably balanced
+    for shard in shards:
+        assert 10 < sum(in_shard(crash_id, shard) for crash_id in crash_ids) < 40
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("0", 0),
+        ("1000", 1000),
+        ("5K", 5 * 1024),
+        ("5kb", 5 * 1024),
+        ("1.5M", int(1.5 * 1024 * 1024)),
+        ("2G", 2 * 1024 * 1024 * 1024),
+    ],
+)
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "abc", "5X", "-5"])
+def test_parse_size_invalid(text):
+    with pytest.raises(ValueError):
+        parse_size(text)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1000)
+    # The bucket starts full
+    assert bucket.consume(1000, wait=False) == 0
+    # Consuming more puts it in debt
+    assert bucket.consume(500, wait=False) == pytest.approx(0.5, abs=0.05)
+    assert bucket.consume(500, wait=False) == pytest.approx(1.0, abs=0.05)
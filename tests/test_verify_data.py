@@ -0,0 +1,87 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import pathlib
+
+from click.testing import CliRunner
+
+from crashstats_tools import cmd_verify_data
+
+
+CRASH_ID_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+CRASH_ID_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+CRASH_ID_3 = "e58ec5aa-4ea1-4a2b-8b0b-2b5490220512"
+
+
+def save_raw_crash(outputdir, crash_id):
+    path = pathlib.Path(outputdir) / "raw_crash" / f"20{crash_id[-6:]}"
+    path.mkdir(parents=True, exist_ok=True)
+    (path / crash_id).write_text(json.dumps({"ProductName": "Firefox"}))
+
+
+def test_it_runs():
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_verify_data.verify_data,
+        args=["--help"],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+
+
+def test_all_complete(tmpdir):
+    save_raw_crash(tmpdir, CRASH_ID_1)
+    save_raw_crash(tmpdir, CRASH_ID_2)
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_verify_data.verify_data,
+        args=[str(tmpdir)],
+        input=f"{CRASH_ID_1}\n{CRASH_ID_2}\n",
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 0
+    assert result.stdout == ""
+    assert result.stderr == (
+        "Checked 2 crash ids: 2 complete, 0 missing data, 0 not valid.\n"
+    )
+
+
+def test_missing_with_journals(tmpdir):
+    # CRASH_ID_1 is on disk, CRASH_ID_2 is in a shard's journal, and
+    # CRASH_ID_3 is nowhere
+    save_raw_crash(tmpdir, CRASH_ID_1)
+    journal_path = tmpdir / "shard2.log"
+    journal_path.write(f"{CRASH_ID_2}\traw_crash\n")
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_verify_data.verify_data,
+        args=[f"--journal={journal_path}", str(tmpdir)],
+        input=f"{CRASH_ID_1}\n{CRASH_ID_2}\n{CRASH_ID_3}\nfoo\n",
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 1
+    assert result.stdout == f"{CRASH_ID_3}\n"
+    assert result.stderr == (
+        "foo: not a valid crash id\n"
+        + "Checked 3 crash ids: 2 complete, 1 missing data, 1 not valid.\n"
+    )
+
+
+def test_missing_dumps(tmpdir):
+    save_raw_crash(tmpdir, CRASH_ID_1)
+    dump_names_path = pathlib.Path(tmpdir) / "dump_names"
+    dump_names_path.mkdir()
+    (dump_names_path / CRASH_ID_1).write_text(json.dumps(["upload_file_minidump"]))
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli=cmd_verify_data.verify_data,
+        args=["--dumps", str(tmpdir), CRASH_ID_1],
+        env={"COLUMNS": "100"},
+    )
+    assert result.exit_code == 1
+    assert result.stdout == f"{CRASH_ID_1}\n"
@@ -0,0 +1,68 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from crashstats_tools.workqueue import WorkQueue
+
+
+CRASH_ID_1 = "2ac9a763-83d2-4dca-89bb-091bd0220630"
+CRASH_ID_2 = "b4f58e9f-49be-4ba5-a203-8ef160220512"
+CRASH_ID_3 = "e58ec5aa-4ea1-4a2b-8b0b-2b5490220512"
+
+
+def test_enqueue_and_claim(tmpdir):
+    queue = WorkQueue(str(tmpdir / "queue.db"))
+    assert queue.enqueue([CRASH_ID_1, CRASH_ID_2]) == 2
+    # Adding crash ids already in the queue is a no-op
+    assert queue.enqueue([CRASH_ID_2, CRASH_ID_3]) == 1
+
+    assert queue.claim(2) == [CRASH_ID_1, CRASH_ID_2]
+    # Leased crash ids aren't claimable by another process
+    other = WorkQueue(str(tmpdir / "queue.db"))
+    assert other.claim(10) == [CRASH_ID_3]
+    assert other.claim(10) == []
+
+    queue.complete(CRASH_ID_1)
+    assert queue.counts() == {"pending": 0, "leased": 2, "done": 1, "failed": 0}
+
+
+def test_lease_expires(tmpdir):
+    queue = WorkQueue(str(tmpdir / "queue.db"), lease_seconds=-1)
+    queue.enqueue([CRASH_ID_1])
+    assert queue.claim(10) == [CRASH_ID_1]
+
+    # The lease has already expired, so another process can claim it
+    other = WorkQueue(str(tmpdir / "queue.db"))
+    assert other.claim(10) == [CRASH_ID_1]
+
+
+def test_lease_expires_max_attempts(tmpdir):
+    queue = WorkQueue(str(tmpdir / "queue.db"), lease_seconds=-1, max_attempts=2)
+    queue.enqueue([CRASH_ID_1])
+    assert queue.claim(10) == [CRASH_ID_1]
+    assert queue.claim(10) == [CRASH_ID_1]
+
+    # The lease expired on the last attempt, so it's failed rather than
+    # reclaimed again
+    assert queue.claim(10) == []
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+
+
+def test_fail_retries(tmpdir):
+    queue = WorkQueue(str(tmpdir / "queue.db"), max_attempts=2)
+    queue.enqueue([CRASH_ID_1])
+
+    assert queue.claim(10) == [CRASH_ID_1]
+    queue.fail(CRASH_ID_1, "HTTPError: 500")
+    assert queue.counts()["pending"] == 1
+
+    assert queue.claim(10) == [CRASH_ID_1]
+    queue.fail(CRASH_ID_1, "HTTPError: 500")
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+    assert queue.claim(10) == []
+
+
+def test_iter_claims(tmpdir):
+    queue = WorkQueue(str(tmpdir / "queue.db"))
+    queue.enqueue([CRASH_ID_1, CRASH_ID_2, CRASH_ID_3])
+    assert list(queue.iter_claims(batch_size=2)) == [CRASH_ID_1, CRASH_ID_2, CRASH_ID_3]